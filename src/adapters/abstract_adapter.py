@@ -1,25 +1,57 @@
-from utils.time_utils import TimeUtils
-
-
 class AbstractAdapter(object):
-    """AbstractAdapter to build adapters in order to retrieve observation from a WebService or a website API."""
+    """
+    AbstractAdapter to build adapters in order to retrieve observation from a WebService or a website API.
+    Polling adapters share the AdapterRuntime of the process (pooled sessions, HTTP cache, deduplication of
+    identical requests) and one rate limit per rate_limit_key (e.g., per API key).
+    """
+
+    # Push-based adapters (e.g., message queues) publish observations as they arrive, from their own thread,
+    # instead of being polled by the sensor (see start_consuming)
+    PUSH_BASED = False
 
-    def __init__(self, max_call_by_minute, timeout, nb_max_retries):
-        self.first_call_timestamp_window = None
-        self.counter_calls = 0
+    def __init__(self, max_call_by_minute, timeout, nb_max_retries, config=None):
         self.max_call_by_minute = max_call_by_minute
         self.timeout = timeout
         self.nb_max_retries = nb_max_retries
+        self.config = config
+        self._runtime = None
+        self._token_bucket = None
+
+    @property
+    def runtime(self):
+        """ The AdapterRuntime of the process, imported on first use (push-based adapters do not need requests) """
+        if self._runtime is None:
+            from adapters.adapter_runtime import AdapterRuntime
+            self._runtime = AdapterRuntime.get_shared_runtime(self.config)
+        return self._runtime
+
+    def rate_limit_key(self):
+        """
+        :returns the key of the rate limit shared by all the adapters calling the same API with the same credentials
+        :rtype str
+        """
+        return type(self).__name__
+
+    @property
+    def token_bucket(self):
+        if self._token_bucket is None:
+            self._token_bucket = self.runtime.get_token_bucket(self.rate_limit_key(), self.max_call_by_minute)
+        return self._token_bucket
 
     def is_a_call_possible(self):
-        if self.counter_calls + 1 < self.max_call_by_minute:
-            return True
-        elif TimeUtils.current_milli_time() - self.first_call_timestamp_window > 60000:
-            self.first_call_timestamp_window = None
-            self.counter_calls = 0
-            return True
-        else:
-            return False
+        """
+        :returns True (and count the call) if the rate limit of the adapter allows a call now, False otherwise
+        :rtype bool
+        """
+        return self.token_bucket.try_acquire()
+
+    def query_url(self, url):
+        """
+        Poll the specified URL through the shared runtime, within the rate limit of the adapter
+        :returns the parsed JSON response (possibly a cached one), or None if unavailable
+        """
+        return self.runtime.fetch(url, token_bucket=self.token_bucket, timeout=self.timeout,
+                                  nb_max_retries=self.nb_max_retries)
 
     # Asynchronous adapters (e.g., RabbitMQ)
 
@@ -29,6 +61,12 @@ class AbstractAdapter(object):
     def pull_endpoint(self):
         raise NotImplementedError("Should have implemented this")
 
+    def start_consuming(self, sensor):
+        raise NotImplementedError("Should have implemented this")
+
+    def stop_consuming(self):
+        raise NotImplementedError("Should have implemented this")
+
     # Synchronous adapters
 
     def query_endpoint(self):
@@ -0,0 +1,231 @@
+import email.utils
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class TokenBucket(object):
+    """
+    Token bucket rate limiter: at most 'capacity' calls at once, refilled at 'rate' calls per second.
+    With capacity = max_call_by_minute and rate = max_call_by_minute / 60, at most max_call_by_minute calls are
+    made over any minute, as with the former per-instance call counter of AbstractAdapter.
+    """
+
+    def __init__(self, capacity, rate):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self.tokens = float(capacity)
+        self.last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """
+        :returns True (and consume a token) if a call is possible now, False otherwise
+        :rtype bool
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            return False
+
+
+class CachedResponse(object):
+    """ Last parsed response of an URL, with its HTTP validators and freshness """
+
+    __slots__ = ['json', 'etag', 'last_modified', 'expires_at']
+
+    def __init__(self, json, etag, last_modified, expires_at):
+        self.json = json
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at  # time.monotonic() until which the response can be reused without a request
+
+
+class AdapterRuntime(object):
+    """
+    Runtime shared by all the polling adapters of a process (see get_shared_runtime):
+    -one pooled keep-alive session per host
+    -token bucket rate limits shared by all the adapters using the same rate limit key (e.g., the same API key)
+    -an HTTP cache of the parsed responses: responses are reused without any request while they are fresh
+    (Cache-Control max-age/Expires, and at least 'adapter_min_refresh_interval' seconds), then revalidated with
+    If-None-Match/If-Modified-Since (a 304 response refreshes the cached one)
+    -deduplication of identical in-flight requests: sensors asking for the same URL at the same time share one request
+    -concurrent polling: requests run in a pool of 'adapter_nb_workers' threads (see fetch_async)
+    As a result, polling the same upstream URL costs one request per refresh interval, whatever the number of sensors.
+    """
+
+    _shared_runtime = None
+    _shared_runtime_lock = threading.Lock()
+
+    def __init__(self, config=None):
+        config = config or dict()
+        self.pool_size = int(config.get('adapter_pool_size', 10))
+        self.nb_workers = int(config.get('adapter_nb_workers', 8))
+        self.min_refresh_interval = float(config.get('adapter_min_refresh_interval', 1.0))
+        self._sessions = dict()  # one session per scheme + host
+        self._buckets = dict()  # rate limit key -> TokenBucket
+        self._cache = dict()  # URL -> CachedResponse
+        self._in_flight = dict()  # URL -> Future
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.nb_workers, thread_name_prefix="adapter-runtime")
+
+        # Statistics
+        self.nb_requests = 0
+        self.nb_not_modified = 0
+        self.nb_cache_hits = 0
+        self.nb_deduplicated = 0
+        self.nb_rate_limited = 0
+
+    @classmethod
+    def get_shared_runtime(cls, config=None):
+        """
+        Return the runtime of the process, creating it (with the specified configuration) if needed
+        :rtype AdapterRuntime
+        """
+        with cls._shared_runtime_lock:
+            if cls._shared_runtime is None:
+                cls._shared_runtime = cls(config)
+            return cls._shared_runtime
+
+    def get_token_bucket(self, rate_limit_key, max_call_by_minute):
+        """
+        Return the token bucket shared by all the adapters using the specified key
+        :param rate_limit_key: e.g., the API key used by the adapter (str)
+        :param max_call_by_minute: the rate limit, only used by the first adapter using this key (int)
+        :rtype TokenBucket
+        """
+        with self._lock:
+            if rate_limit_key not in self._buckets:
+                self._buckets[rate_limit_key] = TokenBucket(max_call_by_minute, max_call_by_minute / 60.0)
+            return self._buckets[rate_limit_key]
+
+    def get_session(self, url):
+        parts = urlsplit(url)
+        key = parts.scheme + '://' + parts.netloc
+        with self._lock:
+            if key not in self._sessions:
+                session = requests.Session()
+                session.mount(parts.scheme + '://', HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size))
+                self._sessions[key] = session
+            return self._sessions[key]
+
+    def get_stats(self):
+        with self._lock:
+            return {'nb_requests': self.nb_requests,
+                    'nb_not_modified': self.nb_not_modified,
+                    'nb_cache_hits': self.nb_cache_hits,
+                    'nb_deduplicated': self.nb_deduplicated,
+                    'nb_rate_limited': self.nb_rate_limited,
+                    'nb_cached_urls': len(self._cache)}
+
+    def fetch_async(self, url, token_bucket=None, timeout=None, nb_max_retries=1):
+        """
+        Poll the specified URL in the background
+        :param url: str
+        :param token_bucket: an optional TokenBucket limiting the calls to this URL
+        :param timeout: the timeout (in seconds) of each request
+        :param nb_max_retries: the maximum number of requests in case of errors
+        :returns a Future whose result is the parsed JSON response (or None if unavailable)
+        :rtype concurrent.futures.Future
+        """
+        with self._lock:
+            cached = self._cache.get(url)
+            if cached is not None and time.monotonic() < cached.expires_at:
+                self.nb_cache_hits += 1
+                future = Future()
+                future.set_result(cached.json)
+                return future
+            future = self._in_flight.get(url)
+            if future is not None:
+                self.nb_deduplicated += 1
+                return future
+            future = self._executor.submit(self._fetch, url, token_bucket, timeout, nb_max_retries)
+            self._in_flight[url] = future
+        future.add_done_callback(lambda _: self._remove_in_flight(url, future))
+        return future
+
+    def fetch(self, url, token_bucket=None, timeout=None, nb_max_retries=1):
+        """
+        Poll the specified URL (see fetch_async) and wait for its response
+        :returns the parsed JSON response, or None if unavailable
+        """
+        return self.fetch_async(url, token_bucket, timeout, nb_max_retries).result()
+
+    def _remove_in_flight(self, url, future):
+        with self._lock:
+            if self._in_flight.get(url) is future:
+                del self._in_flight[url]
+
+    def _fetch(self, url, token_bucket, timeout, nb_max_retries):
+        with self._lock:
+            cached = self._cache.get(url)
+
+        for _ in range(max(1, nb_max_retries)):
+            if token_bucket is not None and not token_bucket.try_acquire():
+                with self._lock:
+                    self.nb_rate_limited += 1
+                return cached.json if cached is not None else None  # stale response rather than nothing
+
+            headers = dict()
+            if cached is not None and cached.etag is not None:
+                headers['If-None-Match'] = cached.etag
+            if cached is not None and cached.last_modified is not None:
+                headers['If-Modified-Since'] = cached.last_modified
+            try:
+                response = self.get_session(url).get(url, headers=headers, timeout=timeout)
+            except requests.exceptions.RequestException as e:
+                logging.error("{}: Unable to query {}.".format(type(e).__name__, url))
+                continue
+            with self._lock:
+                self.nb_requests += 1
+
+            if response.status_code == requests.codes.not_modified and cached is not None:
+                with self._lock:
+                    self.nb_not_modified += 1
+                    cached.expires_at = self._expires_at(response)
+                return cached.json
+            elif response.status_code == requests.codes.ok:
+                try:
+                    json_obj = response.json()  # parsed once, then shared by every sensor polling this URL
+                except ValueError:
+                    return None
+                if 'no-store' not in response.headers.get('Cache-Control', ''):
+                    with self._lock:
+                        self._cache[url] = CachedResponse(json_obj,
+                                                          response.headers.get('ETag'),
+                                                          response.headers.get('Last-Modified'),
+                                                          self._expires_at(response))
+                return json_obj
+        return None
+
+    def _expires_at(self, response):
+        """ Freshness of a response: Cache-Control max-age (or Expires), at least min_refresh_interval seconds """
+        now = time.monotonic()
+        lifetime = 0.0
+        directives = [directive.strip() for directive in response.headers.get('Cache-Control', '').split(',')]
+        if 'no-cache' in directives:
+            return now
+        for directive in directives:
+            if directive.startswith('max-age='):
+                try:
+                    lifetime = float(directive[len('max-age='):])
+                except ValueError:
+                    pass
+                break
+        else:
+            expires = response.headers.get('Expires')
+            if expires is not None:
+                try:
+                    lifetime = email.utils.parsedate_to_datetime(expires).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    pass
+        return now + max(lifetime, self.min_refresh_interval)
@@ -1,7 +1,6 @@
-import requests
+from urllib.parse import parse_qs
 
 from adapters.abstract_adapter import AbstractAdapter
-from utils.time_utils import TimeUtils
 
 
 class OpenWeatherMapTemp(AbstractAdapter):
@@ -18,30 +17,16 @@ class OpenWeatherMapTemp(AbstractAdapter):
     NB_MAX_RETRIES = 2
 
     def __init__(self, config):
-        super().__init__(self.MAX_CALL_BY_MINUTE, self.TIMEOUT, self.NB_MAX_RETRIES)
+        super().__init__(self.MAX_CALL_BY_MINUTE, self.TIMEOUT, self.NB_MAX_RETRIES, config)
         self.OPTIONS = config['endpoint_options']
 
+    def rate_limit_key(self):
+        # The rate limit of OpenWeatherMap applies per API key
+        api_keys = parse_qs(self.OPTIONS.lstrip('?')).get('appid', [''])
+        return 'openweathermap:' + api_keys[0]
+
     def query_endpoint(self):
-        success = False
-        temp_counter = 0
-
-        while not success and temp_counter < self.NB_MAX_RETRIES:
-            if self.is_a_call_possible():
-                if self.first_call_timestamp_window is None:
-                    self.first_call_timestamp_window = TimeUtils.current_milli_time()
-                self.counter_calls += 1
-                temp_counter += 1
-
-                response = requests.get(self.URL_BASE_TO_RETRIEVE + self.OPTIONS,
-                                        timeout=self.TIMEOUT)
-
-                if response.status_code == requests.codes.ok and response.json() is not None:
-                    try:
-                        return response.json()
-                    except ValueError:
-                        return None
-            else:
-                return None
+        return self.query_url(self.URL_BASE_TO_RETRIEVE + self.OPTIONS)
 
     def extract_date_from_json(self, json):
         return int(json['dt'])
@@ -0,0 +1,88 @@
+import collections
+import threading
+import time
+
+
+class AdapterResponseCache(object):
+    """
+    Per-process cache of the observations extracted from adapter responses, shared by all the ADAPTER sensors.
+    Entries are keyed by adapter class + endpoint options, so that sensors fanning out the same feed share one call
+    to query_endpoint per 'adapter_cache_ttl' seconds. At most 'adapter_cache_max_entries' entries are kept
+    (least recently used ones are evicted first).
+    The date, value and producer are extracted once per response: when query_endpoint returns the same (cached)
+    response object again, the previous extraction is reused.
+    """
+
+    _shared_cache = None
+    _shared_cache_lock = threading.Lock()
+
+    class Entry(object):
+        __slots__ = ['json', 'observation', 'expires_at', 'lock']
+
+        def __init__(self):
+            self.json = None
+            self.observation = None  # (date, value, producer) extracted from json
+            self.expires_at = 0.0
+            self.lock = threading.Lock()  # only one sensor refreshes an entry at a time
+
+    def __init__(self, ttl=1.0, max_entries=1024):
+        self.ttl = float(ttl)
+        self.max_entries = int(max_entries)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.nb_hits = 0
+        self.nb_misses = 0
+
+    @classmethod
+    def get_shared_cache(cls, config):
+        """
+        Return the cache of the process, creating it (with the specified configuration) if needed
+        :rtype AdapterResponseCache
+        """
+        with cls._shared_cache_lock:
+            if cls._shared_cache is None:
+                cls._shared_cache = cls(config.get('adapter_cache_ttl', 1.0), config.get('adapter_cache_max_entries', 1024))
+            return cls._shared_cache
+
+    def _get_entry(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self.Entry()
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+            return entry
+
+    def get_observation(self, adapter, adapter_file):
+        """
+        Return the latest observation of the specified adapter, querying its endpoint only if the cached one expired
+        :param adapter: an instance of AbstractAdapter
+        :param adapter_file: the name of the adapter module (str)
+        :returns the date, the value (formatted with 3 decimals) and the producer of the observation, or None
+        :rtype tuple
+        """
+        entry = self._get_entry((type(adapter), adapter.OPTIONS, adapter_file))
+        with entry.lock:
+            if time.monotonic() < entry.expires_at:
+                with self._lock:
+                    self.nb_hits += 1
+                return entry.observation
+            with self._lock:
+                self.nb_misses += 1
+            json_obj = adapter.query_endpoint()
+            if json_obj is None:
+                return None
+            if json_obj is not entry.json:
+                entry.json = json_obj
+                entry.observation = ('{}'.format(adapter.extract_date_from_json(json_obj)),
+                                     str('{0:.{1}f}'.format(adapter.extract_value_from_json(json_obj), 3)),
+                                     adapter.extract_producer_from_json(json_obj, adapter_file))
+            entry.expires_at = time.monotonic() + self.ttl
+            return entry.observation
+
+    def get_stats(self):
+        with self._lock:
+            return {'nb_entries': len(self._entries), 'nb_hits': self.nb_hits, 'nb_misses': self.nb_misses}
@@ -0,0 +1,68 @@
+import socketserver
+from wsgiref.simple_server import make_server, WSGIRequestHandler, WSGIServer
+
+from bottle import run, ServerAdapter
+
+try:
+    from cheroot import wsgi as cheroot_wsgi
+except ImportError:
+    cheroot_wsgi = None
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+
+    def address_string(self):  # no reverse DNS lookups
+        return self.client_address[0]
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class ThreadedServer(ServerAdapter):
+    """
+    Bottle server adapter serving control-plane calls concurrently (Bottle's default wsgiref server handles one
+    request at a time):
+    - with cheroot installed, a pool of 'nb_threads' threads and HTTP/1.1 keep-alive (see Bottle's CherootServer)
+    - otherwise, wsgiref with one thread per connection and one request per connection (HTTP/1.0)
+    """
+
+    def run(self, app):
+        if cheroot_wsgi is not None:
+            self.srv = cheroot_wsgi.Server((self.host, self.port), app,
+                                           numthreads=int(self.options.get('nb_threads', 16)))
+            self.srv.prepare()
+            self.port = self.srv.bind_addr[1]
+            try:
+                self.srv.serve()
+            finally:
+                self.srv.stop()
+        else:
+            self.srv = make_server(self.host, self.port, app, ThreadingWSGIServer,
+                                   QuietRequestHandler if self.quiet else WSGIRequestHandler)
+            self.port = self.srv.server_port
+            self.srv.serve_forever()
+
+    def shutdown(self):
+        if cheroot_wsgi is not None:
+            self.srv.stop()
+        else:
+            self.srv.shutdown()
+            self.srv.server_close()
+
+
+def run_api_server(app, host="0.0.0.0", port=8080, server='threaded'):
+    """
+    Serve the REST API of the virtual sensors (blocking call)
+    :param app: the Bottle application
+    :param server: the server backend ('api_server' key of the etc/sensor.config file): 'threaded' (default,
+    see ThreadedServer), 'wsgiref' (Bottle's default single-threaded server) or the name of any other server
+    supported by Bottle and installed (e.g., 'cheroot', 'waitress' or 'paste')
+    """
+    if server == 'threaded':
+        server = ThreadedServer
+    run(app=app, host=host, port=port, server=server, quiet=True, reloader=False)
@@ -0,0 +1,130 @@
+"""
+Benchmark of the REST API: requests per second on the GET endpoints (/<sensor_id> and /<sensor_id>/capabilities)
+for each server backend, with concurrent keep-alive clients running in a separate process
+Usage (from the src directory): python3 -m benchmarks.bench_api [NB_SENSORS] [NB_CLIENTS] [DURATION] [SERVER,...]
+e.g. python3 -m benchmarks.bench_api 100 16 5 threaded,wsgiref
+"""
+import copy
+import json
+import logging
+import random
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bottle
+import requests
+from bottle import Bottle
+
+from api_server import ThreadedServer
+from publishers.publisher_factory import create_publisher
+from scheduler import SensorScheduler
+from sensor_api import build_sensor_api
+from virtual_sensor import VirtualSensor
+
+SERVERS = {'threaded': ThreadedServer, 'wsgiref': bottle.WSGIRefServer}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100.0))]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def build_app(nb_sensors):
+    """ Configure nb_sensors sensors (registered to a scheduler which is never started: they do not sense) """
+    with open('../etc/sensor.config') as config_file:
+        config = json.load(config_file)
+    with open('../etc/capabilities.config') as capabilities_file:
+        capabilities = json.load(capabilities_file)
+    config.update({'mode': 'REST', 'publish_to': 'http://127.0.0.1:1/obs', 'obs_generation_mode': 'RANDOM'})
+
+    sensors = dict()
+    publisher = create_publisher('REST', config, "virtual-sensor-benchmark")
+    scheduler = SensorScheduler(nb_workers=1)
+    for i in range(nb_sensors):
+        sensor = VirtualSensor(sensor_id="sensor_{}".format(i))
+        sensor.set_config(enabled=True, config=copy.deepcopy(config), mode='REST',
+                          capabilities=copy.deepcopy(capabilities), publisher=publisher, scheduler=scheduler)
+        sensors[sensor.sensor_id] = sensor
+    return build_sensor_api(Bottle(), sensors), list(sensors)
+
+
+def run_clients(base_url, sensor_ids, nb_clients, duration):
+    latencies = list()
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client():
+        session = requests.Session()  # keep-alive
+        local_latencies = list()
+        local_errors = 0
+        while time.monotonic() < deadline:
+            url = base_url + random.choice(sensor_ids) + random.choice(['', '/capabilities'])
+            start = time.perf_counter()
+            try:
+                if session.get(url, timeout=5).status_code != 200:
+                    local_errors += 1
+            except requests.exceptions.RequestException:
+                local_errors += 1
+            local_latencies.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=client) for _ in range(nb_clients)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], time.monotonic() - start
+
+
+def run_benchmark(nb_sensors=100, nb_clients=16, duration=5.0, servers=('threaded', 'wsgiref')):
+    app, sensor_ids = build_app(nb_sensors)
+    results = list()
+    for server_name in servers:
+        port = free_port()
+        server = SERVERS[server_name](host='127.0.0.1', port=port)
+        server.quiet = True
+        threading.Thread(target=server.run, args=(app,), daemon=True).start()
+        time.sleep(0.2)
+
+        with ProcessPoolExecutor(max_workers=1) as client_process:  # the clients do not compete for the GIL
+            latencies, nb_errors, elapsed = client_process.submit(run_clients, 'http://127.0.0.1:{}/'.format(port),
+                                                                  sensor_ids, nb_clients, duration).result()
+        if isinstance(server, ThreadedServer):
+            server.shutdown()
+        else:
+            server.srv.shutdown()
+            server.srv.server_close()
+        latencies.sort()
+        results.append({'server': server_name,
+                        'nb_sensors': nb_sensors,
+                        'nb_clients': nb_clients,
+                        'nb_requests': len(latencies),
+                        'nb_errors': nb_errors,
+                        'requests_per_s': round(len(latencies) / elapsed, 1),
+                        'latency_ms_p50': round(1000 * percentile(latencies, 50), 3) if latencies else None,
+                        'latency_ms_p99': round(1000 * percentile(latencies, 99), 3) if latencies else None})
+    return results
+
+
+if __name__ == '__main__':
+    logging.getLogger().setLevel(logging.ERROR)
+    args = sys.argv[1:]
+    print(json.dumps(run_benchmark(nb_sensors=int(args[0]) if len(args) > 0 else 100,
+                                   nb_clients=int(args[1]) if len(args) > 1 else 16,
+                                   duration=float(args[2]) if len(args) > 2 else 5.0,
+                                   servers=args[3].split(',') if len(args) > 3 else ('threaded', 'wsgiref')),
+                     indent=2))
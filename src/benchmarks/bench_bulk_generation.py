@@ -0,0 +1,59 @@
+"""
+Benchmark of the bulk generation of observations (RANDOM and "[min,max]" modes) against the per-observation path
+Usage (from the src directory): python3 -m benchmarks.bench_bulk_generation [NB_SENSORS] [NB_OBS_PER_SENSOR]
+"""
+import json
+import sys
+import time
+
+import bulk_generator
+from bulk_generator import BulkObsGenerator
+from obs_generator import ObsGenerator
+
+
+def make_obs_generator(seed=42):
+    config = {'obs_generation_mode': '[-5,5]', 'path_obs_file': '', 'timestamp_in_milliseconds': 'false',
+              'trust': 80, 'random_seed': seed}
+    return ObsGenerator(config, dict())
+
+
+def measure(function, nb_obs):
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    return {'seconds': round(elapsed, 4), 'obs_per_s': round(nb_obs / elapsed)}
+
+
+def run_benchmark(nb_sensors=1000, nb_obs_per_sensor=1000):
+    nb_obs = nb_sensors * nb_obs_per_sensor
+    obs_generator = make_obs_generator()
+    generator = BulkObsGenerator(seed=42)
+    for i in range(nb_sensors):
+        generator.add_obs_generator("sensor_{}".format(i), obs_generator)
+
+    nb_single = min(nb_obs, 200000)
+    results = {
+        'nb_sensors': nb_sensors,
+        'nb_obs_per_sensor': nb_obs_per_sensor,
+        'numpy': bulk_generator.numpy is not None,
+        'one_observation_dict_json': measure(
+            lambda: [json.dumps(obs_generator.generate_one_observation("sensor_0")) for _ in range(nb_single)],
+            nb_single),
+        'bulk_values_only': measure(lambda: generator.generate_values(nb_obs_per_sensor), nb_obs),
+        'bulk_dicts': measure(lambda: generator.generate_block(nb_obs_per_sensor, period_ms=1000), nb_obs),
+        'bulk_serialized': measure(lambda: generator.serialize_block(nb_obs_per_sensor, period_ms=1000), nb_obs),
+    }
+
+    # Reproducibility check: the same seed gives the same block
+    first = BulkObsGenerator(seed=7)
+    second = BulkObsGenerator(seed=7)
+    for generator in (first, second):
+        generator.add_sensor("sensor", -1.0, 1.0)
+    results['reproducible'] = first.serialize_block(100, start_date=0) == second.serialize_block(100, start_date=0)
+    return results
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    print(json.dumps(run_benchmark(nb_sensors=int(args[0]) if len(args) > 0 else 1000,
+                                   nb_obs_per_sensor=int(args[1]) if len(args) > 1 else 1000), indent=2))
@@ -0,0 +1,223 @@
+"""
+Load benchmark of complete virtual sensors (ObsGenerator + publisher + SensorScheduler) against local sinks:
+-REST: an in-process HTTP sink (keep-alive, accepts single observations and JSON arrays)
+-KAFKA: a fake in-process KafkaProducer (replaces kafka.KafkaProducer in publishers/kafka_publisher.py)
+For every MODE x OBS-GENERATION combination and sensor count, it reports the throughput, the CPU time per
+observation (including the sink, which runs in the same process), the memory per sensor and the publish latency
+percentiles (from the 'produced' timestamp to the sink), as JSON.
+Usage (from the src directory):
+python3 -m benchmarks.bench_load [NB_SENSORS,...] [DURATION] [FREQUENCY] [MODE,...] [OBS_GENERATION,...] [OUTPUT_FILE]
+e.g. python3 -m benchmarks.bench_load 1,10,100,1000 5 0.01 REST,KAFKA FILE,RANDOM,SIGNAL results.json
+"""
+import copy
+import json
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from publishers import kafka_publisher
+from publishers.publisher_factory import create_publisher
+from scheduler import SensorScheduler
+from utils.time_utils import TimeUtils
+from virtual_sensor import VirtualSensor
+
+
+class LatencyRecorder(object):
+    """ Counts the observations received by a sink and their publish latency (in milliseconds) """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.nb_obs = 0
+        self.latencies = list()
+
+    def record(self, dictionary, now_ms):
+        produced = int(dictionary['timestamps'].split(';')[0].split(':')[-1])
+        with self._lock:
+            self.nb_obs += 1
+            self.latencies.append(now_ms - produced)
+
+    def reset(self):
+        with self._lock:
+            self.nb_obs = 0
+            self.latencies = list()
+
+
+class HttpSink(object):
+    """ In-process REST endpoint counting the observations POSTed to it """
+
+    def __init__(self, recorder):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                now_ms = TimeUtils.current_milli_time()
+                payload = json.loads(body)
+                for dictionary in payload if isinstance(payload, list) else [payload]:
+                    recorder.record(dictionary, now_ms)
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:{}/obs'.format(self.server.server_port)
+        threading.Thread(target=self.server.serve_forever, name="http-sink", daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeFuture(object):
+    """ Already completed send() result of FakeKafkaProducer """
+
+    def add_callback(self, callback):
+        callback(None)
+        return self
+
+    def add_errback(self, errback):
+        return self
+
+
+class FakeKafkaProducer(object):
+    """ In-process stand-in of kafka.KafkaProducer: serializes and records observations instead of sending them """
+
+    recorder = None
+
+    def __init__(self, value_serializer=None, **options):
+        self.value_serializer = value_serializer
+
+    def send(self, topic, value):
+        self.value_serializer(value)
+        self.recorder.record(value, TimeUtils.current_milli_time())
+        return FakeFuture()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100.0))]
+
+
+def make_config(base_config, mode, obs_generation_mode, publish_to):
+    config = copy.deepcopy(base_config)
+    config.update({'mode': mode,
+                   'publish_to': publish_to,
+                   'obs_generation_mode': obs_generation_mode,
+                   'kafka_bootstrap_server': 'localhost:9092',
+                   'path_obs_file': '../data/raw_observations.txt',
+                   'replay_engine': 'MMAP',
+                   'replay_loop': True})
+    if obs_generation_mode == 'SIGNAL' and not config.get('signal_models'):
+        config['signal_models'] = [{'type': 'sinusoidal', 'amplitude': 5, 'period': 60, 'offset': 20},
+                                   {'type': 'gaussian_noise', 'std': 0.5}]
+    return config
+
+
+def run_scenario(base_config, base_capabilities, mode, obs_generation_mode, nb_sensors, duration, frequency,
+                 recorder, sink_url, nb_workers=4):
+    """
+    Run nb_sensors sensors for duration seconds and measure what reaches the sink
+    :returns a dict of results
+    :rtype dict
+    """
+    config = make_config(base_config, mode, obs_generation_mode, sink_url if mode == 'REST' else 'benchmark')
+    capabilities = dict(base_capabilities, frequency=frequency, infinite_battery=True)
+    publisher = create_publisher(mode, config, "virtual-sensor-benchmark")
+    scheduler = SensorScheduler(nb_workers=nb_workers)
+
+    # Memory per sensor (tracemalloc slows everything down, so it is only enabled while creating the sensors)
+    tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    sensors = list()
+    for i in range(nb_sensors):
+        sensor = VirtualSensor(sensor_id="sensor_{}".format(i))
+        sensor.set_config(enabled=True, config=copy.deepcopy(config), mode=mode, capabilities=dict(capabilities),
+                          publisher=publisher, scheduler=scheduler, delay=frequency * i / nb_sensors)
+        sensors.append(sensor)
+    memory_per_sensor = (tracemalloc.get_traced_memory()[0] - memory_before) / nb_sensors
+    tracemalloc.stop()
+
+    recorder.reset()
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    scheduler.start()
+    time.sleep(duration)
+    scheduler.stop()
+    publisher.flush()
+    wall_elapsed = time.monotonic() - wall_start
+    cpu_used = time.process_time() - cpu_start
+    publisher.close()
+
+    latencies = sorted(recorder.latencies)
+    nb_obs = recorder.nb_obs
+    return {
+        'mode': mode,
+        'obs_generation_mode': obs_generation_mode,
+        'nb_sensors': nb_sensors,
+        'frequency_s': frequency,
+        'duration_s': round(wall_elapsed, 3),
+        'target_obs_per_s': round(nb_sensors / frequency, 1),
+        'nb_obs': nb_obs,
+        'obs_per_s': round(nb_obs / wall_elapsed, 1),
+        'cpu_percent': round(100.0 * cpu_used / wall_elapsed, 1),
+        'cpu_us_per_obs': round(1e6 * cpu_used / nb_obs, 2) if nb_obs else None,
+        'memory_kb_per_sensor': round(memory_per_sensor / 1024.0, 2),
+        'latency_ms_p50': percentile(latencies, 50),
+        'latency_ms_p99': percentile(latencies, 99),
+        'latency_ms_max': latencies[-1] if latencies else None,
+    }
+
+
+def run_benchmark(sensor_counts=(1, 10, 100), duration=5.0, frequency=0.01, modes=('REST', 'KAFKA'),
+                  obs_generation_modes=('FILE', 'RANDOM', 'SIGNAL')):
+    with open('../etc/sensor.config') as config_file:
+        base_config = json.load(config_file)
+    with open('../etc/capabilities.config') as capabilities_file:
+        base_capabilities = json.load(capabilities_file)
+
+    recorder = LatencyRecorder()
+    FakeKafkaProducer.recorder = recorder
+    kafka_publisher.KafkaProducer = FakeKafkaProducer
+    sink = HttpSink(recorder)
+
+    results = list()
+    try:
+        for mode in modes:
+            for obs_generation_mode in obs_generation_modes:
+                for nb_sensors in sensor_counts:
+                    results.append(run_scenario(base_config, base_capabilities, mode, obs_generation_mode,
+                                                nb_sensors, duration, frequency, recorder, sink.url))
+    finally:
+        sink.close()
+    return {'python': sys.version.split()[0],
+            'publishing_engine': base_config.get('publishing_engine', 'DIRECT'),
+            'results': results}
+
+
+if __name__ == '__main__':
+    logging.getLogger().setLevel(logging.ERROR)
+    args = sys.argv[1:]
+    report = run_benchmark(
+        sensor_counts=[int(count) for count in args[0].split(',')] if len(args) > 0 else (1, 10, 100),
+        duration=float(args[1]) if len(args) > 1 else 5.0,
+        frequency=float(args[2]) if len(args) > 2 else 0.01,
+        modes=args[3].split(',') if len(args) > 3 else ('REST', 'KAFKA'),
+        obs_generation_modes=args[4].split(',') if len(args) > 4 else ('FILE', 'RANDOM', 'SIGNAL'))
+    if len(args) > 5:
+        with open(args[5], 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+    print(json.dumps(report, indent=2))
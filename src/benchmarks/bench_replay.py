@@ -0,0 +1,67 @@
+"""
+Benchmark of the replay of (compressed) observation files: latency of generate_one_observation when the file is read
+inline (STREAM engine, plain file) and when it is decompressed and parsed by the read-ahead thread (READ_AHEAD engine)
+Sensing is simulated by calling generate_one_observation every INTERVAL seconds.
+Usage (from the src directory): python3 -m benchmarks.bench_replay [NB_OBS] [INTERVAL]
+"""
+import bz2
+import gzip
+import json
+import lzma
+import os
+import sys
+import tempfile
+import time
+
+from obs_generator import ObsGenerator
+
+
+def write_obs_files(directory, nb_obs):
+    lines = "".join("{} {:.3f}\n".format(1392246000 + i, (i % 1000) / 10.0) for i in range(nb_obs))
+    paths = {'plain': os.path.join(directory, 'obs.txt'),
+             'gzip': os.path.join(directory, 'obs.txt.gz'),
+             'xz': os.path.join(directory, 'obs.txt.xz'),
+             'bzip2': os.path.join(directory, 'obs.txt.bz2')}
+    with open(paths['plain'], 'w') as obs_file:
+        obs_file.write(lines)
+    for compression, module in (('gzip', gzip), ('xz', lzma), ('bzip2', bz2)):
+        with module.open(paths[compression], 'wt') as obs_file:
+            obs_file.write(lines)
+    return paths
+
+
+def measure(path_obs_file, replay_engine, nb_obs, interval):
+    config = {'obs_generation_mode': 'FILE', 'path_obs_file': path_obs_file, 'timestamp_in_milliseconds': 'false',
+              'trust': 100, 'replay_engine': replay_engine}
+    obs_generator = ObsGenerator(config, dict())
+    latencies = list()
+    for _ in range(nb_obs):
+        start = time.perf_counter()
+        obs_generator.generate_one_observation("sensor_0")
+        latencies.append(time.perf_counter() - start)
+        if interval > 0.0:
+            time.sleep(interval)
+    latencies.sort()
+    state = obs_generator.get_replay_position() if obs_generator.obs_reader is not None else None
+    return {'replay_engine': obs_generator.replay_engine,
+            'mean_us': round(sum(latencies) / len(latencies) * 1e6, 2),
+            'p99_us': round(latencies[int(len(latencies) * 0.99)] * 1e6, 2),
+            'max_us': round(latencies[-1] * 1e6, 2),
+            'nb_stalls': state['nb_stalls'] if state is not None else None}
+
+
+def run_benchmark(nb_obs=100000, interval=0.0):
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_obs_files(directory, nb_obs)
+        results = {'nb_obs': nb_obs, 'interval_s': interval,
+                   'plain_stream': measure(paths['plain'], 'STREAM', nb_obs, interval),
+                   'plain_read_ahead': measure(paths['plain'], 'READ_AHEAD', nb_obs, interval)}
+        for compression in ('gzip', 'xz', 'bzip2'):
+            results[compression] = measure(paths[compression], 'STREAM', nb_obs, interval)
+    return results
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    print(json.dumps(run_benchmark(nb_obs=int(args[0]) if len(args) > 0 else 100000,
+                                   interval=float(args[1]) if len(args) > 1 else 0.0), indent=2))
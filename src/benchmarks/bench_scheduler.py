@@ -0,0 +1,103 @@
+"""
+Benchmark of the schedulers: scheduling jitter and CPU use with many sensors
+-HEAP: SensorScheduler (heap of deadlines + pool of NB_WORKERS workers)
+-FLEET: FleetScheduler (columnar fleet state, vectorized battery drain and due-sensor selection, single thread)
+Usage (from the src directory):
+python3 -m benchmarks.bench_scheduler [NB_SENSORS] [FREQUENCY] [DURATION] [NB_WORKERS] [HEAP|FLEET]
+e.g. python3 -m benchmarks.bench_scheduler 100000 10 10 4 FLEET
+"""
+import json
+import random
+import sys
+import time
+
+from scheduler import SensorScheduler
+
+
+class DummySensor(object):
+    """ A sensor which only records when it is fired """
+
+    def __init__(self, sensor_id, frequency):
+        self.sensor_id = sensor_id
+        self.capabilities = {'frequency': frequency, 'battery_level': 100.0, 'obs_consumption': 0.01,
+                             'infinite_battery': False}
+        self.calls = list()
+
+    def next_interval(self):
+        return self.capabilities['frequency']
+
+    def sense_once(self):
+        self.calls.append(time.monotonic())
+        return True
+
+    def acquire_observation(self):  # FleetScheduler
+        self.calls.append(time.monotonic())
+        return self.capabilities
+
+    def publish_observation(self, obs_dict, battery_level):
+        pass
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100.0))]
+
+
+def run_benchmark(nb_sensors=10000, frequency=1.0, duration=10.0, nb_workers=4, scheduler_type='HEAP'):
+    """
+    Schedule nb_sensors dummy sensors and measure, for every call, the deviation from its ideal deadline
+    (first call + k * frequency). A drift-free scheduler keeps this deviation bounded over time.
+    :returns a dict of results
+    :rtype dict
+    """
+    if scheduler_type == 'FLEET':
+        from fleet_state import FleetScheduler  # requires NumPy
+        scheduler = FleetScheduler(capacity=nb_sensors)
+    else:
+        scheduler = SensorScheduler(nb_workers=nb_workers)
+    sensors = [DummySensor("sensor_{}".format(i), frequency) for i in range(nb_sensors)]
+
+    scheduler.start()
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    for sensor in sensors:
+        scheduler.add_sensor(sensor, delay=random.uniform(0.0, frequency))
+    time.sleep(duration)
+    cpu_used = time.process_time() - cpu_start
+    wall_elapsed = time.monotonic() - wall_start
+    scheduler.stop()
+
+    jitters = list()
+    for sensor in sensors:
+        if sensor.calls:
+            first_call = sensor.calls[0]
+            jitters.extend(abs(call - (first_call + k * frequency)) for k, call in enumerate(sensor.calls))
+    jitters.sort()
+    nb_calls = len(jitters)
+
+    return {
+        'scheduler': scheduler_type,
+        'nb_sensors': nb_sensors,
+        'frequency_s': frequency,
+        'duration_s': round(wall_elapsed, 3),
+        'nb_workers': nb_workers,
+        'nb_calls': nb_calls,
+        'calls_per_s': round(nb_calls / wall_elapsed, 1),
+        'cpu_percent': round(100.0 * cpu_used / wall_elapsed, 1),
+        'cpu_us_per_call': round(1e6 * cpu_used / nb_calls, 2) if nb_calls else None,
+        'jitter_ms_p50': round(1000 * percentile(jitters, 50), 3),
+        'jitter_ms_p99': round(1000 * percentile(jitters, 99), 3),
+        'jitter_ms_max': round(1000 * jitters[-1], 3) if jitters else 0.0,
+        'scheduler_mean_lag_ms': round(1000 * scheduler.total_lag / scheduler.nb_fired, 3) if scheduler.nb_fired else None,
+        'scheduler_max_lag_ms': round(1000 * scheduler.max_lag, 3),
+    }
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    print(json.dumps(run_benchmark(nb_sensors=int(args[0]) if len(args) > 0 else 10000,
+                                   frequency=float(args[1]) if len(args) > 1 else 1.0,
+                                   duration=float(args[2]) if len(args) > 2 else 10.0,
+                                   nb_workers=int(args[3]) if len(args) > 3 else 4,
+                                   scheduler_type=args[4] if len(args) > 4 else 'HEAP'), indent=2))
@@ -0,0 +1,62 @@
+"""
+Benchmark of the serialization of observations (json.dumps against pre-rendered templates and the binary format)
+Usage (from the src directory): python3 -m benchmarks.bench_serialization [NB_OBS]
+"""
+import json
+import sys
+import time
+
+from utils.obs_serializer import ObsSerializer
+
+
+def make_observations(nb_obs):
+    return [{'date': '{}'.format(1491464114463 + i),
+             'value': '%.3f' % (i % 100 / 3.0),
+             'producer': 'sensor02',
+             'timestamps': 'produced:{}'.format(1491464114463 + i)} for i in range(nb_obs)]
+
+
+def measure(function, nb_obs):
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    return {'seconds': round(elapsed, 4), 'obs_per_s': round(nb_obs / elapsed)}
+
+
+def run_benchmark(nb_obs=200000):
+    observations = make_observations(nb_obs)
+    serializer = ObsSerializer()
+    rows = [(int(obs['date']), float(obs['value']), int(obs['date'])) for obs in observations]
+
+    def dict_then_json_dumps():
+        for i in range(nb_obs):
+            date = '{}'.format(1491464114463 + i)
+            json.dumps({'date': date, 'value': '%.3f' % 1.5, 'producer': 'sensor02',
+                        'timestamps': 'produced:' + date}).encode('utf-8')
+
+    def template_from_fields():
+        for i in range(nb_obs):
+            date = '{}'.format(1491464114463 + i)
+            serializer.encode(date, 1.5, 'sensor02', 'produced:' + date)
+
+    results = {
+        'nb_obs': nb_obs,
+        'dict_then_json_dumps': measure(dict_then_json_dumps, nb_obs),
+        'json_dumps': measure(lambda: [json.dumps(obs).encode('utf-8') for obs in observations], nb_obs),
+        'template_dict': measure(lambda: [serializer.encode_dict(obs) for obs in observations], nb_obs),
+        'template_from_fields': measure(template_from_fields, nb_obs),
+        'json_dumps_batch': measure(lambda: json.dumps(observations).encode('utf-8'), nb_obs),
+        'template_batch': measure(lambda: serializer.encode_batch(observations), nb_obs),
+        'binary_batch': measure(lambda: serializer.encode_binary_batch('sensor02', rows), nb_obs),
+    }
+    results['sizes_bytes_per_obs'] = {
+        'json': round(len(json.dumps(observations).encode('utf-8')) / nb_obs, 1),
+        'binary': round(len(serializer.encode_binary_batch('sensor02', rows)) / nb_obs, 1)}
+    results['same_output'] = all(json.loads(serializer.encode_dict(obs)) == obs for obs in observations[:1000]) \
+        and json.loads(serializer.encode_batch(observations)) == observations
+    return results
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    print(json.dumps(run_benchmark(nb_obs=int(args[0]) if len(args) > 0 else 200000), indent=2))
@@ -0,0 +1,79 @@
+"""
+Benchmark of the SensorSupervisor: aggregate throughput of a sensor fleet sharded across 1..N worker processes.
+Sensors publish to a fake in-process KafkaProducer (see bench_load.py) in each worker, so that only the generation
+and publishing loop of the workers is measured. Throughput is computed from the merged GET /stats of the supervisor.
+Usage (from the src directory):
+python3 -m benchmarks.bench_sharding [NB_SENSORS] [DURATION] [FREQUENCY] [NB_PROCESSES,...] [SCHEDULER]
+e.g. python3 -m benchmarks.bench_sharding 10000 10 0.1 1,2,4 FLEET
+"""
+import json
+import logging
+import os
+import sys
+import time
+
+from benchmarks.bench_load import FakeKafkaProducer, LatencyRecorder
+from benchmarks.bench_api import free_port
+from supervisor import SensorSupervisor
+
+
+def use_fake_kafka_producer():
+    """ Called in each worker process before its sensors are deployed """
+    from publishers import kafka_publisher
+    FakeKafkaProducer.recorder = LatencyRecorder()
+    kafka_publisher.KafkaProducer = FakeKafkaProducer
+
+
+def run_scenario(base_config, base_capabilities, nb_sensors, duration, frequency, nb_processes, scheduler):
+    manifest = {'nb_processes': nb_processes,
+                'worker_base_port': free_port(),
+                'scheduler': scheduler,
+                'defaults': {'mode': 'KAFKA', 'publish_to': 'benchmark', 'obs_generation_mode': 'RANDOM',
+                             'kafka_bootstrap_server': 'localhost:9092'},
+                'sensors': [{'sensor_id_prefix': 'sensor_', 'count': nb_sensors,
+                             'capabilities': {'frequency': frequency, 'infinite_battery': True}}]}
+    supervisor = SensorSupervisor(manifest, base_config, base_capabilities, setup=use_fake_kafka_producer)
+    try:
+        supervisor.start()
+        time.sleep(min(2.0, duration))  # warm-up: all the sensors have fired at least once
+        stats_start = supervisor.get_stats()
+        wall_start = time.monotonic()
+        time.sleep(duration)
+        stats_end = supervisor.get_stats()
+        wall_elapsed = time.monotonic() - wall_start
+    finally:
+        supervisor.stop()
+
+    nb_obs = stats_end['published'] - stats_start['published']
+    return {'nb_processes': nb_processes,
+            'scheduler': scheduler,
+            'nb_sensors': nb_sensors,
+            'frequency_s': frequency,
+            'target_obs_per_s': round(nb_sensors / frequency, 1),
+            'nb_obs': nb_obs,
+            'obs_per_s': round(nb_obs / wall_elapsed, 1),
+            'obs_per_s_per_worker': [round((end['published'] - start['published']) / wall_elapsed, 1)
+                                     for start, end in zip(stats_start['workers'], stats_end['workers'])]}
+
+
+def run_benchmark(nb_sensors=10000, duration=10.0, frequency=0.1, process_counts=(1, 2, 4), scheduler='HEAP'):
+    with open('../etc/sensor.config') as config_file:
+        base_config = json.load(config_file)
+    with open('../etc/capabilities.config') as capabilities_file:
+        base_capabilities = json.load(capabilities_file)
+    base_config['api_server'] = 'threaded'
+
+    results = [run_scenario(base_config, base_capabilities, nb_sensors, duration, frequency, nb_processes, scheduler)
+               for nb_processes in process_counts]
+    return {'python': sys.version.split()[0], 'nb_cpus': os.cpu_count(), 'results': results}
+
+
+if __name__ == '__main__':
+    logging.getLogger().setLevel(logging.ERROR)
+    args = sys.argv[1:]
+    print(json.dumps(run_benchmark(nb_sensors=int(args[0]) if len(args) > 0 else 10000,
+                                   duration=float(args[1]) if len(args) > 1 else 10.0,
+                                   frequency=float(args[2]) if len(args) > 2 else 0.1,
+                                   process_counts=[int(n) for n in args[3].split(',')] if len(args) > 3 else (1, 2, 4),
+                                   scheduler=args[4] if len(args) > 4 else 'HEAP'),
+                     indent=2))
@@ -0,0 +1,89 @@
+"""
+Benchmark of the startup of a virtual sensor container (src/main.py), for each OBS-GENERATION mode:
+-import time of main.py and the heavy modules it loads (measured in a fresh interpreter)
+-time from the start of the process to the reception of the first observation by a local REST sink
+Usage (from the src directory): python3 -m benchmarks.bench_startup [NB_RUNS] [OBS_GENERATION,...]
+e.g. python3 -m benchmarks.bench_startup 10 RANDOM,FILE,SIGNAL
+Note: main.py serves its REST API on port 8080, which should be free.
+"""
+import json
+import logging
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.bench_load import HttpSink
+
+HEAVY_MODULES = ['numpy', 'requests', 'kafka', 'pika', 'bulk_generator', 'signal_models', 'replay.obs_file_index']
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(json.dumps({'import_ms': 1000 * elapsed, 'loaded': [name for name in %r if name in sys.modules]}))
+""" % HEAVY_MODULES
+
+
+class FirstObsRecorder(object):
+    """ Recorder of HttpSink which only signals the reception of observations """
+
+    def __init__(self):
+        self.received = threading.Event()
+
+    def record(self, dictionary, now_ms):
+        self.received.set()
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2] if values else None
+
+
+def measure_import(nb_runs):
+    runs = [json.loads(subprocess.check_output([sys.executable, '-c', IMPORT_SCRIPT])) for _ in range(nb_runs)]
+    return {'import_ms_p50': round(median([run['import_ms'] for run in runs]), 1),
+            'modules_loaded_by_import': runs[0]['loaded']}
+
+
+def measure_first_observation(obs_generation_mode, nb_runs, timeout=30.0):
+    recorder = FirstObsRecorder()
+    sink = HttpSink(recorder)
+    sink.server.handle_error = lambda request, client_address: None  # connections reset by terminated sensors
+    delays = list()
+    try:
+        for _ in range(nb_runs):
+            recorder.received.clear()
+            start = time.perf_counter()
+            process = subprocess.Popen([sys.executable, 'main.py', 'bench_sensor', 'REST', sink.url, obs_generation_mode],
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                if recorder.received.wait(timeout):
+                    delays.append(time.perf_counter() - start)
+            finally:
+                process.terminate()
+                process.wait()
+    finally:
+        sink.close()
+    return {'obs_generation_mode': obs_generation_mode,
+            'nb_runs': nb_runs,
+            'nb_failures': nb_runs - len(delays),
+            'first_obs_ms_p50': round(1000 * median(delays), 1) if delays else None,
+            'first_obs_ms_max': round(1000 * max(delays), 1) if delays else None}
+
+
+def run_benchmark(nb_runs=10, obs_generation_modes=('RANDOM', 'FILE', 'SIGNAL')):
+    report = {'python': sys.version.split()[0]}
+    report.update(measure_import(nb_runs))
+    report['results'] = [measure_first_observation(mode, nb_runs) for mode in obs_generation_modes]
+    return report
+
+
+if __name__ == '__main__':
+    logging.getLogger().setLevel(logging.ERROR)
+    args = sys.argv[1:]
+    print(json.dumps(run_benchmark(nb_runs=int(args[0]) if len(args) > 0 else 10,
+                                   obs_generation_modes=args[1].split(',') if len(args) > 1 else ('RANDOM', 'FILE',
+                                                                                                    'SIGNAL')),
+                     indent=2))
@@ -0,0 +1,119 @@
+import json
+import random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from utils.time_utils import TimeUtils
+
+
+class BulkObsGenerator(object):
+    """
+    Bulk observation generator for the RANDOM and "[min,max]" modes.
+    Values of many sensors are drawn at once (one vectorized draw per block when NumPy is installed) over the
+    trust-adjusted bounds of each sensor (finalMin/finalMax of its ObsGenerator), then serialized by batches.
+    With a seed, the generated blocks are reproducible.
+    Optional signal models (see signal_models.py) are applied to the whole (nb_sensors x nb_obs) block at once.
+    """
+
+    # Same JSON shape as the observations of ObsGenerator.generate_one_observation
+    OBS_TEMPLATE = '{"date": "%d", "value": "%.3f", "producer": "%s", "timestamps": "produced:%d"}'
+
+    def __init__(self, seed=None, signal_models=None):
+        self.sensor_ids = list()
+        self.escaped_sensor_ids = list()  # JSON-escaped, for serialize_block
+        self.lower_bounds = list()
+        self.upper_bounds = list()
+        self.seed = seed
+        if numpy is not None:
+            self.rng = numpy.random.default_rng(seed)
+        else:
+            self.rng = random.Random(seed)
+        self._lower_array = None
+        self._upper_array = None
+        self.signal_chain = None
+        if signal_models:
+            from signal_models import SignalModelChain
+            self.signal_chain = SignalModelChain(signal_models, seed=seed)
+
+    def add_sensor(self, sensor_id, final_min, final_max):
+        """
+        Add a sensor to the generator
+        :param sensor_id: str
+        :param final_min: the trust-adjusted lower bound of the sensor (float)
+        :param final_max: the trust-adjusted upper bound of the sensor (float)
+        """
+        self.sensor_ids.append(sensor_id)
+        self.escaped_sensor_ids.append(json.dumps(sensor_id)[1:-1])
+        self.lower_bounds.append(float(final_min))
+        self.upper_bounds.append(float(final_max))
+        self._lower_array = None
+
+    def add_obs_generator(self, sensor_id, obs_generator):
+        """ Add a sensor using the bounds of its ObsGenerator (RANDOM and "[min,max]" modes only) """
+        if obs_generator.finalMin is None or obs_generator.finalMax is None:
+            raise ValueError("Bulk generation is only supported by the RANDOM and \"[min,max]\" modes")
+        self.add_sensor(sensor_id, obs_generator.finalMin, obs_generator.finalMax)
+
+    def generate_values(self, nb_obs, period_ms=0):
+        """
+        Draw nb_obs values for every sensor
+        :param nb_obs: the number of observations per sensor (int)
+        :param period_ms: the delay between two consecutive observations of a sensor (in milliseconds)
+        :returns a (nb_sensors x nb_obs) NumPy array, or a list of lists if NumPy is not installed
+        """
+        if numpy is not None:
+            if self._lower_array is None:
+                self._lower_array = numpy.asarray(self.lower_bounds)[:, None]
+                self._upper_array = numpy.asarray(self.upper_bounds)[:, None]
+            values = self.rng.uniform(self._lower_array, self._upper_array, size=(len(self.sensor_ids), nb_obs))
+            if self.signal_chain is not None:
+                values = self.signal_chain.generate_block(nb_obs, period_ms / 1000.0, base_values=values)
+            return values
+        uniform = self.rng.uniform
+        return [[uniform(low, high) for _ in range(nb_obs)]
+                for low, high in zip(self.lower_bounds, self.upper_bounds)]
+
+    def generate_block(self, nb_obs, start_date=None, period_ms=0):
+        """
+        Generate nb_obs observations for every sensor
+        :param nb_obs: the number of observations per sensor (int)
+        :param start_date: the date of the first observation (in milliseconds, current time by default)
+        :param period_ms: the delay between two consecutive observations of a sensor (in milliseconds)
+        :returns a list (one entry per sensor) of lists of observations (dict)
+        :rtype list
+        """
+        if start_date is None:
+            start_date = TimeUtils.current_milli_time()
+        values = self.generate_values(nb_obs, period_ms)
+        dates = ['{}'.format(start_date + k * period_ms) for k in range(nb_obs)]
+        block = list()
+        for sensor_id, sensor_values in zip(self.sensor_ids, values):
+            block.append([{'date': date,
+                           'value': '%.3f' % value,
+                           'producer': sensor_id,
+                           'timestamps': 'produced:' + date}
+                          for date, value in zip(dates, sensor_values.tolist() if numpy is not None else sensor_values)
+                          if value == value])  # NaN values are lost observations (dropouts signal model)
+        return block
+
+    def serialize_block(self, nb_obs, start_date=None, period_ms=0):
+        """
+        Generate nb_obs observations for every sensor and serialize them directly, without intermediate dicts
+        :returns a list (one entry per sensor) of JSON arrays of observations (bytes)
+        :rtype list
+        """
+        if start_date is None:
+            start_date = TimeUtils.current_milli_time()
+        values = self.generate_values(nb_obs, period_ms)
+        dates = [start_date + k * period_ms for k in range(nb_obs)]
+        template = self.OBS_TEMPLATE
+        serialized = list()
+        for sensor_id, sensor_values in zip(self.escaped_sensor_ids, values):
+            sensor_values = sensor_values.tolist() if numpy is not None else sensor_values
+            serialized.append(('[' + ', '.join([template % (date, value, sensor_id, date)
+                                                for date, value in zip(dates, sensor_values)
+                                                if value == value]) + ']').encode('utf-8'))
+        return serialized
@@ -0,0 +1,248 @@
+import collections
+
+from utils.time_utils import TimeUtils
+
+
+STATISTICS = ('min', 'max', 'mean', 'count')
+
+
+class EdgeStage(object):
+    """
+    Base class of the edge processing stages, which sit between the observation generator and the publisher.
+    Stages receive observations one by one and return the observations to pass to the next stage (possibly none).
+    Observations keep the schema of the generated ones: {"date", "value", "producer", "timestamps"}
+    """
+
+    def process(self, obs_dict):
+        """
+        :param obs_dict: an observation (dict)
+        :returns the observations to pass to the next stage
+        :rtype list
+        """
+        raise NotImplementedError("Should have implemented this")
+
+    def flush(self):
+        """ :returns the pending observations (e.g., the last incomplete window), when the sensor stops sensing """
+        return list()
+
+
+class WindowAggregate(EdgeStage):
+    """
+    Aggregation of the observation values over time windows of 'window' seconds (based on the observation dates),
+    one observation being published per window: its date is the end of the window and its value the selected
+    statistic ('min', 'max', 'mean' or 'count') of the values within the window.
+    Windows are tumbling (one after the other) by default, or sliding when 'slide' is lower than 'window' (a window
+    ends every 'slide' seconds). Windows are aligned on multiples of 'slide' and empty windows are not published.
+    Tumbling windows only keep running statistics, sliding windows keep the values of the last 'window' seconds.
+    """
+
+    def __init__(self, window, slide=None, statistic='mean'):
+        self.window = int(float(window) * 1000)  # in milliseconds, like the observation dates
+        self.slide = self.window if slide is None else int(float(slide) * 1000)
+        if self.window <= 0 or self.slide <= 0:
+            raise ValueError("'window' and 'slide' should be strictly positive")
+        if self.slide > self.window:
+            raise ValueError("'slide' should be lower than 'window'")
+        if statistic not in STATISTICS:
+            raise ValueError("Unknown statistic '{}', available statistics are {}".format(
+                statistic, ", ".join(STATISTICS)))
+        self.statistic = statistic
+        self.tumbling = self.slide == self.window
+        self.window_end = None
+        self.producer = None
+        self._values = collections.deque()  # (date, value) within the current sliding window
+        self._reset_running()
+
+    def _reset_running(self):
+        self._count = 0
+        self._sum = 0.0
+        self._min = None
+        self._max = None
+
+    def _aggregate(self, values):
+        if self.statistic == 'count':
+            return float(len(values))
+        if self.statistic == 'min':
+            return min(values)
+        if self.statistic == 'max':
+            return max(values)
+        return sum(values) / len(values)
+
+    def _running_aggregate(self):
+        if self.statistic == 'count':
+            return float(self._count)
+        if self.statistic == 'min':
+            return self._min
+        if self.statistic == 'max':
+            return self._max
+        return self._sum / self._count
+
+    def _make_observation(self, value):
+        return {'date': str(self.window_end),
+                'value': str('{0:.{1}f}'.format(value, 3)),
+                'producer': self.producer,
+                'timestamps': 'produced:' + str(TimeUtils.current_milli_time())}
+
+    def _close_window(self):
+        """ :returns the observation of the current window (None if it is empty) and moves to the next window """
+        observation = None
+        if self.tumbling:
+            if self._count > 0:
+                observation = self._make_observation(self._running_aggregate())
+            self._reset_running()
+        else:
+            start = self.window_end - self.window
+            values = [value for date, value in self._values if date >= start]
+            if values:
+                observation = self._make_observation(self._aggregate(values))
+            next_start = self.window_end + self.slide - self.window
+            while self._values and self._values[0][0] < next_start:
+                self._values.popleft()
+        self.window_end += self.slide
+        return observation
+
+    def process(self, obs_dict):
+        date = int(obs_dict['date'])
+        value = float(obs_dict['value'])
+        self.producer = obs_dict['producer']
+        if self.window_end is None:
+            self.window_end = (date // self.slide + 1) * self.slide
+        observations = list()
+        while date >= self.window_end:
+            if (self.tumbling and self._count == 0) or (not self.tumbling and not self._values):
+                self.window_end = (date // self.slide + 1) * self.slide  # skip the empty windows at once
+                break
+            observation = self._close_window()
+            if observation is not None:
+                observations.append(observation)
+        if self.tumbling:
+            self._count += 1
+            self._sum += value
+            self._min = value if self._min is None else min(self._min, value)
+            self._max = value if self._max is None else max(self._max, value)
+        else:
+            self._values.append((date, value))
+        return observations
+
+    def flush(self):
+        if self.window_end is None:
+            return list()
+        observation = self._close_window()
+        return [observation] if observation is not None else list()
+
+
+class Deadband(EdgeStage):
+    """
+    Report by exception: an observation is only passed when its value differs by more than 'threshold' from the
+    last passed one (the first observation is always passed).
+    With 'heartbeat' (in seconds), an observation is also passed when no observation has been passed for
+    'heartbeat' seconds (based on the observation dates), so that consumers can tell a steady sensor from a dead one.
+    """
+
+    def __init__(self, threshold, heartbeat=None):
+        self.threshold = float(threshold)
+        if self.threshold < 0.0:
+            raise ValueError("'threshold' should be positive")
+        self.heartbeat = None if heartbeat is None else int(float(heartbeat) * 1000)
+        self.last_value = None
+        self.last_date = None
+
+    def process(self, obs_dict):
+        value = float(obs_dict['value'])
+        date = int(obs_dict['date'])
+        if self.last_value is not None and abs(value - self.last_value) <= self.threshold \
+                and (self.heartbeat is None or date - self.last_date < self.heartbeat):
+            return list()
+        self.last_value = value
+        self.last_date = date
+        return [obs_dict]
+
+
+EDGE_STAGES = {
+    'tumbling': WindowAggregate,
+    'sliding': WindowAggregate,
+    'deadband': Deadband,
+}
+
+
+class EdgeProcessingChain(object):
+    """
+    Chain of edge processing stages built from the 'edge_processing' capability of a sensor, e.g.:
+    [{"type": "tumbling", "window": 60, "statistic": "mean"}, {"type": "deadband", "threshold": 0.5}]
+    or a single stage, e.g. {"type": "sliding", "window": 60, "slide": 10, "statistic": "max"}
+    Available types: tumbling (window, statistic), sliding (window, slide, statistic) and deadband
+    (threshold, heartbeat)
+    """
+
+    def __init__(self, stages_config):
+        """
+        :raises ValueError if a stage is unknown or misconfigured
+        """
+        if isinstance(stages_config, dict):
+            stages_config = [stages_config]
+        if not isinstance(stages_config, list):
+            raise ValueError("'edge_processing' should be a stage or a list of stages")
+        self.stages = list()
+        for stage_config in stages_config:
+            if not isinstance(stage_config, dict) or 'type' not in stage_config:
+                raise ValueError("Each edge processing stage should be an object with a 'type'")
+            stage_config = dict(stage_config)
+            stage_type = stage_config.pop('type')
+            if stage_type not in EDGE_STAGES:
+                raise ValueError("Unknown edge processing stage '{}'".format(stage_type))
+            if stage_type == 'sliding' and 'slide' not in stage_config:
+                raise ValueError("Sliding windows require a 'slide'")
+            if stage_type == 'tumbling' and 'slide' in stage_config:
+                raise ValueError("Tumbling windows do not accept a 'slide'")
+            try:
+                self.stages.append(EDGE_STAGES[stage_type](**stage_config))
+            except TypeError as e:
+                raise ValueError("Invalid parameters for the edge processing stage '{}': {}".format(stage_type, e))
+        self.nb_in = 0
+        self.nb_out = 0
+
+    @classmethod
+    def check_config(cls, stages_config):
+        """
+        :returns the reason why stages_config is not a valid 'edge_processing' capability (None if it is)
+        :rtype str
+        """
+        try:
+            cls(stages_config)
+        except ValueError as e:
+            return str(e)
+        return None
+
+    def process(self, obs_dict):
+        """
+        :param obs_dict: a generated observation (dict)
+        :returns the observations to publish (often none)
+        :rtype list
+        """
+        self.nb_in += 1
+        observations = [obs_dict]
+        for stage in self.stages:
+            outputs = list()
+            for observation in observations:
+                outputs.extend(stage.process(observation))
+            observations = outputs
+            if not observations:
+                return observations
+        self.nb_out += len(observations)
+        return observations
+
+    def flush(self):
+        """ :returns the pending observations of all the stages, e.g. when the sensor stops sensing """
+        observations = list()
+        for stage in self.stages:
+            outputs = list()
+            for observation in observations:
+                outputs.extend(stage.process(observation))
+            outputs.extend(stage.flush())
+            observations = outputs
+        self.nb_out += len(observations)
+        return observations
+
+    def get_stats(self):
+        return {'nb_in': self.nb_in, 'nb_out': self.nb_out,
+                'reduction': round(self.nb_in / self.nb_out, 1) if self.nb_out else None}
@@ -0,0 +1,259 @@
+import logging
+import threading
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from utils.metrics import Histogram, MetricsRegistry
+from utils.time_utils import TimeUtils
+
+
+class FleetState(object):
+    """
+    Columnar state of a fleet of sensors: one contiguous NumPy array per field, one row per sensor.
+    Battery level, battery consumption, frequency, next deadline and enabled/sensing flags of all the sensors are
+    updated by vectorized operations (one per scheduler tick) instead of sensor by sensor.
+    Rows are written by SensorCapabilities and VirtualSensor (see their bind/attach_to_fleet methods) whenever the
+    REST API modifies a sensor, so that the arrays are the source of truth for these fields.
+    """
+
+    FLOAT_COLUMNS = ('frequency', 'battery_level', 'obs_consumption', 'next_deadline')
+    BOOL_COLUMNS = ('infinite_battery', 'enabled', 'sensing', 'variable_interval')
+
+    def __init__(self, capacity=1024):
+        if numpy is None:
+            raise ImportError("The fleet state requires NumPy")
+        self._lock = threading.Lock()
+        self.size = 0
+        self.capacity = max(1, int(capacity))
+        self.columns = dict()
+        for name in self.FLOAT_COLUMNS:
+            self.columns[name] = numpy.zeros(self.capacity, dtype=numpy.float64)
+        for name in self.BOOL_COLUMNS:
+            self.columns[name] = numpy.zeros(self.capacity, dtype=bool)
+
+    def add_row(self, **values):
+        """
+        Add a sensor to the fleet
+        :param values: the initial value of some columns, e.g. frequency=5.0, sensing=True
+        :returns the index of the row of the sensor
+        :rtype int
+        """
+        with self._lock:
+            if self.size == self.capacity:
+                self.capacity *= 2
+                for name, column in self.columns.items():
+                    grown = numpy.zeros(self.capacity, dtype=column.dtype)
+                    grown[:self.size] = column[:self.size]
+                    self.columns[name] = grown
+            index = self.size
+            self.size += 1
+            for name, value in values.items():
+                self.columns[name][index] = value
+            return index
+
+    def get_value(self, index, name):
+        """ :returns the value of a column for the specified row, as a Python float or bool """
+        return self.columns[name][index].item()
+
+    def set_value(self, index, name, value):
+        with self._lock:
+            self.columns[name][index] = value
+
+    def due_rows(self, now):
+        """
+        :returns the indexes of the sensing sensors whose deadline has passed, and their deadlines
+        :rtype (numpy.ndarray, numpy.ndarray)
+        """
+        with self._lock:
+            deadlines = self.columns['next_deadline'][:self.size]
+            indexes = numpy.flatnonzero(self.columns['sensing'][:self.size] & (deadlines <= now))
+            return indexes, deadlines[indexes]
+
+    def drain(self, indexes):
+        """
+        Consume the battery needed by one observation for each specified sensor that has enough battery left
+        (or an infinite battery), like SensorCapabilities.drain
+        :param indexes: the rows of the sensors which produced an observation (numpy.ndarray)
+        :returns the new battery levels (NaN for the sensors whose battery is too low to sense)
+        :rtype numpy.ndarray
+        """
+        with self._lock:
+            battery_level = self.columns['battery_level']
+            levels = battery_level[indexes] - self.columns['obs_consumption'][indexes]
+            drained = self.columns['infinite_battery'][indexes] | (levels > 0.0)
+            battery_level[indexes[drained]] = levels[drained]
+            levels[~drained] = numpy.nan
+            return levels
+
+    def drain_one(self, index):
+        """ :returns the new battery level of the specified sensor, or None if its battery is too low to sense """
+        levels = self.drain(numpy.array([index]))
+        return None if numpy.isnan(levels[0]) else levels[0].item()
+
+    def advance(self, indexes, now):
+        """
+        Compute the next deadline of the specified sensors (drift-free, see TimeUtils.next_deadline)
+        :param indexes: the rows of the sensors which have just been fired (numpy.ndarray)
+        :param now: the current time (float, time.monotonic())
+        """
+        with self._lock:
+            frequency = self.columns['frequency'][indexes]
+            deadlines = self.columns['next_deadline'][indexes] + frequency
+            late = now - deadlines > numpy.maximum(frequency, TimeUtils.MAX_LATENESS)
+            deadlines[late] = now
+            self.columns['next_deadline'][indexes] = deadlines
+
+    def next_deadline(self):
+        """ :returns the earliest deadline of the sensing sensors (None if no sensor is sensing) """
+        with self._lock:
+            deadlines = self.columns['next_deadline'][:self.size][self.columns['sensing'][:self.size]]
+            return deadlines.min().item() if deadlines.size else None
+
+    def get_stats(self):
+        with self._lock:
+            size = self.size
+            battery_level = self.columns['battery_level'][:size]
+            finite = ~self.columns['infinite_battery'][:size]
+            return {'nb_sensors': size,
+                    'nb_enabled': int(self.columns['enabled'][:size].sum()),
+                    'nb_sensing': int(self.columns['sensing'][:size].sum()),
+                    'nb_depleted': int((finite & (battery_level - self.columns['obs_consumption'][:size] <= 0.0)).sum())}
+
+
+class FleetScheduler(object):
+    """
+    Scheduler driving a whole fleet of sensors from a single thread, on top of a FleetState.
+    On each tick, due sensors are selected, their battery drained and their next deadline computed with vectorized
+    operations. Only the generation and the publication of observations remain per sensor
+    (VirtualSensor.acquire_observation and VirtualSensor.publish_observation).
+    It has the same interface as SensorScheduler (start, stop, add_sensor) and is selected with
+    "scheduler": "FLEET" in a SensorHost manifest.
+    Sensors replaying a file with its original inter-arrival times ('replay_pacing': 'ORIGINAL') are rescheduled
+    one by one with their next_interval().
+    Ticks are at least tick_interval seconds apart, so that each vectorized pass over the fleet fires a batch of
+    sensors (sensors are fired up to tick_interval seconds after their deadline).
+    """
+
+    MAX_WAIT = 0.1  # (in seconds) also the maximum delay before a sensor which starts sensing again is fired
+
+    def __init__(self, capacity=1024, tick_interval=0.01):
+        self.fleet = FleetState(capacity)
+        self.tick_interval = float(tick_interval)
+        self.sensors = list()  # indexed by row
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._timer_thread = threading.Thread(target=self._run, name="fleet-scheduler", daemon=True)
+
+        # Scheduling statistics (lag = firing time - deadline, in seconds)
+        self.nb_fired = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self._metrics = MetricsRegistry.get_shared_registry()
+
+    def start(self):
+        self._timer_thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify()
+        if self._timer_thread.is_alive():
+            self._timer_thread.join()
+
+    def add_sensor(self, sensor, delay=0.0):
+        """
+        Add a sensor to the fleet
+        :param sensor: a VirtualSensor (or any object providing capabilities, acquire_observation(),
+        publish_observation(obs_dict, battery_level) and next_interval(), and optionally attach_to_fleet())
+        :param delay: the delay (in seconds) before its first observation
+        """
+        capabilities = sensor.capabilities
+        obs_generator = getattr(sensor, 'obs_generator', None)
+        with self._condition:
+            index = self.fleet.add_row(
+                frequency=capabilities['frequency'],
+                battery_level=capabilities.get('battery_level', 0.0),
+                obs_consumption=capabilities.get('obs_consumption', 0.0),
+                infinite_battery=capabilities.get('infinite_battery', True),
+                enabled=bool(getattr(sensor, 'enabled', True)),
+                sensing=bool(getattr(sensor, 'sensing', True)),
+                variable_interval=getattr(obs_generator, 'replay_pacing', 'FREQUENCY') == 'ORIGINAL',
+                next_deadline=time.monotonic() + delay)
+            self.sensors.append(sensor)
+            if hasattr(sensor, 'attach_to_fleet'):
+                sensor.attach_to_fleet(self.fleet, index)
+            self._condition.notify()
+
+    def nb_scheduled_sensors(self):
+        return self.fleet.size
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            tick_start = time.monotonic()
+            self.tick(tick_start)
+            next_deadline = self.fleet.next_deadline()
+            now = time.monotonic()
+            wait = self.MAX_WAIT if next_deadline is None else min(self.MAX_WAIT, next_deadline - now)
+            wait = max(wait, tick_start + self.tick_interval - now)
+            if wait > 0.0:
+                with self._condition:
+                    self._condition.wait(wait)
+
+    def tick(self, now):
+        """
+        Fire all the due sensors
+        :param now: the current time (float, time.monotonic())
+        :returns the number of sensors fired
+        :rtype int
+        """
+        fleet = self.fleet
+        indexes, deadlines = fleet.due_rows(now)
+        if not indexes.size:
+            return 0
+        sensors = self.sensors
+
+        observations = list()
+        for index in indexes.tolist():
+            try:
+                observations.append(sensors[index].acquire_observation())
+            except Exception:
+                logging.exception("Unexpected error while sensing with sensor {}".format(
+                    getattr(sensors[index], 'sensor_id', '')))
+                observations.append(None)
+
+        produced = numpy.fromiter((obs_dict is not None for obs_dict in observations), dtype=bool,
+                                  count=len(observations))
+        produced_indexes = indexes[produced]
+        levels = fleet.drain(produced_indexes).tolist()
+        for index, obs_dict, level in zip(produced_indexes.tolist(),
+                                          (obs_dict for obs_dict in observations if obs_dict is not None), levels):
+            try:
+                sensors[index].publish_observation(obs_dict, None if level != level else level)  # NaN: no battery
+            except Exception:
+                logging.exception("Unexpected error while publishing with sensor {}".format(
+                    getattr(sensors[index], 'sensor_id', '')))
+
+        fleet.advance(indexes, now)
+        variable = fleet.columns['variable_interval'][indexes]
+        for index, deadline in zip(indexes[variable].tolist(), deadlines[variable].tolist()):
+            fleet.set_value(index, 'next_deadline',
+                            TimeUtils.next_deadline(deadline, sensors[index].next_interval(), now))
+
+        lags = now - deadlines
+        self._observe_lags(lags)
+        return int(indexes.size)
+
+    def _observe_lags(self, lags):
+        histogram = Histogram()
+        buckets = numpy.searchsorted(numpy.asarray(Histogram.BUCKETS), lags, side='left')
+        histogram.counts = numpy.bincount(buckets, minlength=len(histogram.counts)).tolist()
+        histogram.count = int(lags.size)
+        histogram.sum = float(lags.sum())
+        self._metrics.merge_scheduler_lag(histogram)
+        self.nb_fired += histogram.count
+        self.total_lag += histogram.sum
+        self.max_lag = max(self.max_lag, float(lags.max()))
@@ -1,5 +1,10 @@
+import bisect
 import importlib
+import logging
+import math
 import random
+import threading
+import zlib
 
 from utils.time_utils import TimeUtils
 
@@ -9,16 +14,67 @@ class ObsGenerator(object):
     Observation generator class
     2 modes:
     -read observations from file [OK]
-    -generate them according to the etc/sensor.config file [TODO]
+    -generate them according to the etc/sensor.config file [OK]: uniformly at random (RANDOM and "[min,max]" modes)
+    and/or through a chain of signal models ('signal_models' key, see signal_models.py). In SIGNAL mode, values only
+    come from the signal models. Signal values are generated by blocks of 'signal_block_size' values.
+    Observation files are either read line by line ('replay_engine': 'STREAM') or memory-mapped and indexed
+    once ('replay_engine': 'MMAP', see replay/obs_file_index.py)
+    Compressed observation files (gzip, xz, bzip2 or zstd) and files replayed with 'replay_engine': 'READ_AHEAD' are
+    decompressed and parsed by a background thread, ahead of the sensing loop (see replay/compressed_reader.py)
+    With 'replay_loop', the replay restarts from the beginning of the file at EOF instead of stopping.
+    The MMAP replay engine can also seek to a given line or original timestamp (see seek_replay) and reproduce the
+    original inter-arrival times of the file ('replay_pacing': 'ORIGINAL'), scaled by 'replay_speed' (see next_interval)
+    In DATASET mode, the observations are the rows of the sensor ('dataset_sensor_id', the sensor id by default) in a
+    multi-sensor dataset file read once for all the sensors of the process (see replay/dataset_demux.py)
     """
-    def __init__(self, config, capabilities):
+    def __init__(self, config, capabilities, sensor_id=None):
         self.config = config
         self.obs_generation_mode = self.config['obs_generation_mode']  # provided from file or generated
         self.path_obs_file = self.config['path_obs_file']  # location of the raw data file
         self.timestamp_in_milliseconds = self.config['timestamp_in_milliseconds']
         self.trust = float(self.config['trust'])/100
 
+        self.replay_engine = self.config.get('replay_engine', 'STREAM')
+        self.raw_obs_file = None
+        self.obs_file_index = None
+        self.obs_reader = None  # READ_AHEAD replay engine
+        self.last_replay_timestamp = None  # timestamp of the last replayed observation (READ_AHEAD and DATASET)
+        self.replay_position = 0  # index of the next observation to replay (MMAP replay engine)
+        self.replay_loop = self.config.get('replay_loop', False)
+        self.replay_lock = threading.Lock()
+        self.replay_pacing = self.config.get('replay_pacing', 'FREQUENCY')
+        self.replay_speed = self.config.get('replay_speed', 1)
+        if self.replay_speed != "MAX":
+            try:
+                self.replay_speed = float(self.replay_speed)
+            except (TypeError, ValueError):
+                self.replay_speed = None
+            if self.replay_speed is None or not math.isfinite(self.replay_speed) or self.replay_speed <= 0:
+                logging.error("Invalid 'replay_speed': {} (\"MAX\" or a number > 0 expected), using 1 "
+                              "instead".format(self.config.get('replay_speed')))
+                self.replay_speed = 1.0
+
         self.adapterInstance = None
+        self.adapter_cache = None
+
+        self.dataset = None
+        self.dataset_sensor_id = None  # the id of the sensor in the dataset file
+        self.dataset_value_column = 0
+
+        # With a seed, generated observations are reproducible. Each sensor derives its own seed from it, so that
+        # sensors sharing the same configuration do not generate the same values
+        self.random_seed = self.config.get('random_seed')
+        self.sensor_seed = self.random_seed
+        if self.random_seed is not None and sensor_id is not None:
+            self.sensor_seed = zlib.crc32("{}:{}".format(self.random_seed, sensor_id).encode('UTF-8'))
+        self.rng = random.Random(self.sensor_seed)
+        self.bulk_generators = dict()  # (sensor id, bounds) -> BulkObsGenerator, see generate_observations_block
+
+        self.capabilities = capabilities
+        self.signal_chain = None
+        self.signal_block_size = int(self.config.get('signal_block_size', 1024))
+        self.signal_values = list()  # pre-generated values, consumed one by one
+        self.last_obs_dropped = False  # True if the last observation was lost (dropouts signal model)
 
         self.min_bound = None
         self.max_bound = None
@@ -26,14 +82,49 @@ class ObsGenerator(object):
         self.finalMax = None
 
         if self.obs_generation_mode == "FILE" or self.obs_generation_mode == "FILE_WITH_CURRENT_DATE":
+            from replay.compressed_reader import detect_compression
+            compression = detect_compression(self.path_obs_file)
+            if compression is not None and self.replay_engine != "READ_AHEAD":
+                if self.replay_engine == "MMAP":
+                    logging.warning("{} is {}-compressed and cannot be memory-mapped, using the READ_AHEAD replay "
+                                    "engine instead".format(self.path_obs_file, compression))
+                self.replay_engine = "READ_AHEAD"
+
+        if (self.obs_generation_mode == "FILE" or self.obs_generation_mode == "FILE_WITH_CURRENT_DATE") \
+                and self.replay_engine == "READ_AHEAD":
+            from replay.compressed_reader import ReadAheadObsReader
+            self.obs_reader = ReadAheadObsReader(self.path_obs_file, self.timestamp_in_milliseconds,
+                                                 loop=self.replay_loop,
+                                                 chunk_size=self.config.get('replay_read_ahead_chunk_size', 1024),
+                                                 nb_chunks=self.config.get('replay_read_ahead_nb_chunks', 8))
+        elif (self.obs_generation_mode == "FILE" or self.obs_generation_mode == "FILE_WITH_CURRENT_DATE") \
+                and self.replay_engine == "MMAP":
+            from replay.obs_file_index import ObsFileIndex
+            self.obs_file_index = ObsFileIndex.get_shared_index(self.path_obs_file,
+                                                                self.timestamp_in_milliseconds,
+                                                                pre_parse=self.config.get('replay_pre_parse', True))
+        elif self.obs_generation_mode == "FILE" or self.obs_generation_mode == "FILE_WITH_CURRENT_DATE":
             self.raw_obs_file = open(self.path_obs_file, 'r')
+            if self.replay_pacing == "ORIGINAL":
+                logging.warning("'replay_pacing': 'ORIGINAL' requires the MMAP or READ_AHEAD replay engine, "
+                                "using the frequency instead")
+        elif self.obs_generation_mode == "DATASET":
+            from replay.dataset_demux import DatasetDemultiplexer
+            self.dataset = DatasetDemultiplexer.get_shared_demultiplexer(self.config)
+            self.dataset_sensor_id = self.config.get('dataset_sensor_id') or sensor_id
+            self.dataset_value_column = int(self.config.get('dataset_value_column', 0))
+            self.dataset.register(self.dataset_sensor_id)
         elif self.obs_generation_mode == "RANDOM":
             self.min_bound = float(capabilities['min_value'])
             self.max_bound = float(capabilities['max_value'])
+        elif self.obs_generation_mode == "SIGNAL":
+            pass
         elif self.obs_generation_mode == "ADAPTER":
             my_module = importlib.import_module("adapters." + self.config['adapter_file'])
             adapter_class = getattr(my_module, self.config['adapter_class'])
             self.adapterInstance = adapter_class(self.config)
+            from adapters.response_cache import AdapterResponseCache
+            self.adapter_cache = AdapterResponseCache.get_shared_cache(self.config)
         else:
             self.obs_generation_mode = self.obs_generation_mode.replace("\"", "")
             self.obs_generation_mode = self.obs_generation_mode.replace("[", "")
@@ -42,21 +133,58 @@ class ObsGenerator(object):
             self.max_bound = float(self.obs_generation_mode.split(",")[1])
 
         # If the observations are generated, we have to consider the trust level
-        if self.obs_generation_mode not in ["FILE", "FILE_WITH_CURRENT_DATE", "ADAPTER"]:
+        if self.obs_generation_mode not in ["FILE", "FILE_WITH_CURRENT_DATE", "DATASET", "ADAPTER", "SIGNAL"]:
             self.finalMin = self.min_bound - ((self.max_bound - self.min_bound) / 2) * (1.0 - self.trust)
             self.finalMax = self.max_bound + ((self.max_bound - self.min_bound) / 2) * (1.0 - self.trust)
 
+        if self.obs_generation_mode not in ["FILE", "FILE_WITH_CURRENT_DATE", "DATASET", "ADAPTER"] \
+                and (self.config.get('signal_models') or self.obs_generation_mode == "SIGNAL"):
+            from signal_models import SignalModelChain
+            self.signal_chain = SignalModelChain(self.config.get('signal_models') or list(), seed=self.sensor_seed)
+
     def generate_one_observation(self, sensor_id):
         """
         Read a line (i.e., observation) of the specified file.
-        At the end of the file, the method close the file descriptor.
+        At the end of the file, the method close the file descriptor (unless the replay loops).
         :returns a single observation (i.e., a single line of the provided raw data file)
         :rtype str or None (if no more observations)
         """
         dict_to_send = None
 
-        if self.obs_generation_mode == "FILE" or self.obs_generation_mode == "FILE_WITH_CURRENT_DATE":
+        if self.obs_file_index is not None:
+            with self.replay_lock:
+                if self.replay_position >= len(self.obs_file_index) and self.replay_loop:
+                    self.replay_position = 0
+                position = self.replay_position
+                self.replay_position += 1
+            if position < len(self.obs_file_index):
+                date, value = self.obs_file_index.get_observation(position)
+                dict_to_send = dict(
+                    {
+                        'date': str(date),
+                        'value': str('{0:.{1}f}'.format(value, 3)),
+                        'producer': sensor_id,
+                        'timestamps': 'produced:' + str(TimeUtils.current_milli_time())
+                    }
+                )
+        elif self.obs_reader is not None:
+            observation = self.obs_reader.next_observation()
+            if observation is not None:
+                date, value = observation
+                self.last_replay_timestamp = date
+                dict_to_send = dict(
+                    {
+                        'date': str(date),
+                        'value': str('{0:.{1}f}'.format(value, 3)),
+                        'producer': sensor_id,
+                        'timestamps': 'produced:' + str(TimeUtils.current_milli_time())
+                    }
+                )
+        elif self.obs_generation_mode == "FILE" or self.obs_generation_mode == "FILE_WITH_CURRENT_DATE":
             line = self.raw_obs_file.readline()
+            if line == '' and self.replay_loop:
+                self.raw_obs_file.seek(0)
+                line = self.raw_obs_file.readline()
             if line == '':
                 self.raw_obs_file.close()
                 line = None
@@ -76,28 +204,182 @@ class ObsGenerator(object):
                         'timestamps': 'produced:' + str(TimeUtils.current_milli_time())
                     }
                 )
+        elif self.dataset is not None:
+            self.last_obs_dropped = False
+            row = self.dataset.next_row(self.dataset_sensor_id)
+            if row is not None:
+                date, values = row
+                self.last_replay_timestamp = date
+                if self.dataset_value_column < len(values):
+                    dict_to_send = dict(
+                        {
+                            'date': str(date),
+                            'value': str('{0:.{1}f}'.format(values[self.dataset_value_column], 3)),
+                            'producer': sensor_id,
+                            'timestamps': 'produced:' + str(TimeUtils.current_milli_time())
+                        }
+                    )
+                else:
+                    self.last_obs_dropped = True  # no value in the selected column for this row
         elif self.obs_generation_mode == "ADAPTER":
-            json_obj = self.adapterInstance.query_endpoint()
-            if json_obj is not None:
+            observation = self.adapter_cache.get_observation(self.adapterInstance, self.config['adapter_file'])
+            if observation is not None:
+                date, value, producer = observation
                 dict_to_send = dict(
                     {
-                        'date': '{}'.format(self.adapterInstance.extract_date_from_json(json_obj)),
-                        'value': str('{0:.{1}f}'.format(self.adapterInstance.extract_value_from_json(json_obj), 3)),
-                        'producer': self.adapterInstance.extract_producer_from_json(json_obj, self.config['adapter_file']),
-                        'timestamps': 'produced:{}'.format(self.adapterInstance.extract_date_from_json(json_obj))
+                        'date': date,
+                        'value': value,
+                        'producer': producer,
+                        'timestamps': 'produced:' + date
                     }
                 )
             else:
                 dict_to_send = None
+        elif self.signal_chain is not None:
+            value = self.next_signal_value()
+            self.last_obs_dropped = value != value  # NaN
+            if not self.last_obs_dropped:
+                date_now = TimeUtils.current_milli_time()
+                dict_to_send = dict(
+                    {
+                        'date': '{}'.format(date_now),
+                        'value': str('{0:.{1}f}'.format(value, 3)),
+                        'producer': sensor_id,
+                        'timestamps': 'produced:{}'.format(date_now)
+                    }
+                )
         else:
             date_now = TimeUtils.current_milli_time()
             dict_to_send = dict(
                 {
                     'date': '{}'.format(date_now),
-                    'value': str('{0:.{1}f}'.format(random.uniform(self.finalMin, self.finalMax), 3)),
+                    'value': str('{0:.{1}f}'.format(self.rng.uniform(self.finalMin, self.finalMax), 3)),
                     'producer': sensor_id,
                     'timestamps': 'produced:{}'.format(date_now)
                 }
             )
 
         return dict_to_send
+
+    def next_signal_value(self):
+        """
+        Return the next value of the signal, generating a new block of values if needed
+        :returns the value (NaN if the observation is lost)
+        :rtype float
+        """
+        if not self.signal_values:
+            base_values = None
+            if self.finalMin is not None:
+                base_values = self.signal_chain.rng.uniform(self.finalMin, self.finalMax, size=self.signal_block_size)
+            block = self.signal_chain.generate_block(self.signal_block_size,
+                                                     float(self.capabilities['frequency']),
+                                                     base_values=base_values)
+            self.signal_values = block.tolist()
+            self.signal_values.reverse()
+        return self.signal_values.pop()
+
+    def generate_observations_block(self, sensor_id, nb_obs, period_ms=0):
+        """
+        Generate a block of observations at once (RANDOM and "[min,max]" modes only, see bulk_generator.py)
+        :param sensor_id: str
+        :param nb_obs: the number of observations to generate (int)
+        :param period_ms: the delay between two consecutive observations (in milliseconds)
+        :returns a list of observations
+        :rtype list
+        """
+        key = (sensor_id, self.finalMin, self.finalMax)
+        bulk_generator = self.bulk_generators.get(key)
+        if bulk_generator is None:
+            from bulk_generator import BulkObsGenerator  # imports NumPy, only needed for bulk generation
+            seed = self.random_seed
+            if seed is not None:
+                seed = zlib.crc32("{}:{}".format(seed, sensor_id).encode('UTF-8'))
+            bulk_generator = BulkObsGenerator(seed=seed, signal_models=self.config.get('signal_models'))
+            bulk_generator.add_obs_generator(sensor_id, self)
+            self.bulk_generators[key] = bulk_generator
+        return bulk_generator.generate_block(nb_obs, period_ms=period_ms)[0]
+
+    def next_interval(self, frequency):
+        """
+        Return the delay before the next observation.
+        With 'replay_pacing': 'ORIGINAL' (MMAP and READ_AHEAD replay engines and DATASET mode only), this is the
+        original gap between the last replayed observation and the next one divided by 'replay_speed'
+        (or 0 if 'replay_speed' is "MAX").
+        Otherwise, this is the sensor frequency.
+        :param frequency: the sensor frequency (in seconds)
+        :returns the delay (in seconds)
+        :rtype float
+        """
+        if self.replay_pacing == "ORIGINAL" and (self.dataset is not None or self.obs_reader is not None):
+            if self.replay_speed == "MAX":
+                return 0.0
+            if self.dataset is not None:
+                next_timestamp = self.dataset.peek_timestamp(self.dataset_sensor_id)
+            else:
+                next_timestamp = self.obs_reader.peek_timestamp()
+            if self.last_replay_timestamp is None or next_timestamp is None:
+                return frequency
+            return max(0.0, (next_timestamp - self.last_replay_timestamp) / 1000.0 / self.replay_speed)
+        if self.replay_pacing != "ORIGINAL" or self.obs_file_index is None or not self.obs_file_index.pre_parsed:
+            return frequency
+        if self.replay_speed == "MAX":
+            return 0.0
+        with self.replay_lock:
+            position = self.replay_position
+        if position <= 0 or position >= len(self.obs_file_index):
+            return frequency  # before the first observation or at the end of the file (loop)
+        gap = self.obs_file_index.timestamps[position] - self.obs_file_index.timestamps[position - 1]
+        return max(0.0, gap / 1000.0 / self.replay_speed)
+
+    def get_replay_position(self):
+        """
+        Return the state of the replay (MMAP and READ_AHEAD replay engines and DATASET mode only)
+        :returns a dict with the next line to replay (starting from 1), the number of lines and its original timestamp
+        (the statistics of the reader and the timestamp of the next observation with the READ_AHEAD replay engine and
+        in DATASET mode)
+        :rtype dict or None
+        """
+        if self.obs_reader is not None:
+            state = self.obs_reader.get_stats()
+            state['timestamp'] = self.obs_reader.peek_timestamp()
+            return state
+        if self.dataset is not None:
+            state = self.dataset.get_stats(self.dataset_sensor_id)
+            state['sensor'] = self.dataset_sensor_id
+            state['timestamp'] = self.dataset.peek_timestamp(self.dataset_sensor_id)
+            return state
+        if self.obs_file_index is None:
+            return None
+        with self.replay_lock:
+            position = self.replay_position
+        state = {'line': position + 1, 'nb_lines': len(self.obs_file_index), 'loop': self.replay_loop}
+        if position < len(self.obs_file_index):
+            state['timestamp'] = self.obs_file_index.get_observation(position)[0]
+        return state
+
+    def seek_replay(self, line=None, timestamp=None):
+        """
+        Move the replay to a given line or to the first observation whose timestamp is greater than or equal
+        to the given one (binary search over the pre-parsed timestamps, which should be sorted)
+        :param line: the line number, starting from 1 (int)
+        :param timestamp: the original timestamp, in milliseconds (int)
+        :returns result ("OK"/"NOK") + details (message error if any)
+        :rtype str and str
+        """
+        if self.obs_file_index is None:
+            return "NOK", "Seeking is only supported by the MMAP replay engine"
+        if line is not None:
+            if not 1 <= line <= len(self.obs_file_index):
+                return "NOK", "Line {} is out of range [1, {}]".format(line, len(self.obs_file_index))
+            position = line - 1
+        elif timestamp is not None:
+            if not self.obs_file_index.pre_parsed:
+                return "NOK", "Seeking by timestamp requires 'replay_pre_parse' to be enabled"
+            position = bisect.bisect_left(self.obs_file_index.timestamps, timestamp)
+            if position >= len(self.obs_file_index):
+                return "NOK", "No observation after timestamp {}".format(timestamp)
+        else:
+            return "NOK", "Either a line or a timestamp should be provided"
+        with self.replay_lock:
+            self.replay_position = position
+        return "OK", ""
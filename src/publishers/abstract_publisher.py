@@ -0,0 +1,36 @@
+class AbstractPublisher(object):
+    """
+    AbstractPublisher to build publishers in order to send observations to a Kafka topic or a REST endpoint.
+    A single publisher may be shared by several virtual sensors.
+    """
+
+    def publish(self, publish_to, dictionary, sensor_id=None):
+        """
+        Send an observation
+        :param publish_to: the Kafka topic or the URL of the REST endpoint (str)
+        :param dictionary: the observation to send (dict)
+        :param sensor_id: the virtual sensor that produced the observation (str)
+        """
+        raise NotImplementedError("Should have implemented this")
+
+    def get_stats(self, sensor_id=None):
+        """
+        :param sensor_id: if supported by the publisher, also return the statistics of this virtual sensor
+        :returns publishing statistics (e.g., number of delivered and failed observations)
+        :rtype dict
+        """
+        return dict()
+
+    def get_nb_lost(self):
+        """
+        :returns the number of observations dropped or not delivered by the publisher so far (all sensors), e.g. to
+        check that nothing has been lost by a flush
+        :rtype int
+        """
+        return 0
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,159 @@
+import asyncio
+import collections
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from publishers.abstract_publisher import AbstractPublisher
+from utils.metrics import MetricsRegistry
+
+
+class AsyncPublishingEngine(AbstractPublisher):
+    """
+    Asyncio publishing stage that decouples the generation of observations from their publication.
+    Sensors push observations into a bounded asyncio queue and return immediately (except with the BLOCK policy).
+    Async workers drain the queue and hand observations over to the wrapped publisher (KafkaPublisher or
+    RestPublisher), so that a slow broker or endpoint does not delay the next observation.
+    Options (keys of the etc/sensor.config file):
+    -'async_queue_size': the maximum number of queued observations
+    -'async_nb_workers': the number of concurrent publishing workers
+    -'async_overflow_policy': what to do when the queue is full, BLOCK (wait for a free slot),
+    DROP_OLDEST (discard the oldest queued observation) or DROP_NEWEST (discard the new observation)
+    """
+
+    OVERFLOW_POLICIES = ['BLOCK', 'DROP_OLDEST', 'DROP_NEWEST']
+    NB_LATENCY_SAMPLES = 1000
+
+    def __init__(self, config, publisher):
+        self.publisher = publisher
+        self.queue_size = int(config.get('async_queue_size', 10000))
+        self.nb_workers = int(config.get('async_nb_workers', 4))
+        self.overflow_policy = config.get('async_overflow_policy', 'BLOCK')
+        if self.overflow_policy not in self.OVERFLOW_POLICIES:
+            logging.error("Unknown overflow policy '{}', using BLOCK instead".format(self.overflow_policy))
+            self.overflow_policy = 'BLOCK'
+
+        # Statistics (global and per sensor)
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+        self.failed = 0  # observations whose publication by the wrapped publisher raised an error
+        self.sensor_published = collections.Counter()
+        self.sensor_dropped = collections.Counter()
+        self.sensor_failed = collections.Counter()
+        self.latencies = collections.deque(maxlen=self.NB_LATENCY_SAMPLES)  # enqueue -> published, in seconds
+        self._metrics = MetricsRegistry.get_shared_registry()
+
+        self._executor = ThreadPoolExecutor(max_workers=self.nb_workers, thread_name_prefix="async-publisher")
+        self._loop = asyncio.new_event_loop()
+        self._queue = None
+        self._workers = list()
+        self._ready = threading.Event()
+        self._loop_thread = threading.Thread(target=self._run_loop, name="async-publishing-engine", daemon=True)
+        self._loop_thread.start()
+        self._ready.wait()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._workers = [self._loop.create_task(self._worker()) for _ in range(self.nb_workers)]
+        self._ready.set()
+        self._loop.run_forever()
+        self._loop.close()
+
+    async def _stop_workers(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._loop.stop()
+
+    async def _worker(self):
+        while True:
+            enqueue_time, publish_to, dictionary, sensor_id = await self._queue.get()
+            try:
+                await self._loop.run_in_executor(self._executor, self.publisher.publish,
+                                                 publish_to, dictionary, sensor_id)
+            except Exception:
+                logging.exception("Unexpected error while publishing an observation of sensor {}".format(sensor_id))
+                with self._lock:
+                    self.failed += 1
+                    self.sensor_failed[sensor_id] += 1
+                self._metrics.count_publisher_failed('ASYNC')
+                self._metrics.count_sensor(sensor_id, 'failed')
+            else:
+                latency = time.monotonic() - enqueue_time
+                with self._lock:
+                    self.published += 1
+                    self.sensor_published[sensor_id] += 1
+                    self.latencies.append(latency)
+                self._metrics.observe_publish_latency(latency)
+            finally:
+                self._queue.task_done()
+
+    def _put_nowait(self, item):
+        """ Enqueue an observation from the event loop thread, applying the DROP_* overflow policies """
+        if self._queue.full():
+            if self.overflow_policy == 'DROP_NEWEST':
+                self._count_drop(item[3])
+                return
+            dropped_item = self._queue.get_nowait()
+            self._queue.task_done()
+            self._count_drop(dropped_item[3])
+        self._queue.put_nowait(item)
+
+    def _count_drop(self, sensor_id):
+        with self._lock:
+            self.dropped += 1
+            self.sensor_dropped[sensor_id] += 1
+        self._metrics.count_publisher_dropped('ASYNC')
+        self._metrics.count_sensor(sensor_id, 'dropped')
+
+    def publish(self, publish_to, dictionary, sensor_id=None):
+        item = (time.monotonic(), publish_to, dictionary, sensor_id)
+        if self.overflow_policy == 'BLOCK':
+            asyncio.run_coroutine_threadsafe(self._queue.put(item), self._loop).result()
+        else:
+            self._loop.call_soon_threadsafe(self._put_nowait, item)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def get_stats(self, sensor_id=None):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            stats = {'engine': 'ASYNC',
+                     'overflow_policy': self.overflow_policy,
+                     'queue_depth': self.queue_depth(),
+                     'queue_size': self.queue_size,
+                     'published': self.published,
+                     'dropped': self.dropped,
+                     'failed': self.failed}
+            if sensor_id is not None:
+                stats['sensor_published'] = self.sensor_published[sensor_id]
+                stats['sensor_dropped'] = self.sensor_dropped[sensor_id]
+                stats['sensor_failed'] = self.sensor_failed[sensor_id]
+        if latencies:
+            stats['publish_latency_ms'] = {
+                'p50': round(1000 * latencies[len(latencies) // 2], 3),
+                'p99': round(1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 3),
+                'max': round(1000 * latencies[-1], 3)}
+        stats['publisher'] = self.publisher.get_stats(sensor_id)
+        return stats
+
+    def get_nb_lost(self):
+        with self._lock:
+            nb_lost = self.dropped + self.failed
+        return nb_lost + self.publisher.get_nb_lost()
+
+    def flush(self):
+        """ Wait until every queued observation has been handed over to the wrapped publisher """
+        asyncio.run_coroutine_threadsafe(self._queue.join(), self._loop).result()
+        self.publisher.flush()
+
+    def close(self):
+        self.flush()
+        asyncio.run_coroutine_threadsafe(self._stop_workers(), self._loop)
+        self._loop_thread.join()
+        self._executor.shutdown(wait=True)
+        self.publisher.close()
@@ -0,0 +1,111 @@
+import functools
+import logging
+import threading
+
+from kafka import KafkaProducer
+from kafka.errors import KafkaTimeoutError
+
+from publishers.abstract_publisher import AbstractPublisher
+from utils.json_post_observations import post_obs_to_kafka_topic
+from utils.metrics import MetricsRegistry
+from utils.obs_serializer import get_value_serializer
+
+
+class KafkaPublisher(AbstractPublisher):
+    """
+    A publisher that sends observations to Kafka topics
+    The publish_to parameter is the name of the topic
+    2 modes (key 'kafka_publishing_mode' of the etc/sensor.config file):
+    -SYNC: the producer is flushed after each observation (one broker round trip per observation)
+    -BATCHED: observations are batched by the producer according to 'kafka_linger_ms', 'kafka_batch_size' and
+    'kafka_compression_type'. At most 'kafka_max_in_flight' observations may be waiting for delivery, the producer
+    is only flushed when this window is full (backpressure) or when the publisher is closed.
+    Observations are serialized according to 'serialization_format' (JSON, TEMPLATE or BINARY, see obs_serializer.py)
+    """
+
+    def __init__(self, config, client_id):
+        self.kafka_producer = None
+        self.publishing_mode = config.get('kafka_publishing_mode', 'SYNC')
+        self.max_in_flight = int(config.get('kafka_max_in_flight', 10000))
+
+        # Delivery statistics, updated by the producer callbacks
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.delivered = 0
+        self.failed = 0
+        self._metrics = MetricsRegistry.get_shared_registry()
+
+        if self.publishing_mode == 'BATCHED':
+            compression_type = config.get('kafka_compression_type', 'none')
+            producer_options = dict(acks=config.get('kafka_acks', 0),
+                                    linger_ms=int(config.get('kafka_linger_ms', 20)),
+                                    batch_size=int(config.get('kafka_batch_size', 65536)),
+                                    compression_type=None if compression_type == 'none' else compression_type)
+        else:
+            producer_options = dict(acks=0,
+                                    linger_ms=0,
+                                    batch_size=0)
+
+        try:
+            self.kafka_producer = KafkaProducer(client_id=client_id,
+                                                bootstrap_servers=config['kafka_bootstrap_server'],
+                                                value_serializer=get_value_serializer(
+                                                    config.get('serialization_format', 'JSON')),
+                                                **producer_options)
+        except KafkaTimeoutError:
+            logging.error("KafkaTimeoutError: Unable to create KafkaProducer.")
+
+    def publish(self, publish_to, dictionary, sensor_id=None):
+        if self.publishing_mode != 'BATCHED':
+            post_obs_to_kafka_topic(kafka_producer=self.kafka_producer,
+                                    topic=publish_to,
+                                    dictionary=dictionary)
+            self._metrics.count_sensor(sensor_id, 'published')
+            return
+
+        if self.in_flight >= self.max_in_flight:
+            self.kafka_producer.flush()  # Backpressure: wait for the pending observations to be delivered
+
+        with self._lock:
+            self.in_flight += 1
+        try:
+            future = self.kafka_producer.send(publish_to, dictionary)
+        except KafkaTimeoutError:
+            logging.error("KafkaTimeoutError: Unable to send observation to topic {}.".format(publish_to))
+            self._on_delivery_failure(sensor_id, None)
+        else:
+            future.add_callback(functools.partial(self._on_delivery_success, sensor_id))
+            future.add_errback(functools.partial(self._on_delivery_failure, sensor_id))
+
+    def _on_delivery_success(self, sensor_id, record_metadata):
+        with self._lock:
+            self.in_flight -= 1
+            self.delivered += 1
+        self._metrics.count_sensor(sensor_id, 'published')
+
+    def _on_delivery_failure(self, sensor_id, exception):
+        with self._lock:
+            self.in_flight -= 1
+            self.failed += 1
+        self._metrics.count_publisher_failed('KAFKA')
+        self._metrics.count_sensor(sensor_id, 'failed')
+
+    def get_nb_lost(self):
+        with self._lock:
+            return self.failed
+
+    def get_stats(self, sensor_id=None):
+        with self._lock:
+            return {'publishing_mode': self.publishing_mode,
+                    'in_flight': self.in_flight,
+                    'delivered': self.delivered,
+                    'failed': self.failed}
+
+    def flush(self):
+        if self.kafka_producer is not None:
+            self.kafka_producer.flush()
+
+    def close(self):
+        if self.kafka_producer is not None:
+            self.kafka_producer.flush()
+            self.kafka_producer.close()
@@ -0,0 +1,24 @@
+def create_publisher(mode, config, client_id):
+    """
+    Create the publisher corresponding to the specified mode
+    If the 'publishing_engine' key of the configuration is set to ASYNC, the publisher is wrapped into an
+    AsyncPublishingEngine
+    :param mode: str ("KAFKA" or "REST")
+    :param config: the sensor configuration (dict)
+    :param client_id: the name used by the publisher to identify itself (str)
+    :returns a publisher object or None if the mode is unknown
+    :rtype AbstractPublisher
+    """
+    if mode == "KAFKA":
+        from publishers.kafka_publisher import KafkaPublisher
+        publisher = KafkaPublisher(config, client_id)
+    elif mode == "REST":
+        from publishers.rest_publisher import RestPublisher
+        publisher = RestPublisher(config)
+    else:
+        return None
+
+    if config.get('publishing_engine', 'DIRECT') == 'ASYNC':
+        from publishers.async_publishing_engine import AsyncPublishingEngine
+        publisher = AsyncPublishingEngine(config, publisher)
+    return publisher
@@ -0,0 +1,220 @@
+import collections
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.util.timeout import Timeout
+
+from publishers.abstract_publisher import AbstractPublisher
+from utils.json_post_observations import post_obs_to_rest_endpoint, post_obs_batch_to_rest_endpoint, \
+    post_serialized_obs_to_rest_endpoint
+from utils.metrics import MetricsRegistry
+from utils.obs_serializer import get_value_serializer, get_batch_serializer, get_content_type
+
+
+class RestPublisher(AbstractPublisher):
+    """
+    A publisher that POSTs observations to REST endpoints
+    The publish_to parameter is the URL of the endpoint
+    One pooled keep-alive requests.Session is kept per URL. POST requests are only retried ('rest_max_retries' times)
+    when the connection fails or the endpoint answers 502, 503 or 504, never after a read timeout, so that an
+    endpoint which received an observation does not receive it twice. 'rest_timeout' (in seconds) bounds the time
+    spent on one POST, retries and backoff included: each attempt gets an equal share of what remains once the
+    backoff delays are deducted, to connect and read the response.
+    Observations are POSTed by a pool of 'rest_pool_size' threads (as many as pooled connections per URL), so that a
+    slow endpoint does not stall the sensing loop.
+    2 modes (key 'rest_publishing_mode' of the etc/sensor.config file):
+    -SINGLE: each observation is POSTed on its own, as soon as possible
+    -BATCHED: observations are POSTed as a JSON array, as soon as 'rest_batch_size' observations are buffered
+    for a URL or every 'rest_batch_interval_ms' milliseconds.
+    In both modes, at most 'rest_max_buffered' observations are buffered per URL, the oldest ones are dropped beyond.
+    Observations are serialized according to 'serialization_format' (JSON, TEMPLATE or BINARY, see obs_serializer.py)
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.publishing_mode = config.get('rest_publishing_mode', 'SINGLE')
+        self.timeout = float(config.get('rest_timeout', 2.0))
+        self.max_retries = int(config.get('rest_max_retries', 2))
+        # urllib3 retries at once after the first failure, then waits backoff_factor * 2 ** (n - 1) before retry n
+        self.backoff_factor = 0.1
+        backoff = sum(self.backoff_factor * 2 ** (n - 1) for n in range(2, self.max_retries + 1))
+        self.attempt_timeout = max(0.001, self.timeout - backoff) / (self.max_retries + 1)  # connect + read
+        self.pool_size = int(config.get('rest_pool_size', 10))
+        self.batch_size = int(config.get('rest_batch_size', 100))
+        self.batch_interval = float(config.get('rest_batch_interval_ms', 1000)) / 1000
+        self.max_buffered = int(config.get('rest_max_buffered', 10000))
+        self.serialization_format = config.get('serialization_format', 'JSON')
+        self.content_type = get_content_type(self.serialization_format)
+        self._value_serializer = get_value_serializer(self.serialization_format)
+        self._batch_serializer = get_batch_serializer(self.serialization_format)
+
+        self._lock = threading.Lock()
+        self._sessions = dict()  # one pooled session per URL
+        self._buffers = dict()  # one buffer of pending (sensor_id, observation) per URL
+        self._in_flight = 0  # POSTs submitted to the pool and not completed yet
+        self._idle = threading.Condition(self._lock)
+        self._slots = threading.Semaphore(self.pool_size)  # observations stay buffered while all the threads POST
+        self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="rest-publisher")
+        self.delivered = 0
+        self.failed = 0
+        self.dropped = 0
+        self._metrics = MetricsRegistry.get_shared_registry()
+
+        self._flush_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._flusher_thread = threading.Thread(target=self._run_flusher, name="rest-flusher", daemon=True)
+        self._flusher_thread.start()
+
+    def get_session(self, url):
+        """
+        Return the pooled keep-alive session used for the specified URL
+        :param url: str
+        :rtype requests.Session
+        """
+        with self._lock:
+            session = self._sessions.get(url)
+            if session is None:
+                # POST requests are retried too, but only if they have not been read by the endpoint
+                retries = Retry(total=self.max_retries,
+                                connect=self.max_retries,
+                                read=0,
+                                backoff_factor=self.backoff_factor,
+                                status_forcelist=[502, 503, 504],
+                                allowed_methods=None,
+                                respect_retry_after_header=False)
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retries)
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._sessions[url] = session
+            return session
+
+    def publish(self, publish_to, dictionary, sensor_id=None):
+        with self._lock:
+            buffer = self._buffers.get(publish_to)
+            if buffer is None:
+                buffer = collections.deque(maxlen=self.max_buffered)
+                self._buffers[publish_to] = buffer
+            if len(buffer) == self.max_buffered:
+                self.dropped += 1
+                self._metrics.count_publisher_dropped('REST')
+                self._metrics.count_sensor(buffer[0][0], 'dropped')  # the oldest observation is dropped
+            buffer.append((sensor_id, dictionary))
+            if self.publishing_mode != 'BATCHED' or len(buffer) >= self.batch_size:
+                self._flush_event.set()
+
+    def _post(self, url, payload, sensor_ids, post_function):
+        """
+        POST one observation or a batch, and count it as delivered or failed, for the sensors which produced it
+        :param sensor_ids: the ids of the sensors which produced the observations, in order (list)
+        """
+        nb_obs = len(sensor_ids)
+        timeout = Timeout(total=self.attempt_timeout)
+        try:
+            if self.serialization_format == 'JSON':
+                response = post_function(url, payload, session=self.get_session(url), timeout=timeout)
+            else:
+                data = self._value_serializer(payload) if nb_obs == 1 and isinstance(payload, dict) \
+                    else self._batch_serializer(payload)
+                response = post_serialized_obs_to_rest_endpoint(url, data, content_type=self.content_type,
+                                                                session=self.get_session(url), timeout=timeout)
+            success = response.status_code < 400
+        except requests.exceptions.RequestException as e:
+            logging.error("{}: Unable to POST observations to {}.".format(type(e).__name__, url))
+            success = False
+        with self._lock:
+            if success:
+                self.delivered += nb_obs
+            else:
+                self.failed += nb_obs
+        if not success:
+            self._metrics.count_publisher_failed('REST', nb_obs)
+        for sensor_id, nb_sensor_obs in collections.Counter(sensor_ids).items():
+            self._metrics.count_sensor(sensor_id, 'published' if success else 'failed', nb_sensor_obs)
+
+    def _run_flusher(self):
+        while not self._stop_event.is_set():
+            self._flush_event.wait(self.batch_interval)
+            self._flush_event.clear()
+            self._dispatch()
+
+    def _next_batch(self):
+        """
+        Pop the next observations to POST (with self._lock held): one observation (SINGLE mode) or at most
+        rest_batch_size observations (BATCHED mode) of a URL, taking the URLs in turn
+        :returns the URL and the observations, or None if nothing is buffered
+        :rtype tuple
+        """
+        for url, buffer in self._buffers.items():
+            if buffer:
+                size = min(self.batch_size, len(buffer)) if self.publishing_mode == 'BATCHED' else 1
+                batch = [buffer.popleft() for _ in range(size)]
+                self._buffers[url] = self._buffers.pop(url)  # the other URLs go first next time
+                return url, batch
+        return None
+
+    def _dispatch(self):
+        """ Submit the buffered observations to the pool, waiting for a free thread before popping each batch """
+        while True:
+            self._slots.acquire()
+            with self._lock:
+                next_batch = self._next_batch()
+                if next_batch is not None:
+                    self._in_flight += 1
+            if next_batch is None:
+                self._slots.release()
+                return
+            self._executor.submit(self._post_batch, *next_batch)
+
+    def _post_batch(self, url, batch):
+        try:
+            sensor_ids = [sensor_id for sensor_id, _ in batch]
+            if self.publishing_mode == 'BATCHED':
+                self._post(url, [dictionary for _, dictionary in batch], sensor_ids, post_obs_batch_to_rest_endpoint)
+            else:
+                self._post(url, batch[0][1], sensor_ids, post_obs_to_rest_endpoint)
+        except Exception:
+            logging.exception("Unexpected error while POSTing observations to {}".format(url))
+        finally:
+            self._slots.release()
+            with self._lock:
+                self._in_flight -= 1
+                if self._in_flight == 0:
+                    self._idle.notify_all()
+
+    def flush(self):
+        """
+        POST every buffered observation, one by one (SINGLE mode) or by batches of at most rest_batch_size
+        observations (BATCHED mode), and wait until all the pending POSTs are completed
+        """
+        self._dispatch()
+        with self._lock:
+            while self._in_flight > 0:
+                self._idle.wait()
+
+    def get_nb_lost(self):
+        with self._lock:
+            return self.failed + self.dropped
+
+    def get_stats(self, sensor_id=None):
+        with self._lock:
+            return {'publishing_mode': self.publishing_mode,
+                    'buffered': sum(len(buffer) for buffer in self._buffers.values()),
+                    'delivered': self.delivered,
+                    'failed': self.failed,
+                    'dropped': self.dropped}
+
+    def close(self):
+        self._stop_event.set()
+        self._flush_event.set()
+        self._flusher_thread.join()
+        self.flush()
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
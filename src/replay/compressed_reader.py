@@ -0,0 +1,189 @@
+import bz2
+import collections
+import gzip
+import io
+import logging
+import lzma
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# (magic bytes, extension, compression)
+COMPRESSION_FORMATS = ((b'\x1f\x8b', '.gz', 'gzip'),
+                       (b'\xfd7zXZ\x00', '.xz', 'xz'),
+                       (b'BZh', '.bz2', 'bzip2'),
+                       (b'\x28\xb5\x2f\xfd', '.zst', 'zstd'))
+
+
+def detect_compression(path_obs_file):
+    """
+    Detect the compression of a file from its first bytes (magic number), or from its extension if they are not
+    recognized
+    :returns 'gzip', 'xz', 'bzip2', 'zstd' or None for plain text files
+    :rtype str
+    """
+    with open(path_obs_file, 'rb') as obs_file:
+        header = obs_file.read(8)
+    for magic, extension, compression in COMPRESSION_FORMATS:
+        if header.startswith(magic):
+            return compression
+    for magic, extension, compression in COMPRESSION_FORMATS:
+        if path_obs_file.endswith(extension):
+            return compression
+    return None
+
+
+def open_obs_file(path_obs_file):
+    """
+    Open an observation file as text, decompressing it on the fly if it is gzip, xz, bzip2 or zstd-compressed
+    (zstd requires the zstandard package)
+    :returns a text file object
+    """
+    compression = detect_compression(path_obs_file)
+    if compression == 'gzip':
+        return gzip.open(path_obs_file, 'rt')
+    if compression == 'xz':
+        return lzma.open(path_obs_file, 'rt')
+    if compression == 'bzip2':
+        return bz2.open(path_obs_file, 'rt')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError("zstd-compressed observation files require the zstandard package")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path_obs_file, 'rb'),
+                                                                           closefd=True))
+    return open(path_obs_file, 'r')
+
+
+class ReadAheadObsReader(object):
+    """
+    Reader of a raw observation file (one "timestamp value" pair per line, optionally compressed, see open_obs_file)
+    whose reading, decompression and parsing are done by a background thread.
+    Parsed observations are pushed by chunks of chunk_size rows into a ring buffer of at most nb_chunks chunks,
+    so that next_observation() only pops already parsed rows. The thread waits when the ring buffer is full.
+    Malformed lines are skipped.
+    """
+
+    def __init__(self, path_obs_file, timestamp_in_milliseconds="false", loop=False, chunk_size=1024, nb_chunks=8):
+        self.path_obs_file = path_obs_file
+        self.timestamp_in_milliseconds = timestamp_in_milliseconds
+        self.loop = loop
+        self.chunk_size = max(1, int(chunk_size))
+        self._chunks = collections.deque()
+        self._max_chunks = max(1, int(nb_chunks))
+        self._chunk = None  # chunk being consumed, and position in it
+        self._position = 0
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self.eof = False  # set by the thread once the last chunk has been pushed
+        self.nb_rows = 0
+        self.nb_skipped = 0
+        self.nb_loops = 0
+        self.nb_stalls = 0  # observations which were not parsed yet when requested
+
+        self._obs_file = open_obs_file(path_obs_file)  # fails early if the file is missing or cannot be decompressed
+        self._thread = threading.Thread(target=self._run, name="read-ahead", daemon=True)
+        self._thread.start()
+
+    def _parse_line(self, line):
+        fields = line.split()
+        if self.timestamp_in_milliseconds == "false":
+            timestamp = int(float(fields[0])) * 1000
+        else:
+            timestamp = int(float(fields[0]))
+        return timestamp, float(fields[1])
+
+    def _run(self):
+        try:
+            self._read_chunks()
+        except Exception:
+            logging.exception("Unexpected error while reading {}".format(self.path_obs_file))
+        finally:
+            self._obs_file.close()
+            with self._condition:
+                self.eof = True
+                self._condition.notify_all()
+
+    def _read_chunks(self):
+        nb_rows_in_pass = 0
+        while not self._stop_event.is_set():
+            chunk = list()
+            eof = False
+            for line in self._obs_file:
+                try:
+                    chunk.append(self._parse_line(line))
+                except (ValueError, IndexError):
+                    if line.strip():
+                        self.nb_skipped += 1
+                    continue
+                if len(chunk) == self.chunk_size:
+                    break
+            else:
+                eof = True
+            nb_rows_in_pass += len(chunk)
+            if chunk:
+                with self._condition:
+                    while len(self._chunks) >= self._max_chunks and not self._stop_event.is_set():
+                        self._condition.wait()
+                    self._chunks.append(chunk)
+                    self.nb_rows += len(chunk)
+                    self._condition.notify_all()
+            if eof:
+                if not self.loop or nb_rows_in_pass == 0:
+                    return
+                self._obs_file.close()
+                self._obs_file = open_obs_file(self.path_obs_file)  # not all decompressors can seek backwards
+                self.nb_loops += 1
+                nb_rows_in_pass = 0
+
+    def _next_chunk(self):
+        """ Wait for the next parsed chunk (with self._condition held), or return False at the end of the file """
+        if not self._chunks and not self.eof:
+            self.nb_stalls += 1
+        while not self._chunks:
+            if self.eof:
+                return False
+            self._condition.wait()
+        self._chunk = self._chunks.popleft()
+        self._position = 0
+        self._condition.notify_all()
+        return True
+
+    def next_observation(self):
+        """
+        :returns the next observation: its timestamp (in milliseconds) and its value,
+        or None if the end of the file has been reached
+        :rtype tuple
+        """
+        with self._condition:
+            if self._chunk is None or self._position >= len(self._chunk):
+                if not self._next_chunk():
+                    return None
+            observation = self._chunk[self._position]
+            self._position += 1
+            return observation
+
+    def peek_timestamp(self):
+        """ :returns the timestamp of the next observation, without consuming it (or None) """
+        with self._condition:
+            if self._chunk is None or self._position >= len(self._chunk):
+                if not self._next_chunk():
+                    return None
+            return self._chunk[self._position][0]
+
+    def close(self):
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+
+    def get_stats(self):
+        with self._condition:
+            buffered = sum(len(chunk) for chunk in self._chunks)
+            if self._chunk is not None:
+                buffered += len(self._chunk) - self._position
+            return {'nb_rows': self.nb_rows, 'nb_skipped': self.nb_skipped, 'nb_loops': self.nb_loops,
+                    'nb_stalls': self.nb_stalls, 'buffered': buffered, 'eof': self.eof and buffered == 0,
+                    'loop': self.loop}
@@ -0,0 +1,160 @@
+import collections
+import logging
+import os
+import threading
+
+from replay.compressed_reader import open_obs_file
+
+
+class DatasetDemultiplexer(object):
+    """
+    Single-pass reader of a multi-sensor dataset file, shared by all the sensors of a process replaying it
+    (DATASET observation generation mode, see get_shared_demultiplexer).
+    Each line holds a timestamp, a sensor id and one or more values, e.g. "1392246000.0 sensor01 4.0 12.5"
+    (the column of the sensor id is 'dataset_sensor_column', values are the other columns after the timestamp).
+    The file is read sequentially, once, and each row is dispatched to the buffer of its sensor, so that the rows of
+    each sensor are replayed in file (i.e., timestamp) order. Reading ahead only happens when a sensor needs a row
+    and its buffer is empty. Rows of sensors which are not hosted by the process are skipped.
+    Buffers are bounded ('dataset_buffer_size' rows per sensor): when a sensor lags too far behind the others,
+    its oldest buffered rows are dropped (and counted per sensor). With 'replay_pacing': 'ORIGINAL', all the sensors
+    move forward at the same pace through the dataset, so that buffers only overflow when the rows of a sensor are
+    much sparser than the ones of the others.
+    When the dataset is replayed in a loop, a sensor without any row in the file gets no observation, the others go on.
+    Compressed dataset files are decompressed on the fly (see replay/compressed_reader.py).
+    """
+
+    _shared_demultiplexers = dict()
+    _shared_demultiplexers_lock = threading.Lock()
+
+    def __init__(self, path_dataset_file, timestamp_in_milliseconds="false", sensor_column=1, buffer_size=64,
+                 loop=False):
+        self.path_dataset_file = path_dataset_file
+        self.timestamp_in_milliseconds = timestamp_in_milliseconds
+        self.sensor_column = int(sensor_column)
+        self.buffer_size = max(1, int(buffer_size))
+        self.loop = loop
+        self._lock = threading.Lock()
+        self._file = open_obs_file(path_dataset_file)
+        self._buffers = dict()  # sensor id in the file -> deque of (timestamp in milliseconds, values)
+        self.eof = False
+        self.nb_rows = 0
+        self.nb_skipped = 0  # rows of sensors not hosted by the process, or malformed
+        self.nb_dropped = 0  # rows dropped because the buffer of their sensor was full
+        self._nb_dropped = dict()  # sensor id in the file -> number of dropped rows
+        self._without_rows = set()  # sensor ids without any row in the file (found when looping)
+        self.nb_loops = 0
+
+    @classmethod
+    def get_shared_demultiplexer(cls, config):
+        """
+        Return the demultiplexer of the dataset file of the specified configuration ('path_obs_file'), creating it
+        if no other sensor of the process already did
+        :rtype DatasetDemultiplexer
+        """
+        key = (os.path.abspath(config['path_obs_file']), config.get('timestamp_in_milliseconds', "false"),
+               int(config.get('dataset_sensor_column', 1)))
+        with cls._shared_demultiplexers_lock:
+            if key not in cls._shared_demultiplexers:
+                cls._shared_demultiplexers[key] = cls(config['path_obs_file'],
+                                                      config.get('timestamp_in_milliseconds', "false"),
+                                                      config.get('dataset_sensor_column', 1),
+                                                      config.get('dataset_buffer_size', 64),
+                                                      config.get('replay_loop', False))
+            return cls._shared_demultiplexers[key]
+
+    def register(self, dataset_sensor_id):
+        """
+        Dispatch the rows of the specified sensor id to a buffer from now on. All the sensors should be registered
+        before the first row is read (see SensorHost.deploy_sensors): the rows already read are not replayed
+        :param dataset_sensor_id: the sensor id, as written in the dataset file (str)
+        """
+        with self._lock:
+            if dataset_sensor_id not in self._buffers:
+                if self.nb_rows > 0 or self.nb_skipped > 0:
+                    logging.warning("Sensor {} replays {} from row {}, the rows already read are skipped".format(
+                        dataset_sensor_id, self.path_dataset_file, self.nb_rows + self.nb_skipped + 1))
+                self._buffers[dataset_sensor_id] = collections.deque()
+
+    def _parse_row(self, line):
+        """ :returns the sensor id, the timestamp (in milliseconds) and the values of a line, or None """
+        fields = line.split()
+        if len(fields) < 3:
+            return None
+        dataset_sensor_id = fields[self.sensor_column]
+        if dataset_sensor_id not in self._buffers:
+            return dataset_sensor_id, None, None  # not hosted here, values are not parsed
+        if self.timestamp_in_milliseconds == "false":
+            timestamp = int(float(fields[0])) * 1000
+        else:
+            timestamp = int(float(fields[0]))
+        values = tuple(float(field) for i, field in enumerate(fields) if i != 0 and i != self.sensor_column)
+        return dataset_sensor_id, timestamp, values
+
+    def _read_ahead(self, dataset_sensor_id):
+        """
+        Read and dispatch rows until the buffer of the specified sensor is not empty or the end of the file is reached
+        :returns the buffer of the sensor
+        """
+        buffer = self._buffers[dataset_sensor_id]
+        nb_loops = 0
+        while not buffer and not self.eof and dataset_sensor_id not in self._without_rows:
+            line = self._file.readline()
+            if line == '':
+                if not self.loop:
+                    self.eof = True
+                    break
+                if nb_loops > 0:  # a whole pass without any row of this sensor: it will never get one
+                    logging.warning("Sensor {} has no row in {}".format(dataset_sensor_id, self.path_dataset_file))
+                    self._without_rows.add(dataset_sensor_id)
+                    break
+                nb_loops += 1
+                self._file.close()
+                self._file = open_obs_file(self.path_dataset_file)
+                self.nb_loops += 1
+                continue
+            try:
+                row = self._parse_row(line)
+            except (ValueError, IndexError):
+                row = None
+            if row is None or row[1] is None:
+                self.nb_skipped += 1
+                continue
+            self.nb_rows += 1
+            row_sensor_id, timestamp, values = row
+            sensor_buffer = self._buffers[row_sensor_id]
+            if len(sensor_buffer) >= self.buffer_size:
+                sensor_buffer.popleft()
+                nb_dropped = self._nb_dropped.get(row_sensor_id, 0)
+                if nb_dropped == 0:
+                    logging.warning("Sensor {} lags behind the other sensors replaying {}, dropping its oldest rows "
+                                    "(see 'dataset_buffer_size' and 'replay_pacing')".format(row_sensor_id,
+                                                                                             self.path_dataset_file))
+                self._nb_dropped[row_sensor_id] = nb_dropped + 1
+                self.nb_dropped += 1
+            sensor_buffer.append((timestamp, values))
+        return buffer
+
+    def next_row(self, dataset_sensor_id):
+        """
+        :returns the next row of the specified sensor: its timestamp (in milliseconds) and its values (tuple),
+        or None if the end of the dataset has been reached
+        :rtype tuple
+        """
+        with self._lock:
+            buffer = self._read_ahead(dataset_sensor_id)
+            return buffer.popleft() if buffer else None
+
+    def peek_timestamp(self, dataset_sensor_id):
+        """ :returns the timestamp of the next row of the specified sensor, without consuming it (or None) """
+        with self._lock:
+            buffer = self._read_ahead(dataset_sensor_id)
+            return buffer[0][0] if buffer else None
+
+    def get_stats(self, dataset_sensor_id=None):
+        with self._lock:
+            stats = {'nb_rows': self.nb_rows, 'nb_skipped': self.nb_skipped, 'nb_dropped': self.nb_dropped,
+                     'nb_loops': self.nb_loops, 'nb_sensors': len(self._buffers), 'eof': self.eof}
+            if dataset_sensor_id is not None:
+                stats['buffered'] = len(self._buffers.get(dataset_sensor_id, ()))
+                stats['sensor_nb_dropped'] = self._nb_dropped.get(dataset_sensor_id, 0)
+            return stats
@@ -0,0 +1,161 @@
+import array
+import logging
+import mmap
+import os
+import struct
+import threading
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class ObsFileIndex(object):
+    """
+    Memory-mapped and indexed raw observation file (one "timestamp value" pair per line).
+    The file is mapped once and the offset of each line is indexed once, so that reading any observation is O(1).
+    Optionally, timestamps (in milliseconds) and values are pre-parsed into compact arrays and cached in a binary
+    sidecar file (path_obs_file + '.idx') which is itself memory-mapped by later runs.
+    A single index is shared by all the sensors of a process that replay the same file (see get_shared_index).
+    """
+
+    SIDECAR_EXTENSION = '.idx'
+    SIDECAR_MAGIC = b'VSIDX001'
+    # magic, source size, source mtime (ns), timestamp_in_milliseconds flag, number of lines
+    SIDECAR_HEADER = struct.Struct('=8sqqqq')
+
+    _shared_indexes = dict()
+    _shared_indexes_lock = threading.Lock()
+
+    def __init__(self, path_obs_file, timestamp_in_milliseconds="false", pre_parse=True, use_sidecar=True):
+        self.path_obs_file = path_obs_file
+        self.timestamp_in_milliseconds = timestamp_in_milliseconds
+        self.pre_parsed = pre_parse
+        self.offsets = None  # offset of the start of each line
+        self.timestamps = None  # timestamps in milliseconds (only if pre_parse is True)
+        self.values = None  # values (only if pre_parse is True)
+        self._sidecar_mmap = None
+
+        with open(path_obs_file, 'rb') as raw_obs_file:
+            file_size = os.fstat(raw_obs_file.fileno()).st_size
+            self._mmap = mmap.mmap(raw_obs_file.fileno(), 0, access=mmap.ACCESS_READ) if file_size > 0 else b''
+
+        sidecar_path = path_obs_file + self.SIDECAR_EXTENSION
+        if not (pre_parse and use_sidecar and self._load_sidecar(sidecar_path)):
+            self._index_lines()
+            if pre_parse:
+                self._parse_lines()
+                if use_sidecar:
+                    self._write_sidecar(sidecar_path)
+
+    @classmethod
+    def get_shared_index(cls, path_obs_file, timestamp_in_milliseconds="false", pre_parse=True, use_sidecar=True):
+        """
+        Return the index of the specified file, creating it if no other sensor of the process already did
+        :rtype ObsFileIndex
+        """
+        key = (os.path.abspath(path_obs_file), timestamp_in_milliseconds, pre_parse)
+        with cls._shared_indexes_lock:
+            if key not in cls._shared_indexes:
+                cls._shared_indexes[key] = cls(path_obs_file, timestamp_in_milliseconds, pre_parse, use_sidecar)
+            return cls._shared_indexes[key]
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _index_lines(self):
+        """ Find the offset of every non-empty line of the mapped file """
+        if numpy is not None and len(self._mmap) > 0:
+            newlines = numpy.flatnonzero(numpy.frombuffer(self._mmap, dtype=numpy.uint8) == ord('\n'))
+            starts = numpy.concatenate(([0], newlines + 1))
+            ends = numpy.concatenate((newlines, [len(self._mmap)]))
+            self.offsets = array.array('q', starts[ends > starts].tolist())
+        else:
+            self.offsets = array.array('q')
+            start = 0
+            size = len(self._mmap)
+            while start < size:
+                end = self._mmap.find(b'\n', start)
+                if end == -1:
+                    end = size
+                if end > start:
+                    self.offsets.append(start)
+                start = end + 1
+
+    def _line_end(self, i):
+        end = self._mmap.find(b'\n', self.offsets[i])
+        return len(self._mmap) if end == -1 else end
+
+    def get_raw_line(self, i):
+        """
+        :returns the i-th line of the file, without its line feed
+        :rtype bytes
+        """
+        return self._mmap[self.offsets[i]:self._line_end(i)]
+
+    def _parse_line(self, line):
+        fields = line.split()
+        if self.timestamp_in_milliseconds == "false":
+            timestamp = int(float(fields[0])) * 1000
+        else:
+            timestamp = int(float(fields[0]))
+        return timestamp, float(fields[1])
+
+    def _parse_lines(self):
+        self.timestamps = array.array('q', bytes(8 * len(self.offsets)))
+        self.values = array.array('d', bytes(8 * len(self.offsets)))
+        for i in range(len(self.offsets)):
+            self.timestamps[i], self.values[i] = self._parse_line(self.get_raw_line(i))
+
+    def get_observation(self, i):
+        """
+        :returns the timestamp (in milliseconds) and the value of the i-th observation of the file
+        :rtype int and float
+        """
+        if self.pre_parsed:
+            return self.timestamps[i], self.values[i]
+        return self._parse_line(self.get_raw_line(i))
+
+    # Binary sidecar (header + offsets + timestamps + values)
+
+    def _source_signature(self):
+        stat = os.stat(self.path_obs_file)
+        return stat.st_size, stat.st_mtime_ns, 1 if self.timestamp_in_milliseconds != "false" else 0
+
+    def _load_sidecar(self, sidecar_path):
+        try:
+            with open(sidecar_path, 'rb') as sidecar_file:
+                sidecar_mmap = mmap.mmap(sidecar_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+
+        header_size = self.SIDECAR_HEADER.size
+        if len(sidecar_mmap) < header_size:
+            return False
+        magic, size, mtime_ns, in_milliseconds, nb_lines = self.SIDECAR_HEADER.unpack_from(sidecar_mmap)
+        if magic != self.SIDECAR_MAGIC or (size, mtime_ns, in_milliseconds) != self._source_signature() \
+                or len(sidecar_mmap) != header_size + 24 * nb_lines:
+            return False
+
+        # Arrays are zero-copy views on the mapped sidecar
+        view = memoryview(sidecar_mmap)
+        self.offsets = view[header_size:header_size + 8 * nb_lines].cast('q')
+        self.timestamps = view[header_size + 8 * nb_lines:header_size + 16 * nb_lines].cast('q')
+        self.values = view[header_size + 16 * nb_lines:header_size + 24 * nb_lines].cast('d')
+        self._sidecar_mmap = sidecar_mmap
+        return True
+
+    def _write_sidecar(self, sidecar_path):
+        size, mtime_ns, in_milliseconds = self._source_signature()
+        temp_path = sidecar_path + '.tmp'
+        try:
+            with open(temp_path, 'wb') as sidecar_file:
+                sidecar_file.write(self.SIDECAR_HEADER.pack(self.SIDECAR_MAGIC, size, mtime_ns,
+                                                            in_milliseconds, len(self.offsets)))
+                sidecar_file.write(self.offsets.tobytes())
+                sidecar_file.write(self.timestamps.tobytes())
+                sidecar_file.write(self.values.tobytes())
+            os.replace(temp_path, sidecar_path)
+        except OSError as e:
+            logging.warning("Unable to write the index of {}: {}".format(self.path_obs_file, e))
@@ -0,0 +1,101 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.metrics import MetricsRegistry
+from utils.time_utils import TimeUtils
+
+
+class SensorScheduler(object):
+    """
+    Central scheduler for virtual sensors, used instead of one thread per sensor.
+    The next deadline of every sensor is kept in a heap. A single timer thread pops due sensors and
+    hands them over to a small pool of workers which call VirtualSensor.sense_once().
+    Deadlines are drift-free: next deadline = previous deadline + sensor.next_interval() (i.e., its frequency).
+    """
+
+    def __init__(self, nb_workers=4):
+        self.nb_workers = nb_workers
+        self._heap = list()  # (deadline, sequence number, sensor)
+        self._counter = itertools.count()  # tie-breaker for sensors sharing the same deadline
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=nb_workers, thread_name_prefix="sensor-worker")
+        self._timer_thread = threading.Thread(target=self._run, name="sensor-scheduler", daemon=True)
+
+        # Scheduling statistics (lag = firing time - deadline, in seconds)
+        self._stats_lock = threading.Lock()
+        self.nb_fired = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self._metrics = MetricsRegistry.get_shared_registry()
+
+    def start(self):
+        self._timer_thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify()
+        # The timer thread may still be submitting due sensors: wait for it before shutting down the workers
+        if self._timer_thread.is_alive() and self._timer_thread is not threading.current_thread():
+            self._timer_thread.join()
+        self._executor.shutdown(wait=True)
+
+    def add_sensor(self, sensor, delay=0.0):
+        """
+        Schedule a sensor
+        :param sensor: any object providing sense_once() and next_interval() methods
+        :param delay: the delay (in seconds) before the first call to sense_once()
+        """
+        self._push(time.monotonic() + delay, sensor)
+
+    def nb_scheduled_sensors(self):
+        with self._condition:
+            return len(self._heap)
+
+    def _push(self, deadline, sensor):
+        with self._condition:
+            heapq.heappush(self._heap, (deadline, next(self._counter), sensor))
+            if self._heap[0][2] is sensor:
+                self._condition.notify()  # The earliest deadline has changed
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            due_sensors = list()
+            with self._condition:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                now = time.monotonic()
+                if self._heap[0][0] > now:
+                    self._condition.wait(self._heap[0][0] - now)
+                    continue
+                while self._heap and self._heap[0][0] <= now:
+                    deadline, _, sensor = heapq.heappop(self._heap)
+                    due_sensors.append((deadline, sensor))
+
+            for deadline, sensor in due_sensors:
+                self._executor.submit(self._fire, sensor, deadline)
+
+    def _fire(self, sensor, deadline):
+        lag = time.monotonic() - deadline
+        with self._stats_lock:
+            self.nb_fired += 1
+            self.total_lag += lag
+            if lag > self.max_lag:
+                self.max_lag = lag
+        self._metrics.observe_scheduler_lag(lag)
+
+        try:
+            keep_going = sensor.sense_once()
+        except Exception:
+            logging.exception("Unexpected error while sensing with sensor {}".format(getattr(sensor, 'sensor_id', '')))
+            keep_going = True
+
+        # A sensor is only rescheduled once its previous observation has been handled
+        if keep_going and not self._stop_event.is_set():
+            self._push(TimeUtils.next_deadline(deadline, sensor.next_interval(), time.monotonic()), sensor)
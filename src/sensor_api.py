@@ -0,0 +1,373 @@
+import contextlib
+import fnmatch
+import json
+import threading
+import time
+
+from bottle import request, response
+
+from utils.json_http_response import generate_sensor_representation, generate_api_response, generate_sensor_capabilities
+from utils.metrics import MetricsRegistry
+
+# Routes of the sensor API which are not of the form /<sensor_id>/..., a sensor cannot use them as id
+RESERVED_SENSOR_IDS = ('metrics', 'stats', 'bulk', 'stream')
+
+
+def build_sensor_api(app, sensors):
+    """
+    Register the REST APIs of the virtual sensors on a Bottle application (see also the class virtual_sensor.py)
+    Routes are of the form /<sensor_id>/... and are dispatched to the matching VirtualSensor object
+    :param app: a Bottle object
+    :param sensors: a dict of VirtualSensor objects indexed by sensor_id
+    :returns the Bottle application with the sensor routes
+    :rtype Bottle
+    """
+
+    bulk_lock = threading.Lock()  # bulk changes are applied one request at a time
+
+    def select_sensors(selection):
+        """ Return the ids of the sensors matching a list of ids or a glob pattern (e.g. "sensor_*") """
+        if type(selection) == str:
+            return sorted(sensor_id for sensor_id in list(sensors) if fnmatch.fnmatchcase(sensor_id, selection))
+        return list(dict.fromkeys(selection))  # without duplicates, in the requested order
+
+    def unknown_sensor(sensor_id):
+        response.status = 404
+        return generate_api_response(response,
+                                     result="NOK",
+                                     details="Unknown sensor '{}'".format(sensor_id))
+
+    @app.route('/metrics', method='GET')
+    def get_metrics():
+        """ Return the metrics of all the sensors in the Prometheus text format """
+        response.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        return MetricsRegistry.get_shared_registry().render_prometheus()
+
+    @app.route('/stats', method='GET')
+    def get_all_stats():
+        """ Return the counters of all the sensors of the process, summed """
+        response.set_header('Content-Type', 'application/json; charset=UTF-8')
+        return json.dumps(MetricsRegistry.get_shared_registry().get_totals())
+
+    @app.route('/bulk', method='POST')
+    def set_sensors_bulk():
+        """
+        Apply the same changes to many sensors at once, e.g.:
+        {"sensors": "sensor_*", "changes": {"frequency": 5, "enabled": true, "sensing": true}}
+        "sensors" is either a list of sensor ids or a glob pattern. Changes are only applied if all of them can be
+        applied to all the selected sensors (otherwise nothing is modified). The sensors cannot be modified by other
+        requests in the meantime
+        With "dry_run": true, changes are only checked
+        """
+        try:
+            request_json_body = json.loads(request.body.read().decode('UTF-8'))
+        except ValueError as e:
+            return generate_api_response(response, result="NOK", details="Invalid JSON body: {}".format(e),
+                                         capability="bulk")
+        if type(request_json_body) != dict:
+            request_json_body = dict()
+        selection = request_json_body.get('sensors')
+        changes = request_json_body.get('changes')
+        if type(selection) == list and not all(type(sensor_id) == str for sensor_id in selection):
+            selection = None
+        if type(selection) not in [str, list] or type(changes) != dict or not changes:
+            return generate_api_response(response,
+                                         result="NOK",
+                                         details="A list of sensor ids or a glob pattern and a dict of changes are "
+                                                 "expected. E.g.: {'sensors': 'sensor_*', 'changes': {'frequency': 5}}")
+
+        with bulk_lock, contextlib.ExitStack() as sensor_locks:
+            sensor_ids = select_sensors(selection)
+            errors = ["Unknown sensor '{}'".format(sensor_id) for sensor_id in sensor_ids if sensor_id not in sensors]
+            if not sensor_ids:
+                errors.append("No sensor matches {}".format(selection))
+            # Single-sensor changes wait until all the selected sensors have been checked and modified
+            for sensor_id in sorted(set(sensor_ids)):
+                if sensor_id in sensors:
+                    sensor_locks.enter_context(sensors[sensor_id].changes_lock)
+            if not errors:
+                for sensor_id in sensor_ids:
+                    errors.extend(sensors[sensor_id].check_changes(changes))
+            if errors:
+                if any(sensor_id not in sensors for sensor_id in sensor_ids):
+                    response.status = 404
+                return generate_api_response(response,
+                                             result="NOK",
+                                             details="No change has been applied. " + " ".join(errors),
+                                             capability="bulk")
+
+            if request_json_body.get('dry_run', False):
+                return generate_api_response(response, result="OK", details="Dry run", capability="bulk")
+            old_values = dict()
+            for sensor_id in sensor_ids:
+                old_values[sensor_id] = sensors[sensor_id].apply_changes(changes)
+        return generate_api_response(response,
+                                     result="OK",
+                                     details="",
+                                     capability="bulk",
+                                     old_value=old_values,
+                                     value={sensor_id: changes for sensor_id in sensor_ids})
+
+    @app.route('/stream', method='GET')
+    def stream_sensor_states():
+        """
+        Server-Sent Events stream of the state of the sensors (enabled, sensing, capabilities and battery level).
+        Query parameters: 'sensors' (glob pattern, all sensors by default) and 'interval' (in seconds, 1 by default).
+        The state of every selected sensor is sent first, then only the states that changed, at most once per interval
+        """
+        pattern = request.query.get('sensors', '*')
+        try:
+            interval = max(0.1, float(request.query.get('interval', 1.0)))
+        except ValueError:
+            interval = 1.0
+        response.set_header('Content-Type', 'text/event-stream; charset=UTF-8')
+        response.set_header('Cache-Control', 'no-cache')
+
+        def events():
+            versions = dict()
+            last_event = time.monotonic()
+            while True:
+                changed_states = list()
+                for sensor_id in select_sensors(pattern):
+                    sensor = sensors.get(sensor_id)
+                    if sensor is not None and versions.get(sensor_id) != sensor.state_version:
+                        versions[sensor_id] = sensor.state_version
+                        changed_states.append(sensor.get_state())
+                if changed_states:
+                    last_event = time.monotonic()
+                    yield ''.join('data: {}\n\n'.format(json.dumps(state)) for state in changed_states)
+                elif time.monotonic() - last_event > 15.0:
+                    last_event = time.monotonic()
+                    yield ': keep-alive\n\n'
+                time.sleep(interval)
+        return events()
+
+    @app.route('/<sensor_id>', method='GET')
+    def init_virtual_sensor(sensor_id):
+        """ Return an overview of the specified virtual sensor """
+        sensor = sensors.get(sensor_id)
+        if sensor is None:
+            return unknown_sensor(sensor_id)
+        return generate_sensor_representation(response, sensor)
+
+    @app.route('/<sensor_id>/enabled', method='GET')
+    def get_sensor_enabled(sensor_id):
+        sensor = sensors.get(sensor_id)
+        if sensor is None:
+            return unknown_sensor(sensor_id)
+        json_response = generate_api_response(response,
+                                              result="OK",
+                                              details="",
+                                              capability="enabled",
+                                              old_value="",
+                                              value=sensor.enabled)
+        return json_response
+
+    @app.route('/<sensor_id>/enabled', method='POST')
+    def set_sensor_enabled(sensor_id):
+        sensor = sensors.get(sensor_id)
+        if sensor is None:
+            return unknown_sensor(sensor_id)
+        request_json_body = json.loads(request.body.read().decode('UTF-8'))
+        old_value = sensor.enabled
+        value = request_json_body['value']
+        if type(value) == bool:
+            sensor.enable_sensor(value)
+            json_response = generate_api_response(response,
+                                                  result="OK",
+                                                  details="",
+                                                  capability="enabled",
+                                                  old_value=old_value,
+                                                  value=value)
+        else:
+            json_response = generate_api_response(response,
+                                                  result="NOK",
+                                                  details="Only one boolean is accepted for this POST request. "
+                                                          "E.g.: {'value': true}")
+        return json_response
+
+    @app.route('/<sensor_id>/sensing', method='GET')
+    def get_sensor_sensing(sensor_id):
+        sensor = sensors.get(sensor_id)
+        if sensor is None:
+            return unknown_sensor(sensor_id)
+        json_response = generate_api_response(response,
+                                              result="OK",
+                                              details="",
+                                              capability="sensing",
+                                              old_value="",
+                                              value=sensor.sensing)
+        return json_response
+
+    @app.route('/<sensor_id>/sensing', method='POST')
+    def set_sensor_sensing(sensor_id):
+        sensor = sensors.get(sensor_id)
+        if sensor is None:
+            return unknown_sensor(sensor_id)
+        request_json_body = json.loads(request.body.read().decode('UTF-8'))
+        old_value = sensor.enabled
+        value = request_json_body['value']
+        if type(value) == bool:
+            result, details = sensor.enable_sensing_process(value)
+            json_response = generate_api_response(response,
+                                                  result=result,
+                                                  details=details,
+                                                  capability="sensing",
+                                                  old_value=old_value,
+                                                  value=value)
+        else:
+            json_response = generate_api_response(response,
+                                                  result="NOK",
+                                                  details="Only one boolean is accepted for this POST request. "
+                                                          "E.g.: {'value': true}")
+        return json_response
+
+    @app.route('/<sensor_id>/urlPublishObs', method='GET')
+    def get_sensor_url_publish(sensor_id):
+        sensor = sensors.get(sensor_id)
+        if sensor is None:
+            return unknown_sensor(sensor_id)
+        json_response = generate_api_response(response,
+                                              result="OK",
+                                              details="",
+                                              capability="url_publish_obs",
+                                              old_value="",
+                                              value=sensor.publish_to)
+        return json_response
+
+    @app.route('/<sensor_id>/urlPublishObs', method='POST')
+    def set_sensor_url_publish(sensor_id):
+        sensor = sensors.get(sensor_id)
+        if sensor is None:
+            return unknown_sensor(sensor_id)
+        request_json_body = json.loads(request.body.read().decode('UTF-8'))
+        old_value = sensor.enabled
+        value = request_json_body['value']
+        if type(value) == str:
+            result, details = sensor.set_url_to_publish(value)
+            json_response = generate_api_response(response,
+                                                  result=result,
+                                                  details=details,
+                                                  capability="url_publish_obs",
+                                                  old_value=old_value,
+                                                  value=value)
+        else:
+            json_response = generate_api_response(response,
+                                                  result="NOK",
+                                                  details="Only a well formed URL is accepted for this POST request. "
+                                                          "E.g.: {'value': 'http://localhost:8080'}")
+        return json_response
+
+    @app.route('/<sensor_id>/publishing', method='GET')
+    def get_sensor_publishing_stats(sensor_id):
+        """ Return the publishing statistics (queue depth, drops, publish latency...) of the specified sensor """
+        sensor = sensors.get(sensor_id)
+        if sensor is None:
+            return unknown_sensor(sensor_id)
+        result, details, value = sensor.get_publishing_stats()
+        json_response = generate_api_response(response,
+                                              result=result,
+                                              details=details,
+                                              capability="publishing",
+                                              old_value="",
+                                              value=value)
+        return json_response
+
+    @app.route('/<sensor_id>/stats', method='GET')
+    def get_sensor_stats(sensor_id):
+        """ Return the metrics (observations generated, published, dropped, failed, timings) of the specified sensor """
+        sensor = sensors.get(sensor_id)
+        if sensor is None:
+            return unknown_sensor(sensor_id)
+        result, details, value = sensor.get_stats()
+        json_response = generate_api_response(response,
+                                              result=result,
+                                              details=details,
+                                              capability="stats",
+                                              old_value="",
+                                              value=value)
+        return json_response
+
+    @app.route('/<sensor_id>/replay', method='GET')
+    def get_sensor_replay(sensor_id):
+        """ Return the state of the replay (next line, number of lines, next original timestamp) """
+        sensor = sensors.get(sensor_id)
+        if sensor is None:
+            return unknown_sensor(sensor_id)
+        result, details, value = sensor.get_replay_state()
+        json_response = generate_api_response(response,
+                                              result=result,
+                                              details=details,
+                                              capability="replay",
+                                              old_value="",
+                                              value=value)
+        return json_response
+
+    @app.route('/<sensor_id>/replay', method='POST')
+    def set_sensor_replay(sensor_id):
+        """ Seek the replay to a given line or original timestamp, e.g. {'line': 42} or {'timestamp': 1392246000000} """
+        sensor = sensors.get(sensor_id)
+        if sensor is None:
+            return unknown_sensor(sensor_id)
+        request_json_body = json.loads(request.body.read().decode('UTF-8'))
+        old_value = sensor.get_replay_state()[2]
+        line = request_json_body.get('line')
+        timestamp = request_json_body.get('timestamp')
+        if (type(line) == int and timestamp is None) or (type(timestamp) == int and line is None):
+            result, details = sensor.seek_replay(line=line, timestamp=timestamp)
+            json_response = generate_api_response(response,
+                                                  result=result,
+                                                  details=details,
+                                                  capability="replay",
+                                                  old_value=old_value,
+                                                  value=sensor.get_replay_state()[2])
+        else:
+            json_response = generate_api_response(response,
+                                                  result="NOK",
+                                                  details="Only one integer line or timestamp is accepted for this "
+                                                          "POST request. E.g.: {'timestamp': 1392246000000}")
+        return json_response
+
+    @app.route('/<sensor_id>/capabilities', method='GET')
+    def get_sensor_details(sensor_id):
+        """ Return the different capabilities of the specified virtual sensor """
+        sensor = sensors.get(sensor_id)
+        if sensor is None:
+            return unknown_sensor(sensor_id)
+        return generate_sensor_capabilities(response, sensor)
+
+    @app.route('/<sensor_id>/capabilities/<capability>', method='GET')
+    def get_sensor_capability(sensor_id, capability):
+        """ Method to get a sensor parameter (capability) """
+        sensor = sensors.get(sensor_id)
+        if sensor is None:
+            return unknown_sensor(sensor_id)
+        result, details, value = sensor.get_capability(capability)
+        json_response = generate_api_response(response,
+                                              result=result,
+                                              details=details,
+                                              capability=capability,
+                                              old_value="",
+                                              value=value)
+        return json_response
+
+    @app.route('/<sensor_id>/capabilities/<capability>', method='POST')
+    def set_sensor_capability(sensor_id, capability):
+        """ Method to modify a sensor parameter (capability) """
+        sensor = sensors.get(sensor_id)
+        if sensor is None:
+            return unknown_sensor(sensor_id)
+        request_json_body = json.loads(request.body.read().decode('UTF-8'))
+        result, details, old_value = sensor.get_capability(capability)
+        value = request_json_body['value']
+        if result == "OK":
+            result, details = sensor.set_capability(capability, value)
+        json_response = generate_api_response(response,
+                                              result=result,
+                                              details=details,
+                                              capability=capability,
+                                              old_value=old_value,
+                                              value=value)
+        return json_response
+
+    return app
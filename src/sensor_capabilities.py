@@ -0,0 +1,185 @@
+import math
+import numbers
+import threading
+from collections.abc import Mapping
+
+from edge_processing import EdgeProcessingChain
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Real) and not isinstance(value, bool)
+
+
+class SensorCapabilities(Mapping):
+    """
+    Typed capabilities of a virtual sensor (see etc/capabilities.config), shared by the thread running the sensor
+    and the REST API handlers:
+    -every update is validated (e.g., 'frequency' must be a positive number) and applied under a per-sensor lock
+    -snapshot() returns a consistent copy for the API, drain() consumes battery atomically for the sensing thread
+    -reading a single capability takes no lock
+    It behaves like a read-only dict (capabilities['frequency'], keys(), dict(capabilities)...) and also accepts
+    capabilities[key] = value, which raises a ValueError if the value is invalid.
+    Keys other than the known capabilities are kept as is, without any validation, except the optional
+    'edge_processing' stages (see edge_processing.py, null to publish every observation).
+    Once bound to a row of a FleetState (see bind), the battery level is drained by the fleet and the updates of
+    the capabilities stored in the fleet columns are written through.
+    """
+
+    FIELDS = ('frequency', 'battery_level', 'min_value', 'max_value', 'obs_consumption', 'infinite_battery')
+    FLEET_FIELDS = ('frequency', 'battery_level', 'obs_consumption', 'infinite_battery')
+
+    __slots__ = FIELDS + ('extra', 'fleet', 'fleet_index', '_lock')
+
+    def __init__(self, capabilities):
+        """
+        :param capabilities: a dict of capabilities, e.g. {'frequency': 5, 'battery_level': 100, ...}
+        :raises ValueError if a capability is missing or invalid
+        """
+        self._lock = threading.Lock()
+        self.extra = dict()
+        self.fleet = None
+        self.fleet_index = None
+        missing = [key for key in self.FIELDS if key not in capabilities]
+        if missing:
+            raise ValueError("Missing capabilities: {}".format(", ".join(missing)))
+        errors = self.check_update(capabilities, current=dict())
+        if errors:
+            raise ValueError(" ".join(errors))
+        for key, value in capabilities.items():
+            self._set(key, value)
+
+    def _set(self, key, value):
+        if key in self.FIELDS:
+            setattr(self, key, value)
+            if self.fleet is not None and key in self.FLEET_FIELDS:
+                self.fleet.set_value(self.fleet_index, key, value)
+        else:
+            self.extra[key] = value
+
+    def bind(self, fleet, index):
+        """
+        Store the battery level in a row of a FleetState from now on
+        :param fleet: a FleetState object
+        :param index: the row of the sensor (int)
+        """
+        with self._lock:
+            for key in self.FLEET_FIELDS:
+                fleet.set_value(index, key, getattr(self, key))
+            self.fleet = fleet
+            self.fleet_index = index
+
+    def _get_battery_level(self):
+        if self.fleet is not None:
+            return self.fleet.get_value(self.fleet_index, 'battery_level')
+        return self.battery_level
+
+    @classmethod
+    def check_value(cls, key, value):
+        """
+        :returns the reason why value cannot be assigned to the capability key (None if it can)
+        :rtype str
+        """
+        if key == 'infinite_battery':
+            if type(value) != bool:
+                return "Only booleans are accepted for 'infinite_battery'"
+        elif key == 'edge_processing':
+            if value is not None:
+                return EdgeProcessingChain.check_config(value)
+        elif key in cls.FIELDS:
+            if not _is_number(value):
+                return "Only numbers are accepted for '{}'".format(key)
+            if not math.isfinite(value):  # NaN or infinity would break the deadlines and the battery drain
+                return "Only finite numbers are accepted for '{}'".format(key)
+            if key == 'frequency' and value <= 0:
+                return "'frequency' should be strictly positive"
+            if key in ['battery_level', 'obs_consumption'] and value < 0:
+                return "'{}' should be positive".format(key)
+        return None
+
+    def check_update(self, changes, current=None):
+        """
+        Check a set of new capability values, alone and together (e.g., 'min_value' <= 'max_value')
+        :param changes: a dict of new values, indexed by capability
+        :param current: the values to complete changes with (the current capabilities by default)
+        :returns the list of the reasons why the changes cannot be applied (empty if they can)
+        :rtype list
+        """
+        errors = list()
+        for key, value in changes.items():
+            error = self.check_value(key, value)
+            if error is not None:
+                errors.append(error)
+        if not errors:
+            if current is None:
+                current = self
+            min_value = changes.get('min_value', current.get('min_value'))
+            max_value = changes.get('max_value', current.get('max_value'))
+            if min_value is not None and max_value is not None and min_value > max_value:
+                errors.append("'min_value' should be lower than 'max_value'")
+        return errors
+
+    def update(self, changes):
+        """
+        Atomically apply a set of new capability values (all of them or none)
+        :param changes: a dict of new values, indexed by capability
+        :returns the previous values of the modified capabilities
+        :rtype dict
+        :raises ValueError if one of the values is invalid
+        """
+        with self._lock:
+            errors = self.check_update(changes)
+            if errors:
+                raise ValueError(" ".join(errors))
+            old_values = dict()
+            for key, value in changes.items():
+                old_values[key] = self.get(key)
+                self._set(key, value)
+            return old_values
+
+    def drain(self):
+        """
+        Consume the battery needed by one observation, if there is enough battery left (or if it is infinite)
+        :returns the new battery level, or None if the battery is too low to sense
+        :rtype float
+        """
+        with self._lock:
+            if self.fleet is not None:
+                return self.fleet.drain_one(self.fleet_index)
+            level = self.battery_level - self.obs_consumption
+            if self.infinite_battery or level > 0.0:
+                self.battery_level = level
+                return level
+            return None
+
+    def snapshot(self):
+        """
+        :returns a consistent copy of the capabilities, e.g. to render them as JSON
+        :rtype dict
+        """
+        with self._lock:
+            values = {key: getattr(self, key) for key in self.FIELDS}
+            values['battery_level'] = self._get_battery_level()
+            values.update(self.extra)
+        return values
+
+    def __getitem__(self, key):
+        if key == 'battery_level':
+            return self._get_battery_level()
+        if key in self.FIELDS:
+            return getattr(self, key)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        self.update({key: value})
+
+    def __contains__(self, key):
+        return key in self.FIELDS or key in self.extra
+
+    def __iter__(self):
+        return iter(self.FIELDS + tuple(self.extra))
+
+    def __len__(self):
+        return len(self.FIELDS) + len(self.extra)
+
+    def __repr__(self):
+        return "SensorCapabilities({})".format(self.snapshot())
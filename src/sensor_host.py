@@ -0,0 +1,155 @@
+import copy
+import json
+import logging
+import random
+import sys
+import threading
+
+from bottle import Bottle
+
+from api_server import run_api_server
+from publishers.publisher_factory import create_publisher
+from scheduler import SensorScheduler
+from sensor_api import build_sensor_api, RESERVED_SENSOR_IDS
+from virtual_sensor import VirtualSensor
+
+
+class SensorHost(object):
+    """
+    Multi-sensor host: run many virtual sensors inside a single process.
+    All sensors share one Bottle application (routes of the form /<sensor_id>/...), one publisher per mode
+    and one SensorScheduler (instead of one thread per sensor).
+    With "scheduler": "FLEET", sensors are driven by a FleetScheduler instead: battery and deadlines of all the
+    sensors are kept in arrays and updated by vectorized operations (requires NumPy).
+    With "nb_processes" different from 1, sensors are sharded across several processes (see SensorSupervisor).
+    The manifest is a JSON file formatted as follows:
+    {
+      "nb_workers": 4,
+      "scheduler": "HEAP",
+      "defaults": {"mode": "KAFKA", "publish_to": "temperature", "obs_generation_mode": "RANDOM"},
+      "sensors": [
+        {"sensor_id": "sensor01", "obs_generation_mode": "[-5,5]", "trust": 50},
+        {"sensor_id_prefix": "sensor_", "count": 1000, "capabilities": {"frequency": 5}}
+      ]
+    }
+    Each entry may override any key of etc/sensor.config and, under "capabilities", of etc/capabilities.config
+    Sensor ids cannot be one of the routes metrics, stats, bulk and stream
+    """
+
+    def __init__(self, manifest, base_config, base_capabilities):
+        self.manifest = manifest
+        self.base_config = base_config
+        self.base_capabilities = base_capabilities
+        self.sensors = dict()
+        self.publishers = dict()  # one shared publisher per mode (KAFKA or REST)
+        self.app = build_sensor_api(Bottle(), self.sensors)
+        if self.manifest.get('scheduler', 'HEAP') == 'FLEET':
+            from fleet_state import FleetScheduler  # requires NumPy
+            self.scheduler = FleetScheduler(tick_interval=float(self.manifest.get('fleet_tick_interval', 0.01)))
+        else:
+            self.scheduler = SensorScheduler(nb_workers=int(self.manifest.get('nb_workers', 4)))
+
+    def expand_manifest(self):
+        """
+        Expand the manifest entries into one (sensor_id, config, capabilities) tuple per sensor
+        :returns a list of sensor definitions
+        :rtype list
+        """
+        defaults = self.manifest.get('defaults', dict())
+        definitions = list()
+        for entry in self.manifest['sensors']:
+            entry = dict(defaults, **entry)
+            if 'sensor_id_prefix' in entry:
+                sensor_ids = ['{}{}'.format(entry['sensor_id_prefix'], i) for i in range(int(entry['count']))]
+            else:
+                sensor_ids = [str(entry['sensor_id'])]
+
+            capabilities_overrides = entry.pop('capabilities', dict())
+            for key in ['sensor_id', 'sensor_id_prefix', 'count']:
+                entry.pop(key, None)
+
+            for sensor_id in sensor_ids:
+                if sensor_id in RESERVED_SENSOR_IDS:
+                    logging.error("Sensor id '{}' is reserved by the REST API, skipping it".format(sensor_id))
+                    continue
+                config = copy.deepcopy(self.base_config)
+                config.update(entry)
+                if config['obs_generation_mode'] == 'ADAPTER':
+                    config['trust'] = 100
+                capabilities = copy.deepcopy(self.base_capabilities)
+                capabilities.update(capabilities_overrides)
+                definitions.append((sensor_id, config, capabilities))
+        return definitions
+
+    def get_publisher(self, mode, config):
+        """
+        Return the publisher shared by all sensors using the specified mode
+        :param mode: str ("KAFKA" or "REST")
+        :param config: the configuration of the first sensor using this mode (dict)
+        """
+        if mode not in self.publishers:
+            self.publishers[mode] = create_publisher(mode, config, "virtual-sensor-host")
+        return self.publishers[mode]
+
+    def deploy_sensors(self, definitions=None):
+        """
+        Create and start every virtual sensor described in the manifest
+        :param definitions: the (sensor_id, config, capabilities) tuples of the sensors to deploy, if only a part of
+        the manifest should be deployed (see SensorSupervisor)
+        """
+        if definitions is None:
+            definitions = self.expand_manifest()
+        for sensor_id, config, capabilities in definitions:
+            if sensor_id in self.sensors:
+                logging.error("Duplicate sensor '{}' in manifest, skipping it".format(sensor_id))
+                continue
+            if config['obs_generation_mode'] == 'ADAPTER' and config['adapter_file'] == 'hint_rabbitmq':
+                logging.error("Sensor '{}': the hint_rabbitmq adapter cannot be hosted, skipping it".format(sensor_id))
+                continue
+            sensor = VirtualSensor(sensor_id=sensor_id)
+            self.sensors[sensor_id] = sensor
+            sensor.set_config(enabled=True,
+                              config=config,
+                              mode=config['mode'],
+                              capabilities=capabilities,
+                              publisher=self.get_publisher(config['mode'], config),
+                              scheduler=self.scheduler,
+                              delay=random.uniform(0.0, float(capabilities['frequency'])))  # spread the load
+        # Started once all the sensors are registered, e.g. to the shared reader of a dataset file (DATASET mode)
+        self.scheduler.start()
+        logging.warning("{} virtual sensors successfully deployed".format(len(self.sensors)))
+
+    def close(self):
+        self.scheduler.stop()
+        for sensor in list(self.sensors.values()):
+            sensor.stop()  # publishes the pending observations of the edge processing stages
+        for publisher in self.publishers.values():
+            if publisher is not None:
+                publisher.flush()
+                publisher.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+
+    if len(sys.argv) != 2:
+        print('Usage: python3 sensor_host.py PATH-TO-MANIFEST')
+        exit()
+
+    with open('../etc/sensor.config') as config_file:
+        config = json.load(config_file)
+    with open('../etc/capabilities.config') as capabilities_file:
+        capabilities = json.load(capabilities_file)
+    with open(sys.argv[1]) as manifest_file:
+        manifest = json.load(manifest_file)
+
+    if manifest.get('nb_processes', 1) != 1:
+        from supervisor import SensorSupervisor
+        supervisor = SensorSupervisor(manifest, config, capabilities)
+        supervisor.start()
+        run_api_server(app=supervisor.app, host="0.0.0.0", port=8080, server=config.get('api_server', 'threaded'))
+    else:
+        host = SensorHost(manifest, config, capabilities)
+        threading.Thread(target=run_api_server, kwargs=dict(app=host.app, host="0.0.0.0", port=8080,
+                                                            server=config.get('api_server', 'threaded'))).start()
+        host.deploy_sensors()
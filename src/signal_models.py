@@ -0,0 +1,170 @@
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class SignalModel(object):
+    """
+    Base class of the signal models, which transform whole blocks of values at once.
+    Values are NumPy arrays whose last axis is the time (one row per sensor for 2-D blocks).
+    Models are stateful so that consecutive blocks form a continuous signal.
+    """
+
+    def apply(self, times, values, rng):
+        """
+        :param times: the time of each sample since the start of the signal (array, in seconds)
+        :param values: the values produced by the previous models (array)
+        :param rng: a numpy.random.Generator
+        :returns the new values (array, NaN for missing observations)
+        """
+        raise NotImplementedError("Should have implemented this")
+
+
+class SinusoidalBaseline(SignalModel):
+    """ offset + amplitude * sin(2 * pi * t / period + phase), e.g. a daily temperature cycle """
+
+    def __init__(self, amplitude=1.0, period=86400.0, offset=0.0, phase=0.0):
+        self.amplitude = float(amplitude)
+        self.period = float(period)
+        self.offset = float(offset)
+        self.phase = float(phase)
+
+    def apply(self, times, values, rng):
+        return values + self.offset + self.amplitude * numpy.sin(2 * math.pi * times / self.period + self.phase)
+
+
+class RandomWalk(SignalModel):
+    """ Cumulative sum of Gaussian steps of standard deviation step_std """
+
+    def __init__(self, step_std=0.1, start=0.0):
+        self.step_std = float(step_std)
+        self.level = float(start)
+
+    def apply(self, times, values, rng):
+        walk = self.level + numpy.cumsum(rng.normal(0.0, self.step_std, size=values.shape), axis=-1)
+        self.level = walk[..., -1]
+        return values + walk
+
+
+class GaussianNoise(SignalModel):
+    """ Additive Gaussian noise of standard deviation std """
+
+    def __init__(self, std=0.1):
+        self.std = float(std)
+
+    def apply(self, times, values, rng):
+        return values + rng.normal(0.0, self.std, size=values.shape)
+
+
+class StuckAt(SignalModel):
+    """ With a given probability per sample, the sensor gets stuck at its current value for duration samples """
+
+    def __init__(self, probability=0.001, duration=10):
+        self.probability = float(probability)
+        self.duration = int(duration)
+        self.remaining = 0  # number of samples still stuck from the previous block
+        self.stuck_value = 0.0
+
+    def apply(self, times, values, rng):
+        nb_samples = values.shape[-1]
+        indexes = numpy.broadcast_to(numpy.arange(nb_samples), values.shape)
+        starts = rng.random(values.shape) < self.probability
+
+        # For every sample, the index of the latest fault start (or -inf if none)
+        last_start = numpy.maximum.accumulate(numpy.where(starts, indexes, -nb_samples - self.duration), axis=-1)
+        stuck = indexes - last_start < self.duration
+
+        # Samples still stuck because of a fault started in a previous block
+        carried = indexes < numpy.expand_dims(numpy.asarray(self.remaining), -1)
+        values = numpy.where(carried, numpy.expand_dims(numpy.asarray(self.stuck_value), -1), values)
+
+        result = numpy.where(stuck, numpy.take_along_axis(values, numpy.maximum(last_start, 0), axis=-1), values)
+        self.remaining = numpy.maximum(numpy.maximum(last_start[..., -1] + self.duration, self.remaining) - nb_samples, 0)
+        self.stuck_value = result[..., -1]
+        return result
+
+
+class Spikes(SignalModel):
+    """ With a given probability per sample, adds a spike of +/- magnitude """
+
+    def __init__(self, probability=0.01, magnitude=10.0):
+        self.probability = float(probability)
+        self.magnitude = float(magnitude)
+
+    def apply(self, times, values, rng):
+        spikes = rng.random(values.shape) < self.probability
+        signs = numpy.where(rng.random(values.shape) < 0.5, -1.0, 1.0)
+        return values + spikes * signs * self.magnitude
+
+
+class Dropouts(SignalModel):
+    """ With a given probability per sample, the observation is lost (NaN) """
+
+    def __init__(self, probability=0.01):
+        self.probability = float(probability)
+
+    def apply(self, times, values, rng):
+        return numpy.where(rng.random(values.shape) < self.probability, numpy.nan, values)
+
+
+class BiasDrift(SignalModel):
+    """ Bias that grows linearly with time (rate per second) """
+
+    def __init__(self, rate=0.0001):
+        self.rate = float(rate)
+
+    def apply(self, times, values, rng):
+        return values + self.rate * times
+
+
+SIGNAL_MODELS = {
+    'sinusoidal': SinusoidalBaseline,
+    'random_walk': RandomWalk,
+    'gaussian_noise': GaussianNoise,
+    'stuck_at': StuckAt,
+    'spikes': Spikes,
+    'dropouts': Dropouts,
+    'bias_drift': BiasDrift,
+}
+
+
+class SignalModelChain(object):
+    """
+    Chain of signal models built from the 'signal_models' key of the etc/sensor.config file, e.g.:
+    [{"type": "sinusoidal", "amplitude": 5, "period": 86400, "offset": 20},
+     {"type": "gaussian_noise", "std": 0.5},
+     {"type": "dropouts", "probability": 0.01}]
+    Available types: sinusoidal, random_walk, gaussian_noise, stuck_at, spikes, dropouts and bias_drift
+    """
+
+    def __init__(self, models_config, seed=None):
+        if numpy is None:
+            raise ImportError("Signal models require NumPy")
+        self.models = list()
+        for model_config in models_config:
+            model_config = dict(model_config)
+            model_type = model_config.pop('type')
+            if model_type not in SIGNAL_MODELS:
+                raise ValueError("Unknown signal model '{}'".format(model_type))
+            self.models.append(SIGNAL_MODELS[model_type](**model_config))
+        self.rng = numpy.random.default_rng(seed)
+        self.elapsed = 0.0  # time of the next sample since the start of the signal (in seconds)
+
+    def generate_block(self, nb_samples, sample_period, base_values=None):
+        """
+        Generate the next block of the signal
+        :param nb_samples: the number of samples (int)
+        :param sample_period: the delay between two samples (float, in seconds)
+        :param base_values: optional values to transform, of shape (nb_samples,) or (nb_sensors, nb_samples)
+        :returns the values, NaN for missing observations
+        :rtype numpy.ndarray
+        """
+        times = self.elapsed + sample_period * numpy.arange(nb_samples)
+        self.elapsed += sample_period * nb_samples
+        values = numpy.zeros(nb_samples) if base_values is None else numpy.asarray(base_values, dtype=float)
+        for model in self.models:
+            values = model.apply(times, values, self.rng)
+        return values
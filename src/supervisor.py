@@ -0,0 +1,353 @@
+import fnmatch
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from bottle import Bottle, HTTPResponse, request, response
+
+from api_server import run_api_server
+from sensor_host import SensorHost
+from utils.json_http_response import generate_api_response
+from utils.metrics import merge_prometheus
+
+
+def shard_of(sensor_id, nb_shards):
+    """ :returns the index of the worker process hosting the specified sensor (stable across restarts) """
+    return zlib.crc32(sensor_id.encode('UTF-8')) % nb_shards
+
+
+def run_shard(port, manifest, base_config, base_capabilities, definitions, setup=None):
+    """
+    Entry point of a worker process: host a shard of the sensors (see SensorHost) and serve their REST API on
+    127.0.0.1:port until the process receives SIGTERM
+    :param definitions: the (sensor_id, config, capabilities) tuples of the sensors of the shard
+    :param setup: an optional function called first (e.g. by benchmarks, to replace the Kafka producer)
+    """
+    logging.basicConfig(level=logging.WARNING)
+    if setup is not None:
+        setup()
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+
+    host = SensorHost(manifest, base_config, base_capabilities)
+    threading.Thread(target=run_api_server, kwargs=dict(app=host.app, host="127.0.0.1", port=port,
+                                                        server=base_config.get('api_server', 'threaded')),
+                     daemon=True).start()
+    host.deploy_sensors(definitions)
+    stop_event.wait()
+    host.close()
+
+
+class SensorSupervisor(object):
+    """
+    Multi-process host: the sensors of a manifest are sharded across nb_processes worker processes (by CRC32 of
+    their sensor_id), so that a container is not limited to one core by the GIL.
+    Each worker is a SensorHost with its own scheduler and publishers, serving its REST API on
+    127.0.0.1:worker_base_port+i. The supervisor serves the only public REST API:
+    -/<sensor_id>/... requests are proxied to the worker hosting the sensor
+    -GET /metrics and GET /stats merge the metrics of all the workers
+    -POST /bulk is checked by all the concerned workers (dry run) before being applied
+    -GET /stream merges the state streams of the workers
+    Workers which die are restarted (with the initial state of their sensors).
+    Manifest keys: "nb_processes" (0 for one process per CPU) and "worker_base_port" (8100 by default)
+    """
+
+    def __init__(self, manifest, base_config, base_capabilities, setup=None):
+        self.manifest = manifest
+        self.base_config = base_config
+        self.base_capabilities = base_capabilities
+        self.setup = setup
+        self.nb_processes = int(manifest.get('nb_processes', 0)) or os.cpu_count() or 1
+        self.base_port = int(manifest.get('worker_base_port', 8100))
+        self.timeout = float(base_config.get('rest_timeout', 2.0))
+
+        self.shards = [list() for _ in range(self.nb_processes)]  # sensor definitions of each worker
+        self.owners = dict()  # sensor_id -> index of the worker hosting it
+        for sensor_id, config, capabilities in SensorHost(manifest, base_config, base_capabilities).expand_manifest():
+            if sensor_id in self.owners:
+                logging.error("Duplicate sensor '{}' in manifest, skipping it".format(sensor_id))
+                continue
+            shard = shard_of(sensor_id, self.nb_processes)
+            self.owners[sensor_id] = shard
+            self.shards[shard].append((sensor_id, config, capabilities))
+        self.shard_urls = ['http://127.0.0.1:{}'.format(self.base_port + i) for i in range(self.nb_processes)]
+
+        self.processes = [None] * self.nb_processes
+        self._context = multiprocessing.get_context('spawn')
+        self._stop_event = threading.Event()
+        self._sessions = threading.local()  # one keep-alive session per proxy thread
+        self._executor = ThreadPoolExecutor(max_workers=self.nb_processes, thread_name_prefix="supervisor")
+        self._bulk_lock = threading.Lock()
+        self.nb_restarts = 0
+        self.app = self.build_api(Bottle())
+
+    def start(self, startup_timeout=60.0):
+        """ Start the worker processes and wait until their REST APIs answer """
+        for shard in range(self.nb_processes):
+            self._start_worker(shard)
+        for shard in range(self.nb_processes):
+            self._wait_for_worker(shard, startup_timeout)
+        threading.Thread(target=self._monitor, name="supervisor-monitor", daemon=True).start()
+        logging.warning("{} virtual sensors deployed in {} processes".format(len(self.owners), self.nb_processes))
+
+    def stop(self):
+        self._stop_event.set()
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()  # SIGTERM: the worker flushes its publishers
+        for process in self.processes:
+            if process is not None:
+                process.join(10.0)
+
+    def _start_worker(self, shard):
+        process = self._context.Process(target=run_shard,
+                                        args=(self.base_port + shard, self.manifest, self.base_config,
+                                              self.base_capabilities, self.shards[shard], self.setup),
+                                        name="sensor-shard-{}".format(shard),
+                                        daemon=True)
+        process.start()
+        self.processes[shard] = process
+
+    def _wait_for_worker(self, shard, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self.processes[shard].is_alive():
+                raise RuntimeError("Worker process {} exited with code {}".format(shard,
+                                                                                  self.processes[shard].exitcode))
+            try:
+                if self._session().get(self.shard_urls[shard] + '/stats', timeout=self.timeout).status_code == 200:
+                    return
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(0.1)
+        raise RuntimeError("Worker process {} did not start within {} seconds".format(shard, timeout))
+
+    def _monitor(self):
+        while not self._stop_event.wait(1.0):
+            for shard, process in enumerate(self.processes):
+                if not process.is_alive() and not self._stop_event.is_set():
+                    logging.error("Worker process {} exited with code {}, restarting it".format(shard,
+                                                                                             process.exitcode))
+                    self.nb_restarts += 1
+                    process.join()  # reap the dead process before replacing it
+                    self._start_worker(shard)
+
+    def _session(self):
+        session = getattr(self._sessions, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.trust_env = False  # workers are local, never use a proxy
+            self._sessions.session = session
+        return session
+
+    def _call_workers(self, shards, method, path, json_body=None):
+        """
+        Send the same request to several workers concurrently
+        :returns the responses (or exceptions), indexed by worker
+        :rtype dict
+        """
+        def call(shard):
+            try:
+                return self._session().request(method, self.shard_urls[shard] + path, json=json_body,
+                                               timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                return e
+        return dict(zip(shards, self._executor.map(call, shards)))
+
+    def select_sensors(self, selection):
+        """ Return the ids of the sensors matching a list of ids or a glob pattern (e.g. "sensor_*") """
+        if type(selection) == str:
+            return sorted(sensor_id for sensor_id in self.owners if fnmatch.fnmatchcase(sensor_id, selection))
+        return list(dict.fromkeys(selection))  # without duplicates, in the requested order
+
+    def get_stats(self):
+        """
+        :returns the counters of all the workers summed, and the counters of each worker
+        :rtype dict
+        """
+        totals = {'nb_processes': self.nb_processes, 'nb_restarts': self.nb_restarts, 'workers': list()}
+        for shard, worker_response in sorted(self._call_workers(range(self.nb_processes), 'GET', '/stats').items()):
+            if isinstance(worker_response, Exception) or worker_response.status_code != 200:
+                totals['workers'].append({'shard': shard, 'error': str(worker_response)})
+                continue
+            worker_stats = worker_response.json()
+            totals['workers'].append(dict(worker_stats, shard=shard, pid=self.processes[shard].pid))
+            for key, value in worker_stats.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def build_api(self, app):
+        """
+        Register the public REST API of the supervisor on a Bottle application (same routes as build_sensor_api)
+        :rtype Bottle
+        """
+
+        @app.route('/metrics', method='GET')
+        def get_metrics():
+            texts = [worker_response.text for worker_response in
+                     self._call_workers(range(self.nb_processes), 'GET', '/metrics').values()
+                     if not isinstance(worker_response, Exception) and worker_response.status_code == 200]
+            response.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            return merge_prometheus(texts)
+
+        @app.route('/stats', method='GET')
+        def get_all_stats():
+            response.set_header('Content-Type', 'application/json; charset=UTF-8')
+            return json.dumps(self.get_stats())
+
+        @app.route('/bulk', method='POST')
+        def set_sensors_bulk():
+            try:
+                request_json_body = json.loads(request.body.read().decode('UTF-8'))
+            except ValueError as e:
+                return generate_api_response(response, result="NOK", details="Invalid JSON body: {}".format(e),
+                                             capability="bulk")
+            if type(request_json_body) != dict:
+                request_json_body = dict()
+            selection = request_json_body.get('sensors')
+            if type(selection) == list and not all(type(sensor_id) == str for sensor_id in selection):
+                selection = None
+            if type(selection) not in [str, list]:
+                return generate_api_response(response,
+                                             result="NOK",
+                                             details="A list of sensor ids or a glob pattern and a dict of changes "
+                                                     "are expected. E.g.: {'sensors': 'sensor_*', "
+                                                     "'changes': {'frequency': 5}}")
+            sensor_ids = self.select_sensors(selection)
+            unknown_ids = [sensor_id for sensor_id in sensor_ids if sensor_id not in self.owners]
+            if unknown_ids or not sensor_ids:
+                if unknown_ids:
+                    response.status = 404
+                errors = ["Unknown sensor '{}'".format(sensor_id) for sensor_id in unknown_ids] or \
+                         ["No sensor matches {}".format(selection)]
+                return generate_api_response(response,
+                                             result="NOK",
+                                             details="No change has been applied. " + " ".join(errors),
+                                             capability="bulk")
+
+            shard_sensors = dict()
+            for sensor_id in sensor_ids:
+                shard_sensors.setdefault(self.owners[sensor_id], list()).append(sensor_id)
+
+            def send(dry_run):
+                def call(shard):
+                    body = dict(request_json_body, sensors=shard_sensors[shard], dry_run=dry_run)
+                    try:
+                        return shard, self._session().post(self.shard_urls[shard] + '/bulk', json=body,
+                                                           timeout=self.timeout).json()
+                    except (requests.exceptions.RequestException, ValueError) as e:
+                        return shard, {'result': "NOK", 'additional_details': "Worker {}: {}".format(shard, e)}
+                return list(self._executor.map(call, list(shard_sensors)))
+
+            with self._bulk_lock:
+                results = send(dry_run=True)
+                errors = [result['additional_details'] for _, result in results if result['result'] != "OK"]
+                if not errors and not request_json_body.get('dry_run', False):
+                    results = send(dry_run=False)
+                    errors = [result['additional_details'] for _, result in results if result['result'] != "OK"]
+            if errors:
+                return generate_api_response(response, result="NOK", details=" ".join(errors), capability="bulk")
+            old_values = dict()
+            values = dict()
+            for _, result in results:
+                if type(result['old_value']) == dict:
+                    old_values.update(result['old_value'])
+                    values.update(result['value'])
+            return generate_api_response(response,
+                                         result="OK",
+                                         details="Dry run" if request_json_body.get('dry_run', False) else "",
+                                         capability="bulk",
+                                         old_value=old_values,
+                                         value=values)
+
+        @app.route('/stream', method='GET')
+        def stream_sensor_states():
+            pattern = request.query.get('sensors', '*')
+            params = dict(request.query.decode())  # the request object cannot be used by other threads
+            shards = sorted(set(self.owners[sensor_id] for sensor_id in self.select_sensors(pattern)))
+            events = queue.Queue(maxsize=10000)
+            worker_responses = list()
+            responses_lock = threading.Lock()
+            client_gone = threading.Event()  # set when the client disconnects, stops the forward threads
+
+            def forward(shard):
+                try:
+                    worker_response = self._session().get(self.shard_urls[shard] + '/stream',
+                                                          params=params, stream=True,
+                                                          timeout=(self.timeout, None))
+                    with responses_lock:
+                        if client_gone.is_set():  # the client disconnected while connecting to the worker
+                            worker_response.close()
+                            return
+                        worker_responses.append(worker_response)
+                    event = list()
+                    for line in worker_response.iter_lines(chunk_size=1, decode_unicode=True):
+                        if line:
+                            event.append(line)
+                        elif event:
+                            while not client_gone.is_set():
+                                try:
+                                    events.put('\n'.join(event) + '\n\n', timeout=1.0)
+                                    break
+                                except queue.Full:
+                                    pass
+                            event = list()
+                except (requests.exceptions.RequestException, AttributeError, ValueError):
+                    pass  # the client disconnected (the response has been closed) or the worker died
+
+            for shard in shards:
+                threading.Thread(target=forward, args=(shard,), name="stream-{}".format(shard), daemon=True).start()
+            response.set_header('Content-Type', 'text/event-stream; charset=UTF-8')
+            response.set_header('Cache-Control', 'no-cache')
+
+            def merged_events():
+                try:
+                    while True:
+                        try:
+                            yield events.get(timeout=15.0)
+                        except queue.Empty:
+                            yield ': keep-alive\n\n'
+                finally:
+                    with responses_lock:
+                        client_gone.set()
+                        for worker_response in worker_responses:
+                            worker_response.close()
+            return merged_events()
+
+        @app.route('/<sensor_id>', method=['GET', 'POST'])
+        @app.route('/<sensor_id>/<path:path>', method=['GET', 'POST'])
+        def proxy(sensor_id, path=''):
+            """ Forward the request to the worker hosting the sensor """
+            shard = self.owners.get(sensor_id)
+            if shard is None:
+                response.status = 404
+                return generate_api_response(response,
+                                             result="NOK",
+                                             details="Unknown sensor '{}'".format(sensor_id))
+            url = self.shard_urls[shard] + request.path
+            if request.query_string:
+                url += '?' + request.query_string
+            headers = {'Content-Type': request.content_type} if request.content_type else None
+            try:
+                worker_response = self._session().request(request.method, url, data=request.body.read(),
+                                                          headers=headers, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                response.status = 503
+                return generate_api_response(response,
+                                             result="NOK",
+                                             details="Worker {} hosting sensor '{}' is unavailable: {}".format(
+                                                 shard, sensor_id, e))
+            return HTTPResponse(body=worker_response.content,
+                                status=worker_response.status_code,
+                                headers={'Content-Type': worker_response.headers.get('Content-Type',
+                                                                                     'application/json')})
+
+        return app
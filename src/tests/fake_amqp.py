@@ -0,0 +1,186 @@
+import heapq
+import itertools
+import queue
+import threading
+import time
+
+
+class FakeIOLoop(object):
+    """ In-process stand-in of the pika IOLoop: callbacks and timers run in the thread which called start() """
+
+    def __init__(self):
+        self._callbacks = queue.Queue()
+        self._timers = list()  # heap of (deadline, sequence number, callback)
+        self._sequence = itertools.count()
+        self._stopped = False
+
+    def start(self):
+        while not self._stopped:
+            now = time.monotonic()
+            while self._timers and self._timers[0][0] <= now:
+                callback = heapq.heappop(self._timers)[2]
+                if callback is not None:
+                    callback()
+            wait = 0.05 if not self._timers else max(0.0, min(0.05, self._timers[0][0] - now))
+            try:
+                self._callbacks.get(timeout=wait)()
+            except queue.Empty:
+                pass
+
+    def stop(self):
+        self._stopped = True
+        self._callbacks.put(lambda: None)  # wake up start()
+
+    def add_callback_threadsafe(self, callback):
+        self._callbacks.put(callback)
+
+    def call_later(self, delay, callback):
+        timer = [time.monotonic() + delay, next(self._sequence), callback]
+        heapq.heappush(self._timers, timer)
+        return timer
+
+    def remove_timeout(self, timer):
+        timer[2] = None
+
+
+class FakeChannel(object):
+    """ Stand-in of a pika Channel, recording QoS, acknowledgements and negative acknowledgements """
+
+    def __init__(self, broker, connection):
+        self.broker = broker
+        self.connection = connection
+        self.is_open = True
+        self.prefetch_count = None
+        self.on_message_callback = None
+        self.acks = list()  # (delivery_tag, multiple)
+        self.nacks = list()  # (delivery_tag, multiple, requeue)
+        self.unacked = dict()  # delivery_tag -> body
+        self._close_callbacks = list()
+        self._delivery_tags = itertools.count(1)
+
+    def add_on_close_callback(self, callback):
+        self._close_callbacks.append(callback)
+
+    def basic_qos(self, prefetch_count=0, callback=None):
+        self.prefetch_count = prefetch_count
+        if callback is not None:
+            callback(None)
+
+    def basic_consume(self, queue_name, on_message_callback):
+        self.on_message_callback = on_message_callback
+        self.broker.dispatch(self)
+
+    def deliver(self, body):
+        delivery_tag = next(self._delivery_tags)
+        self.unacked[delivery_tag] = body
+        method_frame = type('Method', (object,), {'delivery_tag': delivery_tag})()
+        self.on_message_callback(self, method_frame, None, body)
+
+    def _settle(self, delivery_tag, multiple):
+        tags = [tag for tag in self.unacked if tag <= delivery_tag] if multiple else [delivery_tag]
+        return [self.unacked.pop(tag) for tag in sorted(tags)]
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        self.acks.append((delivery_tag, multiple))
+        self.broker.acked.extend(self._settle(delivery_tag, multiple))
+        self.broker.dispatch(self)
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        self.nacks.append((delivery_tag, multiple, requeue))
+        bodies = self._settle(delivery_tag, multiple)
+        if requeue:
+            self.broker.requeue(bodies)
+        self.broker.dispatch(self)
+
+    def close(self, reason):
+        self.is_open = False
+        self.broker.requeue([self.unacked.pop(tag) for tag in sorted(self.unacked)])
+        for callback in self._close_callbacks:
+            callback(self, reason)
+
+
+class FakeConnection(object):
+    """ Stand-in of a pika SelectConnection, opened (or refused) by a FakeBroker """
+
+    def __init__(self, broker, parameters, on_open_callback=None, on_open_error_callback=None,
+                 on_close_callback=None):
+        self.broker = broker
+        self.ioloop = FakeIOLoop()
+        self.is_closed = False
+        self.is_closing = False
+        self.channels = list()
+        self._on_close_callback = on_close_callback
+        if broker.nb_refused_connections > 0:
+            broker.nb_refused_connections -= 1
+            self.is_closed = True
+            self.ioloop.add_callback_threadsafe(lambda: on_open_error_callback(self, "Connection refused"))
+        else:
+            self.ioloop.add_callback_threadsafe(lambda: on_open_callback(self))
+
+    def channel(self, on_open_callback=None):
+        channel = FakeChannel(self.broker, self)
+        self.channels.append(channel)
+        self.broker.channel = channel
+        on_open_callback(channel)
+        return channel
+
+    def close(self, reason="Closed by the client"):
+        if self.is_closed or self.is_closing:
+            return
+        self.is_closing = True
+        for channel in self.channels:
+            if channel.is_open:
+                channel.close(reason)
+        self.is_closing = False
+        self.is_closed = True
+        self._on_close_callback(self, reason)
+
+
+class FakeBroker(object):
+    """
+    In-process AMQP stand-in with a single queue, for tests of the RabbitMQ adapters.
+    Messages are delivered to the consumer of the last opened channel, at most prefetch_count unacknowledged
+    messages at a time. Unacknowledged messages are requeued when their channel is closed or negatively
+    acknowledged (with requeue), and redelivered.
+    Use broker.connect as the connection factory of an adapter.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pending = list()  # bodies of the messages waiting for delivery
+        self.acked = list()  # bodies of the acknowledged messages
+        self.connections = list()
+        self.channel = None
+        self.nb_refused_connections = 0
+
+    def connect(self, parameters, on_open_callback=None, on_open_error_callback=None, on_close_callback=None):
+        connection = FakeConnection(self, parameters, on_open_callback, on_open_error_callback, on_close_callback)
+        with self._lock:
+            self.connections.append(connection)
+        return connection
+
+    def publish(self, body):
+        """ Add a message to the queue (from any thread) """
+        with self._lock:
+            self.pending.append(body)
+            channel = self.channel
+        if channel is not None:
+            channel.connection.ioloop.add_callback_threadsafe(lambda: self.dispatch(channel))
+
+    def requeue(self, bodies):
+        with self._lock:
+            self.pending[:0] = bodies
+
+    def dispatch(self, channel):
+        """ Deliver pending messages to the consumer of the channel, within its prefetch window (I/O loop thread) """
+        while channel.is_open and channel.on_message_callback is not None:
+            with self._lock:
+                if not self.pending or (channel.prefetch_count and len(channel.unacked) >= channel.prefetch_count):
+                    return
+                body = self.pending.pop(0)
+            channel.deliver(body)
+
+    def drop_connection(self):
+        """ Close the current connection as if the broker went away (from any thread) """
+        connection = self.connections[-1]
+        connection.ioloop.add_callback_threadsafe(lambda: connection.close("Connection reset by the broker"))
@@ -0,0 +1,67 @@
+import re
+import socket
+import threading
+import time
+import unittest
+
+from bottle import Bottle, request
+
+import api_server
+
+
+def send_raw(port, payload):
+    """ Send raw bytes on a single connection and return everything received until it is closed (str) """
+    with socket.create_connection(('127.0.0.1', port)) as sock:
+        sock.sendall(payload)
+        sock.settimeout(2.0)
+        data = b''
+        try:
+            while True:
+                received = sock.recv(65536)
+                if not received:
+                    break
+                data += received
+        except socket.timeout:
+            pass
+    return data.decode()
+
+
+class TestThreadedServer(unittest.TestCase):
+
+    def setUp(self):
+        app = Bottle()
+
+        @app.route('/echo', method='POST')
+        def echo():
+            return "body:" + request.body.read().decode()
+
+        self.server = api_server.ThreadedServer(host='127.0.0.1', port=0)
+        self.server.quiet = True
+        threading.Thread(target=self.server.run, args=(app,), daemon=True).start()
+        deadline = time.monotonic() + 5.0
+        while getattr(self.server, 'srv', None) is None or not self.server.port:
+            if time.monotonic() > deadline:
+                raise AssertionError("Server not started")
+            time.sleep(0.01)
+        time.sleep(0.1)
+
+    def tearDown(self):
+        self.server.shutdown()
+
+    def test_chunked_body_does_not_desynchronize_the_connection(self):
+        responses = send_raw(self.server.port,
+                             b"POST /echo HTTP/1.1\r\nHost: a\r\nTransfer-Encoding: chunked\r\n\r\n"
+                             b"5\r\nhello\r\n0\r\n\r\n"
+                             b"POST /echo HTTP/1.1\r\nHost: a\r\nContent-Length: 2\r\nConnection: close\r\n\r\nok")
+        # The chunked body is either decoded or rejected, but never parsed as a request of its own: the next request
+        # is answered, or the connection is closed after the first response
+        self.assertNotIn('Bad request syntax', responses)
+        statuses = re.findall(r'HTTP/1\.[01] (\d{3})', responses)
+        self.assertIn(len(statuses), [1, 2])
+        if len(statuses) == 2:
+            self.assertEqual(statuses[1], '200')
+            self.assertTrue(responses.endswith('body:ok'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import bz2
+import gzip
+import lzma
+import os
+import shutil
+import tempfile
+import unittest
+
+from replay import compressed_reader
+from replay.compressed_reader import detect_compression, open_obs_file, ReadAheadObsReader
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+LINES = "".join("{} {:.3f}\n".format(1392246000 + i, i / 10.0) for i in range(50)) + "garbage\n"
+ROWS = [((1392246000 + i) * 1000, round(i / 10.0, 3)) for i in range(50)]
+
+
+class TestCompressedReader(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, compress):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as obs_file:
+            obs_file.write(compress(LINES.encode('UTF-8')))
+        return path
+
+    def files(self):
+        """ :returns the (compression, path) of the same observations, plain and compressed """
+        files = [(None, self.write('obs.txt', lambda data: data)),
+                 ('gzip', self.write('obs.txt.gz', gzip.compress)),
+                 ('xz', self.write('obs.txt.xz', lzma.compress)),
+                 ('bzip2', self.write('obs.txt.bz2', bz2.compress))]
+        if zstandard is not None:
+            files.append(('zstd', self.write('obs.txt.zst', zstandard.ZstdCompressor().compress)))
+        return files
+
+    def read_all(self, reader):
+        rows = list()
+        while True:
+            row = reader.next_observation()
+            if row is None:
+                return rows
+            rows.append(row)
+
+    def test_open_obs_file_round_trip(self):
+        for compression, path in self.files():
+            with self.subTest(compression=compression):
+                self.assertEqual(detect_compression(path), compression)
+                with open_obs_file(path) as obs_file:
+                    self.assertEqual(obs_file.read(), LINES)
+
+    def test_compression_is_detected_from_the_magic_bytes(self):
+        path = self.write('obs.txt', gzip.compress)  # misleading extension
+        self.assertEqual(detect_compression(path), 'gzip')
+
+    def test_read_ahead_reader_round_trip(self):
+        for compression, path in self.files():
+            with self.subTest(compression=compression):
+                reader = ReadAheadObsReader(path, chunk_size=7, nb_chunks=2)
+                self.assertEqual(reader.peek_timestamp(), ROWS[0][0])
+                self.assertEqual(self.read_all(reader), ROWS)
+                self.assertEqual(reader.get_stats()['nb_skipped'], 1)
+                reader.close()
+
+    def test_read_ahead_reader_loops(self):
+        for compression, path in self.files():
+            with self.subTest(compression=compression):
+                reader = ReadAheadObsReader(path, loop=True, chunk_size=16, nb_chunks=2)
+                rows = [reader.next_observation() for _ in range(3 * len(ROWS))]
+                reader.close()
+                self.assertEqual(rows, ROWS * 3)
+
+    @unittest.skipIf(zstandard is None, "requires the zstandard package")
+    def test_zstd_without_zstandard(self):
+        path = self.write('obs.txt.zst', zstandard.ZstdCompressor().compress)
+        compressed_reader.zstandard = None
+        try:
+            with self.assertRaises(ImportError):
+                open_obs_file(path)
+        finally:
+            compressed_reader.zstandard = zstandard
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,34 @@
 import json
 
+# Stands for the battery level in the cached renderings, which are only invalidated by the changes of the flags,
+# capabilities or configuration of a sensor: the battery level drains with every observation
+BATTERY_LEVEL_PLACEHOLDER = '__battery_level__'
+
+
+def render_cached(sensor, kind, render):
+    """
+    Return the JSON rendered by render(), reusing the last rendering of the same kind as long as the flags,
+    capabilities and configuration of the sensor have not changed (see VirtualSensor.config_version).
+    The battery level, rendered as BATTERY_LEVEL_PLACEHOLDER, is filled in on every call
+    :param sensor: a VirtualSensor object
+    :param kind: the kind of rendering (str)
+    :param render: a function returning the rendered JSON (str)
+    :rtype str
+    """
+    version = sensor.config_version
+    cached = sensor.rendered_cache.get(kind)
+    if cached is None or cached[0] != version:
+        head, tail = render().split(json.dumps(BATTERY_LEVEL_PLACEHOLDER), 1)
+        cached = (version, head, tail)
+        sensor.rendered_cache[kind] = cached
+    return cached[1] + json.dumps(sensor.capabilities['battery_level']) + cached[2]
+
+
+def _cached_capabilities(sensor):
+    capabilities = sensor.capabilities.snapshot()
+    capabilities['battery_level'] = BATTERY_LEVEL_PLACEHOLDER
+    return capabilities
+
 
 def generate_sensor_representation(response, sensor):
     """
@@ -10,13 +39,16 @@ def generate_sensor_representation(response, sensor):
     :rtype str
     """
     response.set_header('Content-Type', 'application/json; charset=UTF-8')
-    dict_response = dict()
-    dict_response['sensor_id'] = sensor.sensor_id
-    dict_response['enabled'] = sensor.enabled
-    dict_response['sensing'] = sensor.sensing
-    dict_response['capabilities'] = sensor.capabilities
-    dict_response['config'] = sensor.config
-    return json.dumps(dict_response)
+
+    def render():
+        dict_response = dict()
+        dict_response['sensor_id'] = sensor.sensor_id
+        dict_response['enabled'] = sensor.enabled
+        dict_response['sensing'] = sensor.sensing
+        dict_response['capabilities'] = _cached_capabilities(sensor)
+        dict_response['config'] = sensor.config
+        return json.dumps(dict_response)
+    return render_cached(sensor, 'representation', render)
 
 
 def generate_sensor_capabilities(response, sensor):
@@ -28,10 +60,13 @@ def generate_sensor_capabilities(response, sensor):
     :rtype str
     """
     response.set_header('Content-Type', 'application/json; charset=UTF-8')
-    dict_response = dict()
-    dict_response['sensor_id'] = sensor.sensor_id
-    dict_response['capabilities'] = sensor.capabilities
-    return json.dumps(dict_response)
+
+    def render():
+        dict_response = dict()
+        dict_response['sensor_id'] = sensor.sensor_id
+        dict_response['capabilities'] = _cached_capabilities(sensor)
+        return json.dumps(dict_response)
+    return render_cached(sensor, 'capabilities', render)
 
 
 def generate_api_response(response, result, details, capability='', old_value='', value=''):
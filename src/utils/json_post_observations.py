@@ -1,14 +1,57 @@
-import requests
-
-
-def post_obs_to_rest_endpoint(url, dictionary):
+def post_obs_to_rest_endpoint(url, dictionary, session=None, timeout=None):
     """
     Method to POST a dict object (transformed in a JSON payload) to a REST endpoint
     :param url: str
     :param dictionary: the dictionary to send (dict)
+    :param session: an optional requests.Session to reuse pooled keep-alive connections
+    :param timeout: an optional timeout (in seconds) for the request
+    :returns the response of the endpoint
+    :rtype requests.Response
+    """
+    if session is None:
+        import requests  # only loaded by the publishers actually used
+        session = requests
+    return session.post(url=url,
+                        json=dictionary,
+                        timeout=timeout)
+
+
+def post_obs_batch_to_rest_endpoint(url, dictionaries, session=None, timeout=None):
+    """
+    Method to POST several dict objects at once (transformed in a JSON array) to a REST endpoint
+    :param url: str
+    :param dictionaries: the list of dictionaries to send (list)
+    :param session: an optional requests.Session to reuse pooled keep-alive connections
+    :param timeout: an optional timeout (in seconds) for the request
+    :returns the response of the endpoint
+    :rtype requests.Response
+    """
+    if session is None:
+        import requests  # only loaded by the publishers actually used
+        session = requests
+    return session.post(url=url,
+                        json=dictionaries,
+                        timeout=timeout)
+
+
+def post_serialized_obs_to_rest_endpoint(url, data, content_type='application/json', session=None, timeout=None):
+    """
+    Method to POST observations already serialized (see utils/obs_serializer.py) to a REST endpoint
+    :param url: str
+    :param data: the serialized observation(s) (bytes)
+    :param content_type: the Content-Type of the payload (str)
+    :param session: an optional requests.Session to reuse pooled keep-alive connections
+    :param timeout: an optional timeout (in seconds) for the request
+    :returns the response of the endpoint
+    :rtype requests.Response
     """
-    requests.post(url=url,
-                  json=dictionary)
+    if session is None:
+        import requests  # only loaded by the publishers actually used
+        session = requests
+    return session.post(url=url,
+                        data=data,
+                        headers={'Content-Type': content_type},
+                        timeout=timeout)
 
 
 def post_obs_to_kafka_topic(kafka_producer, topic, dictionary):
@@ -0,0 +1,308 @@
+import bisect
+import collections
+import threading
+
+
+def escape_label(value):
+    """ Escape a Prometheus label value """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def merge_prometheus(texts):
+    """
+    Merge the metrics rendered by several processes (see MetricsRegistry.render_prometheus) into one exposition:
+    the lines of each metric family are grouped together and the values of identical series are summed
+    (e.g. the histograms aggregated over all the sensors of each process)
+    :param texts: a list of str in the Prometheus text format
+    :rtype str
+    """
+    families = collections.OrderedDict()  # family name -> (comment lines, OrderedDict of series -> value)
+    for text in texts:
+        family = None
+        for line in text.splitlines():
+            if not line:
+                continue
+            if line.startswith('#'):
+                family = line.split(' ')[2]
+                comments, _ = families.setdefault(family, (list(), collections.OrderedDict()))
+                if line not in comments:
+                    comments.append(line)
+                continue
+            series, value = line.rsplit(' ', 1)
+            _, values = families.setdefault(family, (list(), collections.OrderedDict()))
+            values[series] = values.get(series, 0.0) + float(value)
+
+    lines = list()
+    for comments, values in families.values():
+        lines.extend(comments)
+        for series, value in values.items():
+            lines.append('{} {}'.format(series, int(value) if value.is_integer() else value))
+    return '\n'.join(lines) + '\n'
+
+
+class Histogram(object):
+    """
+    Fixed-bucket histogram (durations in seconds), cheap enough to be updated on every observation.
+    Histograms are not thread-safe: their owner (SensorMetrics or MetricsRegistry) updates them under its lock.
+    """
+
+    BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+    __slots__ = ['counts', 'count', 'sum']
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)  # the last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.sum += other.sum
+
+    def quantile(self, q):
+        """ :returns the upper bound of the bucket containing the q-quantile (None if empty) """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return self.BUCKETS[i] if i < len(self.BUCKETS) else float('inf')
+
+    def to_dict(self):
+        return {'count': self.count,
+                'sum': round(self.sum, 6),
+                'p50': self.quantile(0.5),
+                'p99': self.quantile(0.99)}
+
+    def render(self, name, labels=''):
+        """ :returns the lines of the histogram in the Prometheus text format """
+        lines = list()
+        cumulative = 0
+        separator = ',' if labels else ''
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            bound = repr(self.BUCKETS[i]) if i < len(self.BUCKETS) else '+Inf'
+            lines.append('{}_bucket{{{}{}le="{}"}} {}'.format(name, labels, separator, bound, cumulative))
+        label_set = '{' + labels + '}' if labels else ''
+        lines.append('{}_sum{} {}'.format(name, label_set, self.sum))
+        lines.append('{}_count{} {}'.format(name, label_set, self.count))
+        return lines
+
+
+class SensorMetrics(object):
+    """
+    Counters and histograms of a single sensor. They are updated from several threads (the thread running the
+    sensor, the consumer thread of a push-based adapter, the API handlers flushing edge processing stages and the
+    publisher threads counting deliveries), always through the following methods
+    """
+
+    __slots__ = ['generated', 'published', 'dropped', 'failed', 'battery_drained', 'battery_level',
+                 'generation_time', 'publish_time', '_lock']
+
+    def __init__(self):
+        self.generated = 0  # observations generated
+        self.published = 0  # observations delivered by the publisher (counted once the POST or send is completed)
+        self.dropped = 0  # observations lost before publication (empty battery, dropouts, full publisher buffers)
+        self.failed = 0  # observations whose publication failed
+        self.battery_drained = 0.0
+        self.battery_level = None
+        self.generation_time = Histogram()
+        self.publish_time = Histogram()  # time spent in publisher.publish (enqueue time with buffering publishers)
+        self._lock = threading.Lock()
+
+    def count(self, attribute, nb_obs=1):
+        """ Add nb_obs to the 'generated', 'published', 'dropped' or 'failed' counter """
+        with self._lock:
+            setattr(self, attribute, getattr(self, attribute) + nb_obs)
+
+    def observe_generation(self, duration, generated, dropped):
+        """ Record the generation of an observation (generated and dropped are 0 or 1) """
+        with self._lock:
+            self.generation_time.observe(duration)
+            self.generated += generated
+            self.dropped += dropped
+
+    def observe_publish(self, duration):
+        with self._lock:
+            self.publish_time.observe(duration)
+
+    def drain_battery(self, consumption, battery_level):
+        with self._lock:
+            self.battery_drained += consumption
+            self.battery_level = battery_level
+
+    def copy(self):
+        """ :returns a consistent copy of the metrics, to render them """
+        metrics = SensorMetrics()
+        with self._lock:
+            for attribute in ['generated', 'published', 'dropped', 'failed', 'battery_drained', 'battery_level']:
+                setattr(metrics, attribute, getattr(self, attribute))
+            metrics.generation_time.merge(self.generation_time)
+            metrics.publish_time.merge(self.publish_time)
+        return metrics
+
+    def to_dict(self):
+        metrics = self.copy()
+        return {'generated': metrics.generated,
+                'published': metrics.published,
+                'dropped': metrics.dropped,
+                'failed': metrics.failed,
+                'battery_drained': round(metrics.battery_drained, 6),
+                'battery_level': metrics.battery_level,
+                'generation_time_s': metrics.generation_time.to_dict(),
+                'publish_time_s': metrics.publish_time.to_dict()}
+
+
+class MetricsRegistry(object):
+    """
+    Metrics of all the sensors of the process (see get_shared_registry), exposed by the REST API:
+    -GET /metrics in the Prometheus text format (per-sensor counters, histograms aggregated over all sensors)
+    -GET /<sensor_id>/stats as JSON (per-sensor counters and histograms)
+    Publishers and the scheduler also report their drops, failures, publish latency and scheduling lag.
+    """
+
+    PREFIX = 'virtual_sensor_'
+
+    _shared_registry = None
+    _shared_registry_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sensors = dict()  # sensor_id -> SensorMetrics
+        self.publisher_dropped = dict()  # publisher name -> number of dropped observations
+        self.publisher_failed = dict()  # publisher name -> number of observations not delivered
+        self.publish_latency = Histogram()  # enqueue -> published (ASYNC engine)
+        self.scheduler_lag = Histogram()  # firing time - deadline (SensorScheduler)
+
+    @classmethod
+    def get_shared_registry(cls):
+        with cls._shared_registry_lock:
+            if cls._shared_registry is None:
+                cls._shared_registry = cls()
+            return cls._shared_registry
+
+    def get_sensor_metrics(self, sensor_id):
+        """
+        Return the metrics of the specified sensor, creating them if needed
+        :rtype SensorMetrics
+        """
+        with self._lock:
+            if sensor_id not in self._sensors:
+                self._sensors[sensor_id] = SensorMetrics()
+            return self._sensors[sensor_id]
+
+    def count_sensor(self, sensor_id, attribute, nb_obs=1):
+        """
+        Count observations of a sensor from a publisher, e.g. once delivered ('published'), dropped or failed
+        :param sensor_id: the sensor which produced the observations (ignored if None)
+        """
+        if sensor_id is not None:
+            self.get_sensor_metrics(sensor_id).count(attribute, nb_obs)
+
+    def count_publisher_dropped(self, publisher, nb_obs=1):
+        with self._lock:
+            self.publisher_dropped[publisher] = self.publisher_dropped.get(publisher, 0) + nb_obs
+
+    def count_publisher_failed(self, publisher, nb_obs=1):
+        with self._lock:
+            self.publisher_failed[publisher] = self.publisher_failed.get(publisher, 0) + nb_obs
+
+    def observe_publish_latency(self, latency):
+        with self._lock:
+            self.publish_latency.observe(latency)
+
+    def observe_scheduler_lag(self, lag):
+        with self._lock:
+            self.scheduler_lag.observe(max(0.0, lag))
+
+    def merge_scheduler_lag(self, histogram):
+        """ Add a whole Histogram of scheduling lags at once (FleetScheduler) """
+        with self._lock:
+            self.scheduler_lag.merge(histogram)
+
+    def get_totals(self):
+        """
+        :returns the counters of all the sensors of the process, summed
+        :rtype dict
+        """
+        with self._lock:
+            sensors = [metrics.copy() for metrics in self._sensors.values()]
+            totals = {'nb_sensors': len(sensors),
+                      'publisher_dropped': sum(self.publisher_dropped.values()),
+                      'publisher_failed': sum(self.publisher_failed.values())}
+        for attribute in ['generated', 'published', 'dropped', 'failed']:
+            totals[attribute] = sum(getattr(metrics, attribute) for metrics in sensors)
+        return totals
+
+    def get_sensor_stats(self, sensor_id):
+        """
+        :returns the metrics of the specified sensor as a dict (None if unknown)
+        :rtype dict
+        """
+        with self._lock:
+            metrics = self._sensors.get(sensor_id)
+        return metrics.to_dict() if metrics is not None else None
+
+    def render_prometheus(self):
+        """
+        :returns all the metrics in the Prometheus text exposition format
+        :rtype str
+        """
+        with self._lock:
+            sensors = [(escape_label(sensor_id), metrics.copy()) for sensor_id, metrics in sorted(self._sensors.items())]
+            publisher_dropped = sorted((escape_label(name), count) for name, count in self.publisher_dropped.items())
+            publisher_failed = sorted((escape_label(name), count) for name, count in self.publisher_failed.items())
+            publish_latency = Histogram()
+            publish_latency.merge(self.publish_latency)
+            scheduler_lag = Histogram()
+            scheduler_lag.merge(self.scheduler_lag)
+
+        prefix = self.PREFIX
+        lines = list()
+        for name, attribute, help_text in [
+                ('observations_generated_total', 'generated', 'Observations generated'),
+                ('observations_published_total', 'published', 'Observations delivered by the publisher'),
+                ('observations_dropped_total', 'dropped', 'Observations lost before publication'),
+                ('observations_failed_total', 'failed', 'Observations whose publication failed'),
+                ('battery_drained_total', 'battery_drained', 'Battery consumed by observations')]:
+            lines.append('# HELP {}{} {}'.format(prefix, name, help_text))
+            lines.append('# TYPE {}{} counter'.format(prefix, name))
+            for sensor_id, metrics in sensors:
+                lines.append('{}{}{{sensor_id="{}"}} {}'.format(prefix, name, sensor_id, getattr(metrics, attribute)))
+
+        lines.append('# HELP {}battery_level Current battery level'.format(prefix))
+        lines.append('# TYPE {}battery_level gauge'.format(prefix))
+        for sensor_id, metrics in sensors:
+            if metrics.battery_level is not None:
+                lines.append('{}battery_level{{sensor_id="{}"}} {}'.format(prefix, sensor_id, metrics.battery_level))
+
+        for name, counts, help_text in [('publisher_dropped_total', publisher_dropped, 'Observations dropped by publishers'),
+                                        ('publisher_failed_total', publisher_failed, 'Observations not delivered')]:
+            lines.append('# HELP {}{} {}'.format(prefix, name, help_text))
+            lines.append('# TYPE {}{} counter'.format(prefix, name))
+            for publisher, count in counts:
+                lines.append('{}{}{{publisher="{}"}} {}'.format(prefix, name, publisher, count))
+
+        generation_time = Histogram()
+        publish_time = Histogram()
+        for _, metrics in sensors:
+            generation_time.merge(metrics.generation_time)
+            publish_time.merge(metrics.publish_time)
+        for name, histogram, help_text in [
+                ('generation_seconds', generation_time, 'Time to generate an observation (all sensors)'),
+                ('publish_seconds', publish_time, 'Time spent in publish calls (all sensors)'),
+                ('async_publish_latency_seconds', publish_latency, 'Delay between enqueue and publication (ASYNC)'),
+                ('scheduler_lag_seconds', scheduler_lag, 'Delay between the deadline and the firing of sensors')]:
+            lines.append('# HELP {}{} {}'.format(prefix, name, help_text))
+            lines.append('# TYPE {}{} histogram'.format(prefix, name))
+            lines.extend(histogram.render(prefix + name))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,198 @@
+import json
+import struct
+import threading
+
+
+class ObsSerializer(object):
+    """
+    Fast serialization of observations, which all have the same JSON shape:
+    {"date": "1491464114463", "value": "45.000", "producer": "sensor02", "timestamps": "produced:1491464114463"}
+    Instead of json.dumps, observations are written into a reusable byte buffer (one per thread) from templates
+    pre-rendered for each producer. The other string fields are written as is when they only contain printable ASCII
+    characters which need no JSON escaping, and escaped with json.dumps otherwise.
+    Two formats are available:
+    -JSON (the shape above, one object per observation or one array per batch)
+    -BINARY: a compact format made of the producer (unsigned short length + UTF-8 bytes), the number of
+    observations (unsigned int) and, for each observation, its date, value and production timestamp
+    (little-endian int64, float64 and int64)
+    """
+
+    FIELDS = frozenset(('date', 'value', 'producer', 'timestamps'))
+
+    BINARY_HEADER = struct.Struct('<H')
+    BINARY_COUNT = struct.Struct('<I')
+    BINARY_RECORD = struct.Struct('<qdq')
+
+    def __init__(self):
+        self._templates = dict()  # producer -> pre-rendered byte templates
+        self._local = threading.local()
+
+    def _get_buffer(self):
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = bytearray()
+            self._local.buffer = buffer
+        else:
+            del buffer[:]
+        return buffer
+
+    def _get_template(self, producer):
+        template = self._templates.get(producer)
+        if template is None:
+            middle = '", "producer": {}, "timestamps": "'.format(json.dumps(producer)).encode('utf-8')
+            template = (b'{"date": "', b'", "value": "', middle, b'"}')
+            self._templates[producer] = template
+        return template
+
+    def _write(self, buffer, date, value, producer, timestamps):
+        date_prefix, value_prefix, producer_part, suffix = self._get_template(producer)
+        date = str(date)
+        if not isinstance(value, str):
+            value = '%.3f' % value
+        fields = date + value + timestamps
+        if not (fields.isascii() and fields.isprintable() and '"' not in fields and '\\' not in fields):
+            # Quotes, backslashes, control or non-ASCII characters: escape them (contents of the JSON strings)
+            date, value, timestamps = [json.dumps(field)[1:-1] for field in (date, value, timestamps)]
+        buffer += date_prefix
+        buffer += date.encode('ascii')
+        buffer += value_prefix
+        buffer += value.encode('ascii')
+        buffer += producer_part
+        buffer += timestamps.encode('ascii')
+        buffer += suffix
+
+    def _write_dict(self, buffer, dictionary):
+        """ Write an observation dict with the templates if it has the expected fields, with json.dumps otherwise """
+        if dictionary.keys() == self.FIELDS:
+            start = len(buffer)
+            try:
+                self._write(buffer, dictionary['date'], dictionary['value'], dictionary['producer'],
+                            dictionary['timestamps'])
+                return
+            except (TypeError, AttributeError):
+                del buffer[start:]  # e.g., timestamps which are not a str
+        buffer += json.dumps(dictionary).encode('utf-8')
+
+    def encode(self, date, value, producer, timestamps):
+        """
+        Encode an observation from its fields
+        :param date: the date (str or int, in milliseconds)
+        :param value: the value (str already formatted, or float formatted with 3 decimals)
+        :param producer: str
+        :param timestamps: the timestamps field, e.g. 'produced:1491464114463' (str)
+        :rtype bytes
+        """
+        buffer = self._get_buffer()
+        self._write(buffer, date, value, producer, timestamps)
+        return bytes(buffer)
+
+    def encode_dict(self, dictionary):
+        """
+        Encode an observation dict (as built by ObsGenerator), falling back to json.dumps for other shapes
+        :rtype bytes
+        """
+        buffer = self._get_buffer()
+        self._write_dict(buffer, dictionary)
+        return bytes(buffer)
+
+    def encode_batch(self, dictionaries):
+        """
+        Encode several observation dicts as a JSON array
+        :rtype bytes
+        """
+        buffer = self._get_buffer()
+        buffer += b'['
+        for i, dictionary in enumerate(dictionaries):
+            if i > 0:
+                buffer += b', '
+            self._write_dict(buffer, dictionary)
+        buffer += b']'
+        return bytes(buffer)
+
+    # Compact binary format
+
+    def encode_binary_batch(self, producer, rows):
+        """
+        Encode observations of a single producer in the compact binary format
+        :param producer: str
+        :param rows: an iterable of (date, value, produced) tuples (int, float, int)
+        :rtype bytes
+        """
+        producer_bytes = producer.encode('utf-8')
+        rows = list(rows)
+        buffer = self._get_buffer()
+        buffer += self.BINARY_HEADER.pack(len(producer_bytes))
+        buffer += producer_bytes
+        buffer += self.BINARY_COUNT.pack(len(rows))
+        pack = self.BINARY_RECORD.pack
+        for date, value, produced in rows:
+            buffer += pack(date, value, produced)
+        return bytes(buffer)
+
+    def encode_binary_dict(self, dictionary):
+        """
+        Encode an observation dict in the compact binary format (only the production timestamp is kept)
+        :rtype bytes
+        """
+        produced = dictionary['timestamps'].split(';')[0].split(':')[-1]
+        return self.encode_binary_batch(dictionary['producer'], [(int(dictionary['date']),
+                                                                   float(dictionary['value']),
+                                                                   int(produced))])
+
+    def encode_binary_list(self, dictionaries):
+        """
+        Encode several observation dicts in the compact binary format (one chunk per observation)
+        :rtype bytes
+        """
+        return b''.join([self.encode_binary_dict(dictionary) for dictionary in dictionaries])
+
+    @classmethod
+    def decode_binary(cls, data, offset=0):
+        """
+        Decode a chunk of observations encoded in the compact binary format
+        :param data: bytes
+        :param offset: the offset of the chunk in data
+        :returns the producer, the list of (date, value, produced) tuples and the offset of the next chunk
+        :rtype str, list and int
+        """
+        producer_length, = cls.BINARY_HEADER.unpack_from(data, offset)
+        offset += cls.BINARY_HEADER.size
+        producer = bytes(data[offset:offset + producer_length]).decode('utf-8')
+        offset += producer_length
+        count, = cls.BINARY_COUNT.unpack_from(data, offset)
+        offset += cls.BINARY_COUNT.size
+        rows = [cls.BINARY_RECORD.unpack_from(data, offset + i * cls.BINARY_RECORD.size) for i in range(count)]
+        return producer, rows, offset + count * cls.BINARY_RECORD.size
+
+
+def get_value_serializer(serialization_format):
+    """
+    Return a function serializing one observation dict, according to the 'serialization_format' key of the
+    etc/sensor.config file: JSON (json.dumps), TEMPLATE (pre-rendered JSON templates) or BINARY
+    :rtype function
+    """
+    if serialization_format == 'TEMPLATE':
+        return ObsSerializer().encode_dict
+    elif serialization_format == 'BINARY':
+        return ObsSerializer().encode_binary_dict
+    return lambda v: json.dumps(v).encode('utf-8')
+
+
+def get_batch_serializer(serialization_format):
+    """
+    Return a function serializing a list of observation dicts (JSON array or concatenated binary chunks)
+    :rtype function
+    """
+    if serialization_format == 'TEMPLATE':
+        return ObsSerializer().encode_batch
+    elif serialization_format == 'BINARY':
+        return ObsSerializer().encode_binary_list
+    return lambda v: json.dumps(v).encode('utf-8')
+
+
+def get_content_type(serialization_format):
+    """ :returns the HTTP Content-Type corresponding to the serialization format """
+    if serialization_format == 'BINARY':
+        return 'application/octet-stream'
+    return 'application/json'
+
@@ -2,6 +2,24 @@ import time
 
 
 class TimeUtils(object):
+    MAX_LATENESS = 1.0  # (in seconds) beyond this delay, missed deadlines are skipped
+
     @staticmethod
     def current_milli_time():
         return int(round(time.time() * 1000))
+
+    @staticmethod
+    def next_deadline(previous_deadline, period, now):
+        """
+        Compute a drift-free deadline (next = previous deadline + period)
+        If more than one period (and more than MAX_LATENESS) has been missed, missed ticks are skipped instead of
+        being fired in a burst
+        :param previous_deadline: the previous deadline (float, in seconds)
+        :param period: the period (float, in seconds)
+        :param now: the current time, from the same clock as previous_deadline (float, in seconds)
+        :rtype float
+        """
+        deadline = previous_deadline + period
+        if now - deadline > max(period, TimeUtils.MAX_LATENESS):
+            deadline = now
+        return deadline
@@ -1,12 +1,13 @@
-import json
 import logging
 import threading
+import time
 
-from kafka import KafkaProducer
-from kafka.errors import KafkaTimeoutError
-
+from edge_processing import EdgeProcessingChain
 from obs_generator import ObsGenerator
-from utils.json_post_observations import post_obs_to_rest_endpoint, post_obs_to_kafka_topic
+from publishers.publisher_factory import create_publisher
+from sensor_capabilities import SensorCapabilities
+from utils.metrics import MetricsRegistry
+from utils.time_utils import TimeUtils
 
 logging.basicConfig(level=logging.WARNING)
 
@@ -23,6 +24,8 @@ class VirtualSensor(threading.Thread):
         self.setDaemon(True)
         self._stop_event = threading.Event()  # to stop the main thread
         self.sensor_id = sensor_id
+        self.fleet = None  # FleetState storing the flags of the sensor, if any (see attach_to_fleet)
+        self.fleet_index = None
         self.sensing = True  # TODO
         self.no_more_obs = False
 
@@ -34,85 +37,266 @@ class VirtualSensor(threading.Thread):
         self.mode = None
         self.publish_to = None
         self.capabilities = None
-        self.obs_consumption = None
-        self.infinite_battery = None
-        self.kafka_producer = None
+        self.publisher = None
+        self.owns_publisher = False
+        self.metrics = MetricsRegistry.get_shared_registry().get_sensor_metrics(sensor_id)
+        self.nb_ticks = 0
+        # Incremented on every change of the sensor state (see GET /stream), battery level included
+        self.state_version = 0
+        # Incremented on every change of the flags, capabilities or configuration of the sensor, to invalidate the
+        # cached JSON renderings of the REST API (the battery level is not cached, see utils/json_http_response.py)
+        self.config_version = 0
+        self.rendered_cache = dict()
+        self.log_sampling_interval = 100  # one debug message every log_sampling_interval observations
+        # Edge processing stages between the generator and the publisher, rebuilt when the capability changes
+        self.edge_processing = None
+        self.edge_processing_config = None
+        self.edge_processing_lock = threading.Lock()  # the chain is also flushed from the API handler threads
+        self.stopped = False
+        # Held while the enabled/sensing flags or the capabilities are modified through the API, so that a bulk
+        # change (see sensor_api.py) is checked and applied without single-sensor changes in between
+        self.changes_lock = threading.RLock()
 
     def __del__(self):
-        if self.kafka_producer is not None:
-            self.kafka_producer.close()
+        self.stop()
+
+    def stop(self):
+        """
+        Stop the sensor for good: its main thread ends, the pending observations of its edge processing stages are
+        published and its adapter, observation file and own publisher are closed
+        """
+        if self.stopped:
+            return
+        self.stopped = True
         self._stop_event.set()
+        try:
+            self.flush_edge_processing()
+        except Exception:
+            logging.exception("Unable to publish the pending observations of sensor {}".format(self.sensor_id))
+        if self.obs_generator is not None and self.obs_generator.adapterInstance is not None \
+                and self.obs_generator.adapterInstance.PUSH_BASED:
+            self.obs_generator.adapterInstance.stop_consuming()
+        if self.obs_generator is not None and self.obs_generator.obs_reader is not None:
+            self.obs_generator.obs_reader.close()
+        if self.publisher is not None and self.owns_publisher:
+            self.publisher.close()
 
-    def set_config(self, enabled, config, mode, capabilities):
+    def set_config(self, enabled, config, mode, capabilities, publisher=None, scheduler=None, delay=0.0):
+        """
+        Configure the virtual sensor and start its main thread (or register it to the specified scheduler)
+        :param publisher: an optional publisher shared with other sensors (a dedicated one is created otherwise)
+        :param scheduler: an optional SensorScheduler shared with other sensors (a dedicated thread is used otherwise)
+        :param delay: when using a scheduler, the delay (in seconds) before the first observation
+        """
         self.enabled = enabled
         self.mode = mode
 
         self.config = config
-        # dict of capabilities
+        # dict of capabilities, validated and shared with the REST API handlers (see SensorCapabilities)
         # e.g.: {'infinite_battery': false, 'frequency': 5.0, 'battery_level': 100, 'obs_consumption': 0.01}
-        self.capabilities = capabilities
+        self.capabilities = SensorCapabilities(capabilities)
 
-        self.obs_generator = ObsGenerator(self.config, self.capabilities)
+        self.obs_generator = ObsGenerator(self.config, self.capabilities, sensor_id=self.sensor_id)
         self.mode = self.config['mode']  # KAFKA or REST
         self.publish_to = self.config['publish_to']  # where to send observations
 
-        # how much battery is used when sensing one observation
-        self.obs_consumption = self.capabilities['obs_consumption']
-        # if set to True, all battery considerations are ignored
-        self.infinite_battery = self.capabilities['infinite_battery']
+        self.log_sampling_interval = max(1, int(self.config.get('log_sampling_interval', 100)))
+        self.state_changed()
 
-        # Kafka producer creation
-        if self.mode == "KAFKA":
-            try:
-                self.kafka_producer = KafkaProducer(client_id="virtual-sensor-" + self.sensor_id,
-                                                    acks=0,
-                                                    linger_ms=0,
-                                                    batch_size=0,
-                                                    bootstrap_servers=self.config['kafka_bootstrap_server'],
-                                                    value_serializer=lambda v: json.dumps(v).encode('utf-8'))
-            except KafkaTimeoutError:
-                logging.error("KafkaTimeoutError: Unable to create KafkaProducer.")
-
-        if self.config['obs_generation_mode'] == "ADAPTER" and self.config['adapter_file'] == 'hint_rabbitmq':
-            self.obs_generator.adapterInstance.set_special_async_callback(self.kafka_producer, self.publish_to)
+        # Publisher creation (Kafka producer or REST client)
+        if publisher is None:
+            self.publisher = create_publisher(self.mode, self.config, "virtual-sensor-" + self.sensor_id)
+            self.owns_publisher = True
+        else:
+            self.publisher = publisher
+
+        if self.obs_generator.adapterInstance is not None and self.obs_generator.adapterInstance.PUSH_BASED:
+            self.obs_generator.adapterInstance.start_consuming(self)  # observations are pushed by the adapter
+        elif self.config['obs_generation_mode'] == "ADAPTER" and self.config['adapter_file'] == 'hint_rabbitmq':
+            self.obs_generator.adapterInstance.set_special_async_callback(self.publisher.kafka_producer,
+                                                                          self.publish_to)
             self.obs_generator.adapterInstance.pull_endpoint()
+        elif scheduler is not None:
+            scheduler.add_sensor(self, delay=delay)
         else:
             self.start()  # We start the sensor's main thread
 
-    # TODO: replace this main thread by a Python scheduler?
+    @property
+    def enabled(self):
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, value):
+        self._enabled = value
+        if self.fleet is not None:
+            self.fleet.set_value(self.fleet_index, 'enabled', bool(value))
+
+    @property
+    def sensing(self):
+        return self._sensing
+
+    @sensing.setter
+    def sensing(self, value):
+        self._sensing = value
+        if self.fleet is not None:
+            self.fleet.set_value(self.fleet_index, 'sensing', bool(value))
+
+    def attach_to_fleet(self, fleet, index):
+        """
+        Called by a FleetScheduler: from now on, the battery level and the enabled/sensing flags of the sensor are
+        also stored in (and the battery drained by) the specified row of a FleetState
+        :param fleet: a FleetState object
+        :param index: the row of the sensor (int)
+        """
+        self.capabilities.bind(fleet, index)
+        self.fleet = fleet
+        self.fleet_index = index
+        self.enabled = self.enabled
+        self.sensing = self.sensing
+
+    @property
+    def obs_consumption(self):
+        """ How much battery is used when sensing one observation """
+        return self.capabilities['obs_consumption']
+
+    @property
+    def infinite_battery(self):
+        """ If set to True, all battery considerations are ignored """
+        return self.capabilities['infinite_battery']
+
     def run(self):
         """
         Sensor's main thread. We should never stop this thread, except when destroying the sensor object
+        Deadlines are absolute (next = previous deadline + frequency) so that the sensing period does not drift
         """
-        # TODO load observations from 1) file or 2) generate according input
+        deadline = time.monotonic()
         while not self._stop_event.isSet():
-            if self.sensing:
-                logging.warning("In sensor {} thread (freq={}s)".format(self.sensor_id, self.capabilities['frequency']))
-                obs_dict = self.obs_generator.generate_one_observation(sensor_id=self.sensor_id)
-                if obs_dict is not None:
-                    if (not self.infinite_battery and float(
-                                self.capabilities['battery_level'] - self.obs_consumption) > 0.0) \
-                            or self.infinite_battery:
-                        self.capabilities['battery_level'] -= self.obs_consumption
-
-                        if self.mode == "KAFKA":
-                            post_obs_to_kafka_topic(kafka_producer=self.kafka_producer,
-                                                    topic=self.publish_to,
-                                                    dictionary=obs_dict)
-                        elif self.mode == "REST":
-                            try:
-                                post_obs_to_rest_endpoint(url=self.publish_to, dictionary=obs_dict)
-                            except ConnectionRefusedError:
-                                logging.error("ConnectionRefusedError: [Errno 61] Connection refused.")
-                    if self.config['obs_generation_mode'] != "ADAPTER" or (self.config['obs_generation_mode'] == "ADAPTER" and self.config['adapter_file'] != 'hint_rabbitmq'):
-                        self._stop_event.wait(self.capabilities['frequency'])  # We pause based on sensor's frequency
-                else:
-                    if self.config['obs_generation_mode'] != "ADAPTER":
-                        self.sensing = False
-                        self.no_more_obs = True
-                        self._stop_event.set()
-                    else:
-                        self._stop_event.wait(self.capabilities['frequency'])  # We pause based on sensor's frequency
+            if not self.sense_once():
+                self._stop_event.set()
+            else:
+                deadline = TimeUtils.next_deadline(deadline, self.next_interval(), time.monotonic())
+                self._stop_event.wait(max(0.0, deadline - time.monotonic()))  # We pause based on sensor's frequency
+
+    def next_interval(self):
+        """
+        :returns the delay (in seconds) between the last observation and the next one, i.e. the sensor frequency
+        or the scaled original inter-arrival time when replaying a file with 'replay_pacing': 'ORIGINAL'
+        :rtype float
+        """
+        if self.obs_generator is None:
+            return self.capabilities['frequency']
+        return self.obs_generator.next_interval(self.capabilities['frequency'])
+
+    def sense_once(self):
+        """
+        Acquire and publish a single observation (called by the sensor's main thread or by a SensorScheduler)
+        :returns False if the sensor will not produce any more observation, True otherwise
+        :rtype bool
+        """
+        if self.sensing:
+            obs_dict = self.acquire_observation()
+            if obs_dict is not None:
+                self.publish_observation(obs_dict, self.capabilities.drain())
+            elif self.no_more_obs:
+                return False
+        return True
+
+    def acquire_observation(self):
+        """
+        Generate the next observation of the sensor, without consuming battery (see publish_observation)
+        When there is no more observation to generate, the sensor stops sensing and no_more_obs is set
+        :returns the observation (dict) or None
+        :rtype dict
+        """
+        self.nb_ticks += 1
+        if self.nb_ticks % self.log_sampling_interval == 1 and logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("In sensor {} thread (freq={}s, {} observations)".format(
+                self.sensor_id, self.capabilities['frequency'], self.nb_ticks))
+        start = time.perf_counter()
+        obs_dict = self.obs_generator.generate_one_observation(sensor_id=self.sensor_id)
+        dropped = obs_dict is None and self.obs_generator.last_obs_dropped
+        self.metrics.observe_generation(time.perf_counter() - start, obs_dict is not None, dropped)
+        if obs_dict is None and not dropped and self.config['obs_generation_mode'] != "ADAPTER":
+            self.sensing = False
+            self.state_changed()
+            self.no_more_obs = True
+            self.flush_edge_processing()
+        return obs_dict
+
+    def _get_edge_processing(self):
+        """ :returns the EdgeProcessingChain of the 'edge_processing' capability, or None to publish everything """
+        edge_processing_config = self.capabilities.extra.get('edge_processing')
+        if edge_processing_config is not self.edge_processing_config:
+            self.edge_processing_config = edge_processing_config
+            self.edge_processing = None if edge_processing_config is None \
+                else EdgeProcessingChain(edge_processing_config)
+        return self.edge_processing
+
+    def publish_observation(self, obs_dict, battery_level):
+        """
+        Publish an observation generated by acquire_observation
+        :param obs_dict: the observation (dict)
+        :param battery_level: the battery level once the observation has been sensed, or None if the battery was too
+        low to sense it (the observation is then dropped), see SensorCapabilities.drain and FleetState.drain
+        """
+        if battery_level is None:
+            self.metrics.count('dropped')  # empty battery
+            return
+        self.state_version += 1
+        self.metrics.drain_battery(self.obs_consumption, battery_level)
+
+        edge_processing = self._get_edge_processing()
+        if edge_processing is None:
+            self._publish(obs_dict)
+        else:
+            with self.edge_processing_lock:
+                observations = edge_processing.process(obs_dict)
+            for observation in observations:
+                self._publish(observation)
+
+    def flush_edge_processing(self):
+        """
+        Publish the pending observations of the edge processing stages (e.g., the last incomplete window), called
+        when the sensor stops sensing, is disabled or stopped
+        """
+        if self.edge_processing is None:
+            return
+        with self.edge_processing_lock:
+            observations = self.edge_processing.flush()
+        for observation in observations:
+            self._publish(observation)
+
+    def push_observation(self, obs_dict):
+        """
+        Publish an observation received by a push-based adapter (see adapters/hint_rabbitmq_async.py) like a sensed
+        one: only if the sensor is enabled and sensing, draining its battery, through its edge processing stages and
+        counted by its metrics
+        :param obs_dict: the observation (dict)
+        :returns True if the observation has been handed over to the publishing path, False if it has been dropped
+        :rtype bool
+        """
+        if not (self.enabled and self.sensing):
+            self.metrics.count('dropped')
+            return False
+        self.metrics.count('generated')
+        self.publish_observation(obs_dict, self.capabilities.drain())
+        return True
+
+    def _publish(self, obs_dict):
+        """ Hand an observation over to the publisher, which counts it as published once delivered """
+        if self.publisher is not None:
+            start = time.perf_counter()
+            try:
+                self.publisher.publish(self.publish_to, obs_dict, sensor_id=self.sensor_id)
+            except Exception:
+                self.metrics.count('failed')
+                raise
+            self.metrics.observe_publish(time.perf_counter() - start)
+
+    def state_changed(self):
+        """ To call when the flags, capabilities or configuration of the sensor change """
+        self.config_version += 1
+        self.state_version += 1
 
     # The following methods represent the API of the virtual sensor
     # Sensor state (connection and observations measurement)
@@ -122,12 +306,15 @@ class VirtualSensor(threading.Thread):
         Method to activate/deactivate a sensor, i.e. connect or disconnect it to the network
         :param value: bool (True/False)
         """
-        if value:
-            if self.infinite_battery or self.capabilities['battery_level'] > 0.0:
-                self.enabled = True
-        else:
-            self.enabled = False
-            self.enable_sensing_process(False)
+        with self.changes_lock:
+            if value:
+                if self.infinite_battery or self.capabilities['battery_level'] > 0.0:
+                    self.enabled = True
+                    self.state_changed()
+            else:
+                self.enabled = False
+                self.state_changed()
+                self.enable_sensing_process(False)
 
     def enable_sensing_process(self, value):
         """
@@ -136,34 +323,40 @@ class VirtualSensor(threading.Thread):
         :returns: result ("OK"/"NOK") + details (message error if any)
         :rtype boolean and str
         """
-        if value:
-            if 'frequency' in self.capabilities.keys() and self.capabilities['frequency'] > 0.0:
-                if self.no_more_obs:
-                    error_message = "Unable to retrieve more observations for sensor {}.".format(self.sensor_id)
-                    logging.error(error_message)
-                    return "NOK", error_message
-                elif not self.enabled:
-                    error_message = "Unable to start the observation acquisition process for sensor {}. " \
-                                    "The sensor is disabled.".format(self.sensor_id)
-                    logging.error(error_message)
-                    return "NOK", error_message
-                elif self.sensing:
-                    error_message = "Sensor {} is already sensing. " \
-                                    "Check its connectivity with the server if you do not " \
-                                    "receive any observation.".format(self.sensor_id)
+        with self.changes_lock:
+            if value:
+                if 'frequency' in self.capabilities.keys() and self.capabilities['frequency'] > 0.0:
+                    if self.no_more_obs:
+                        error_message = "Unable to retrieve more observations for sensor {}.".format(self.sensor_id)
+                        logging.error(error_message)
+                        return "NOK", error_message
+                    elif not self.enabled:
+                        error_message = "Unable to start the observation acquisition process for sensor {}. " \
+                                        "The sensor is disabled.".format(self.sensor_id)
+                        logging.error(error_message)
+                        return "NOK", error_message
+                    elif self.sensing:
+                        error_message = "Sensor {} is already sensing. " \
+                                        "Check its connectivity with the server if you do not " \
+                                        "receive any observation.".format(self.sensor_id)
+                        logging.error(error_message)
+                        return "NOK", error_message
+                    else:
+                        self.sensing = True
+                        self.state_changed()
+                        return "OK", ""
+                else:
+                    error_message = "Unable to retrieve 'frequency' capability for sensor {}. " \
+                                    "The acquisition process has not been started.".format(self.sensor_id)
                     logging.error(error_message)
                     return "NOK", error_message
-                else:
-                    self.sensing = True
-                    return "OK", ""
             else:
-                error_message = "Unable to retrieve 'frequency' capability for sensor {}. " \
-                                "The acquisition process has not been started.".format(self.sensor_id)
-                logging.error(error_message)
-                return "NOK", error_message
-        else:
-            self.sensing = False
-            return "OK", ""
+                was_sensing = self.sensing
+                self.sensing = False
+                self.state_changed()
+                if was_sensing:
+                    self.flush_edge_processing()
+                return "OK", ""
 
     # Sensor capabilities
 
@@ -189,13 +382,91 @@ class VirtualSensor(threading.Thread):
         :returns: result ("OK"/"NOK") + details (message error if any)
         :rtype bool and str
         """
-        if capability in self.capabilities.keys():
-            self.capabilities[capability] = value
-            return "OK", ""
-        else:
-            error_message = "Unknown parameter '{}' for sensor {}".format(capability, self.sensor_id)
-            logging.error(error_message)
-            return "NOK", error_message
+        with self.changes_lock:
+            if capability in self.capabilities.keys():
+                try:
+                    self.capabilities[capability] = value
+                except ValueError as e:
+                    error_message = "{} (sensor {})".format(e, self.sensor_id)
+                    logging.error(error_message)
+                    return "NOK", error_message
+                self.state_changed()
+                return "OK", ""
+            else:
+                error_message = "Unknown parameter '{}' for sensor {}".format(capability, self.sensor_id)
+                logging.error(error_message)
+                return "NOK", error_message
+
+    def check_changes(self, changes):
+        """
+        Method to check a set of changes before applying it with apply_changes (nothing is modified)
+        Hold changes_lock until the changes are applied, so that they are still valid then
+        :param changes: a dict of new values for 'enabled', 'sensing' and/or capabilities, e.g. {'frequency': 5}
+        :returns the list of the reasons why the changes cannot be applied (empty if they can)
+        :rtype list
+        """
+        errors = list()
+        for key, value in changes.items():
+            if key in ['enabled', 'sensing']:
+                if type(value) != bool:
+                    errors.append("Only booleans are accepted for '{}' (sensor {})".format(key, self.sensor_id))
+            elif key not in self.capabilities.keys():
+                errors.append("Unknown parameter '{}' for sensor {}".format(key, self.sensor_id))
+        if errors:
+            return errors
+        capability_changes = {key: value for key, value in changes.items() if key not in ['enabled', 'sensing']}
+        errors = ["{} (sensor {})".format(error, self.sensor_id)
+                  for error in self.capabilities.check_update(capability_changes)]
+        if errors:
+            return errors
+
+        # State of the sensor once the changes are applied
+        battery_level = changes.get('battery_level', self.capabilities.get('battery_level', 0.0))
+        enabled = changes.get('enabled', self.enabled)
+        if changes.get('enabled') is True and not self.infinite_battery and battery_level <= 0.0:
+            errors.append("Sensor {} cannot be enabled, its battery is empty".format(self.sensor_id))
+        if changes.get('sensing') is True and not enabled:
+            # Also when the sensor is already sensing, as disabling it would stop the acquisition process
+            errors.append("Unable to start the observation acquisition process for sensor {}. "
+                          "The sensor is disabled.".format(self.sensor_id))
+        elif changes.get('sensing') is True and not self.sensing:
+            frequency = changes.get('frequency', self.capabilities.get('frequency'))
+            if self.no_more_obs:
+                errors.append("Unable to retrieve more observations for sensor {}.".format(self.sensor_id))
+            elif type(frequency) not in [int, float] or frequency <= 0.0:
+                errors.append("Unable to retrieve 'frequency' capability for sensor {}. "
+                              "The acquisition process has not been started.".format(self.sensor_id))
+        return errors
+
+    def apply_changes(self, changes):
+        """
+        Method to apply a set of changes checked with check_changes: capabilities first, then 'enabled' and 'sensing'
+        :param changes: a dict of new values for 'enabled', 'sensing' and/or capabilities
+        :returns the previous values of the modified keys
+        :rtype dict
+        """
+        old_values = self.capabilities.update({key: value for key, value in changes.items()
+                                               if key not in ['enabled', 'sensing']})
+        if old_values:
+            self.state_changed()
+        if 'enabled' in changes:
+            old_values['enabled'] = self.enabled
+            self.enable_sensor(changes['enabled'])
+        if 'sensing' in changes:
+            old_values['sensing'] = self.sensing
+            if changes['sensing'] != self.sensing:
+                self.enable_sensing_process(changes['sensing'])
+        return old_values
+
+    def get_state(self):
+        """
+        :returns the state of the sensor (enabled, sensing and capabilities), e.g. for the state stream of the REST API
+        :rtype dict
+        """
+        return {'sensor_id': self.sensor_id,
+                'enabled': self.enabled,
+                'sensing': self.sensing,
+                'capabilities': self.capabilities.snapshot()}
 
     def set_url_to_publish(self, new_url):
         # TODO check well formed URL
@@ -206,10 +477,71 @@ class VirtualSensor(threading.Thread):
         """
         if True:
             self.publish_to = new_url
+            self.state_changed()
             return "OK", ""
 
+    def get_publishing_stats(self):
+        """
+        Method to get the statistics of the publisher used by the sensor (queue depth, drops, publish latency...)
+        :returns result ("OK"/"NOK") + details (message error if any) + statistics
+        :rtype str, str and dict
+        """
+        if self.publisher is None:
+            error_message = "No publisher has been configured for sensor {}".format(self.sensor_id)
+            logging.error(error_message)
+            return "NOK", error_message, dict()
+        stats = self.publisher.get_stats(self.sensor_id)
+        adapter = self.obs_generator.adapterInstance if self.obs_generator is not None else None
+        if adapter is not None and adapter.PUSH_BASED:
+            stats = dict(stats, adapter=adapter.get_stats())
+        return "OK", "", stats
+
+    def get_stats(self):
+        """
+        Method to get the metrics of the sensor (observations generated, published, dropped and failed, generation
+        and publish times, battery drain, observations in and out of the edge processing stages)
+        :returns result ("OK"/"NOK") + details (message error if any) + metrics
+        :rtype str, str and dict
+        """
+        stats = self.metrics.to_dict()
+        if self.edge_processing is not None:
+            stats['edge_processing'] = self.edge_processing.get_stats()
+        return "OK", "", stats
+
+    def get_replay_state(self):
+        """
+        Method to get the state of the replay of the observation file (MMAP replay engine only)
+        :returns result ("OK"/"NOK") + details (message error if any) + replay state
+        :rtype str, str and dict
+        """
+        state = self.obs_generator.get_replay_position() if self.obs_generator is not None else None
+        if state is None:
+            error_message = "Sensor {} does not replay an observation file with the MMAP engine".format(self.sensor_id)
+            logging.error(error_message)
+            return "NOK", error_message, dict()
+        return "OK", "", state
+
+    def seek_replay(self, line=None, timestamp=None):
+        """
+        Method to move the replay of the observation file to a given line or original timestamp
+        :param line: the line number, starting from 1 (int)
+        :param timestamp: the original timestamp, in milliseconds (int)
+        :returns result ("OK"/"NOK") + details (message error if any)
+        :rtype str and str
+        """
+        if self.no_more_obs:
+            error_message = "Sensor {} has already replayed all its observations.".format(self.sensor_id)
+            logging.error(error_message)
+            return "NOK", error_message
+        result, details = self.obs_generator.seek_replay(line=line, timestamp=timestamp)
+        if result == "NOK":
+            logging.error(details)
+        return result, details
+
     def recharge_battery(self):
-        self.capabilities['battery_level'] = 100.0
+        with self.changes_lock:
+            self.capabilities['battery_level'] = 100.0
+            self.state_changed()
 
     # Events to randomly affect sensor or sensor measurement process
     # Useful to introduce biased data or simulate sensor failures